@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from sys import exit, stdout
+
+from time import time
+
+from shlex import split as shell_split
+
+from StringIO import StringIO
+
+from traceback import format_exc
+
+from itertools import imap
+
+from optparse import OptionParser
+
+from multiprocessing import Pool, cpu_count
+
+from bbb_error import bbb_error
+
+from bbb_postprocess import parse_postprocess_args, postprocess_args
+
+op = OptionParser(
+    # Usage:  
+    usage=("%prog [options] manifest\n"
+           "\n"
+           "Runs the post-processing jobs listed in manifest. Each line of the "
+           "manifest is one job: the options and arguments of "
+           "postprocess_bbb.py, quoted as in a shell. Blank lines and anything "
+           "after a '#' are ignored. Exits with 1 if any job fails.")
+)
+
+op.add_option(
+    "-p", "--processes",
+    help=("Run N jobs at once, in a process pool (default: the number of "
+          "CPUs). Jobs cannot use --jobs if N is greater than 1."),
+    action="store", type="int", dest="processes", default=cpu_count(),
+    metavar="N"
+)
+
+op.add_option(
+    "-q", "--quiet",
+    help="Only print the output of the jobs that fail.",
+    action="store_true", dest="quiet", default=False
+)
+
+(options, args) = op.parse_args()
+
+if len(args) != 1:
+    op.print_help()
+    exit(1)
+
+if options.processes < 1:
+    print "ERROR: The number of processes (-p) must be at least 1."
+    exit(1)
+
+manifest = args[0]
+
+###############################################################################
+# Read the manifest
+
+# Each job is (line number, line, arguments). The arguments of every job are
+# checked before any job is run.
+jobs = []
+
+try:
+    manifest_file = open(manifest, 'r')
+except IOError as e:
+    print "ERROR: Cannot read manifest '"+manifest+"': "+e.strerror+"."
+    exit(1)
+
+for (number, line) in enumerate(manifest_file, 1):
+    try:
+        argv = shell_split(line, comments=True)
+
+        if 0 == len(argv):
+            continue
+
+        (job_options, job_args) = parse_postprocess_args(argv)
+    except (ValueError, bbb_error) as e:
+        print "ERROR: Line "+str(number)+" of manifest '"+manifest+"': "+\
+              str(e)+"."
+        exit(1)
+
+    if 1 < options.processes and 1 < job_options.jobs:
+        print "ERROR: Line "+str(number)+" of manifest '"+manifest+"': "+\
+              "Jobs cannot use --jobs (-j) when several jobs run at once "+\
+              "(-p)."
+        exit(1)
+
+    jobs.append((number, line.strip(), argv))
+
+manifest_file.close()
+
+###############################################################################
+# Run the jobs
+
+# Runs the job with the given index, and returns (index, succeeded, seconds,
+# output), where output is what postprocess_bbb.py would have printed.
+def run_job(index):
+    (number, line, argv) = jobs[index]
+
+    log = StringIO()
+
+    begin = time()
+
+    try:
+        (job_options, job_args) = parse_postprocess_args(argv)
+        postprocess_args(job_options, job_args, log)
+        succeeded = True
+    except bbb_error as e:
+        print >> log, "ERROR: " + str(e)
+        succeeded = False
+    except Exception:
+        print >> log, format_exc(),
+        succeeded = False
+
+    return (index, succeeded, time() - begin, log.getvalue())
+
+begin = time()
+
+pool = None
+
+if 1 < options.processes and 1 < len(jobs):
+    # The workers are forked from here, after everything has been imported
+    # and the manifest has been read.
+    pool = Pool(min(options.processes, len(jobs)))
+    results = pool.imap_unordered(run_job, range(len(jobs)))
+else:
+    results = imap(run_job, range(len(jobs)))
+
+failed = 0
+
+width = len(str(len(jobs)))
+
+# Report each job as it finishes.
+for (done, (index, succeeded, seconds, output)) in enumerate(results, 1):
+    (number, line, argv) = jobs[index]
+
+    if succeeded:
+        status = "OK"
+    else:
+        status = "FAILED"
+        failed = failed + 1
+
+    print "[%*i/%i] %-6s %8.2f s  line %i: %s" \
+        % (width, done, len(jobs), status, seconds, number, line)
+
+    if not succeeded or not options.quiet:
+        for message in output.splitlines():
+            print "    " + message
+
+    stdout.flush()
+
+if pool is not None:
+    pool.close()
+    pool.join()
+
+print "%i of %i jobs failed, %.2f s." % (failed, len(jobs), time() - begin)
+
+if 0 != failed:
+    exit(1)
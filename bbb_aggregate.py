@@ -0,0 +1,639 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+import numpy as np
+
+from array import array
+
+from operator import and_
+
+from itertools import compress, imap
+
+from statistics import stats_batch, percentiles_batch,                 \
+                       median_interval_batch, robust_batch, reject_outliers, \
+                       bootstrap_batch, running_stats, packed_groups
+
+from bbb_error import bbb_error
+
+from bbb_legend import CTL, IND, DEP, try_int_or_float
+
+from bbb_decoder import row_decoder, column, INT64_MAX
+
+from bbb_record_parser import parse_record
+
+from bbb_profile import NULL_PROFILER
+
+# Returns a new container for the samples of a dependent variable: an array of
+# doubles, which takes 8 bytes per sample instead of the 32 of a list of
+# floats, or a running_stats accumulator when streaming.
+def new_samples(v, streaming):
+    if streaming:
+        samples = running_stats()
+    else:
+        samples = array('d')
+
+    samples.append(v)
+
+    return samples
+
+def merge_samples(samples, other):
+    if isinstance(samples, running_stats):
+        samples.merge(other)
+    else:
+        samples.extend(other)
+
+# Returns the samples in a sequence of arrays of doubles, one after another, as
+# a NumPy array.
+def concatenate_samples(samples):
+    flat = array('d')
+
+    for s in samples:
+        flat.extend(s)
+
+    if 0 == len(flat):
+        return np.empty(0, np.float64)
+
+    return np.frombuffer(flat, np.float64)
+
+# The statistics of each DEP in the output data, (tag suffix, description).
+STAT_COLUMNS = [
+    ("AVG", "Average of {samples:d} Samples"),
+    ("STD", "Sample Standard Deviation"),
+    ("CON", "95% Confidence Interval")
+]
+
+# The statistics added by percentiles, e.g. P50 and P99_9 for the 50th and
+# 99.9th percentiles, and the confidence interval of the median.
+def percentile_columns(percentiles):
+    columns = [("P" + ("%g" % p).replace(".", "_"), "Percentile %g" % p)
+               for p in percentiles]
+
+    columns.extend([
+        ("MLO", "95% Confidence Interval of the Median Lower Bound "
+                "(Order Statistics)"),
+        ("MHI", "95% Confidence Interval of the Median Upper Bound "
+                "(Order Statistics)")
+    ])
+
+    return columns
+
+# The statistics added by robust statistics, for a fraction trim of trimmed
+# values.
+def robust_columns(trim):
+    return [
+        ("MAD", "Median Absolute Deviation"),
+        ("TRM", "%g%% Trimmed Mean" % (100 * trim)),
+        ("WIN", "%g%% Winsorized Mean" % (100 * trim)),
+        ("IQR", "Interquartile Range")
+    ]
+
+# The statistics changed and added by outlier rejection, by method.
+REJECT_COLUMNS = {
+    "mad": [
+        ("AVG", "Average of up to {samples:d} Samples Less Outliers (MAD)"),
+        ("NUM", "Number of Samples Less Outliers (MAD)")
+    ],
+    "iqr": [
+        ("AVG", "Average of up to {samples:d} Samples Less Outliers (IQR)"),
+        ("NUM", "Number of Samples Less Outliers (IQR)")
+    ]
+}
+
+# The statistics added by bootstrap confidence intervals, by method.
+BOOTSTRAP_COLUMNS = {
+    "percentile": [
+        ("BLO", "95% Bootstrap Confidence Interval Lower Bound (Percentile)"),
+        ("BHI", "95% Bootstrap Confidence Interval Upper Bound (Percentile)")
+    ],
+    "bca": [
+        ("BLO", "95% Bootstrap Confidence Interval Lower Bound (BCa)"),
+        ("BHI", "95% Bootstrap Confidence Interval Upper Bound (BCa)")
+    ]
+}
+
+###############################################################################
+
+# Groups the records of .bbb files which share a legend, and computes the
+# statistics of each group.
+#
+# Records are grouped record by record into a master dictionary, which maps
+# the CTL key of each dataset to a dictionary that maps the CTL and IND key of
+# each group to a tuple of the samples of each DEP (an array of doubles, or a
+# running_stats accumulator when streaming) in legend order. For columnar
+# ingestion, the cells of each variable are kept instead, and grouped in bulk
+# once every record has been read.
+#
+# Parts of the records can be grouped separately into partial states (see
+# parse_chunk()), which are then merged in order.
+class aggregator:
+    legend = None
+    inclusive_filters = None
+    exclusive_filters = None
+    streaming = False
+    columnar = False
+    bootstrap = None # Bootstrap method, see statistics.bootstrap_batch()
+    resamples = 1000 # Number of bootstrap resamples
+    seed = 0         # Seed of the bootstrap resamples
+    percentiles = None # Percentiles to add, between 0 and 100
+    robust = False   # Add robust statistics
+    trim = 0.1       # Fraction of the values trimmed from each end
+    reject = None    # Outlier rejection method, see reject_outliers()
+    reject_threshold = None # Threshold of outlier rejection, or the default
+
+    stat_columns = None # Statistics of each DEP, see STAT_COLUMNS
+
+    cvars  = None # CTLs
+    civars = None # CTLs and INDs
+    dvars  = None # DEPs
+
+    decode_row = None
+
+    profiler = NULL_PROFILER # Measures the phases, see bbb_profile
+
+    master = None  # Master dictionary
+    cells = None   # Cells of each variable, for columnar ingestion
+    columns = None # Columns, for columnar ingestion
+
+    # Set by group().
+    sorted_master = None # Master dictionary, sorted
+    selected = None      # Records that pass the filters, for columnar ingestion
+    order = None         # Order of the selected records, grouped
+    group_sizes = None   # Number of records in each group
+
+    def __init__(self, legend, inclusive_filters=(), exclusive_filters=(),
+                 streaming=False, columnar=False, bootstrap=None,
+                 resamples=1000, seed=0, robust=False, trim=0.1, reject=None,
+                 reject_threshold=None, percentiles=None):
+        self.legend = legend
+        self.inclusive_filters = list(inclusive_filters)
+        self.exclusive_filters = list(exclusive_filters)
+        self.streaming = streaming
+        self.columnar = columnar
+        self.bootstrap = bootstrap
+        self.resamples = resamples
+        self.seed = seed
+        self.robust = robust
+        self.trim = trim
+        self.reject = reject
+        self.reject_threshold = reject_threshold
+        self.percentiles = percentiles
+
+        # Bootstrapping, robust statistics and outlier rejection need every
+        # sample.
+        assert not streaming or (bootstrap is None and not robust and
+                                 reject is None and percentiles is None)
+
+        self.stat_columns = list(STAT_COLUMNS)
+
+        # Outliers are rejected before any statistics are computed.
+        if reject is not None:
+            self.stat_columns[0] = REJECT_COLUMNS[reject][0]
+            self.stat_columns.extend(REJECT_COLUMNS[reject][1:])
+
+        if percentiles is not None:
+            self.stat_columns.extend(percentile_columns(percentiles))
+
+        if robust:
+            self.stat_columns.extend(robust_columns(trim))
+
+        if bootstrap is not None:
+            self.stat_columns.extend(BOOTSTRAP_COLUMNS[bootstrap])
+
+        self.cvars  = legend.indices([CTL])
+        self.civars = legend.indices([CTL, IND])
+        self.dvars  = legend.indices([DEP])
+
+        self.decode_row = row_decoder(legend, self.inclusive_filters,
+                                      self.exclusive_filters)
+
+        self.master = {}
+
+        if columnar:
+            self.cells = [[] for x in range(len(legend))]
+
+    ###########################################################################
+    # Apply filters and group records
+
+    # Returns the samples of each DEP of a new group, whose first record has
+    # the DEP values deps. The CTL and IND values are only kept in the key of
+    # the group.
+    def new_group(self, deps):
+        streaming = self.streaming
+        return tuple(new_samples(v, streaming) for v in deps)
+
+    # Returns a new partial state: a master dictionary for a part of the
+    # records, or, for columnar ingestion, the cells of each variable.
+    def new_partial(self):
+        if self.columnar:
+            return [[] for x in range(len(self.legend))]
+        else:
+            return {}
+
+    # Groups records (lists of cells) into partial.
+    def group_records(self, partial, records):
+        profiler = self.profiler
+
+        if self.columnar:
+            with profiler.phase("collect cells"):
+                for (c, x) in zip(partial, zip(*records)):
+                    c.extend(x)
+            return
+
+        # Decoding also applies the filters. When profiling, the records are
+        # decoded in a pass of their own, so that it is measured apart from
+        # grouping. Otherwise they are decoded as they are grouped, as holding
+        # on to every decoded record of the chunk makes the garbage collector
+        # run much more often.
+        decoded = imap(self.decode_row, records)
+
+        if profiler is not NULL_PROFILER:
+            with profiler.phase("filter"):
+                decoded = list(decoded)
+
+        deps = ()
+
+        with profiler.phase("group"):
+            try:
+                for d in decoded:
+                    if d is None:
+                        continue
+
+                    (ctl_key, civ_key, deps) = d
+
+                    dataset = partial.get(ctl_key)
+
+                    if dataset is None:
+                        dataset = partial[ctl_key] = {}
+
+                    samples = dataset.get(civ_key)
+
+                    if samples is None:
+                        dataset[civ_key] = self.new_group(deps)
+                    else:
+                        for (s, v) in zip(samples, deps):
+                            s.append(v)
+            except TypeError:
+                # The decoder leaves DEP cells that are not numbers as text.
+                for (i, v) in zip(self.dvars.indices, deps):
+                    if isinstance(v, str):
+                        raise bbb_error("Dependent variable '"+\
+                                        self.legend[i].tag+"' has "+\
+                                        "non-numeric values.")
+                raise
+
+    # Merges the partial state of later records into the master dictionary (or
+    # the cells). Groups that are already in the master dictionary keep the key
+    # and the values of the record that created them.
+    def merge(self, partial):
+        if self.columnar:
+            for (c, x) in zip(self.cells, partial):
+                c.extend(x)
+            return
+
+        for (ctl_key, partial_dataset) in partial.iteritems():
+            dataset = self.master.get(ctl_key)
+
+            if dataset is None:
+                self.master[ctl_key] = partial_dataset
+                continue
+
+            for (civ_key, partial_samples) in partial_dataset.iteritems():
+                samples = dataset.get(civ_key)
+
+                if samples is None:
+                    dataset[civ_key] = partial_samples
+                else:
+                    for (s, other) in zip(samples, partial_samples):
+                        merge_samples(s, other)
+
+    # Returns (partial state, messages, comments, error) for a chunk of whole
+    # lines of data. The records are grouped into partial, or into a new
+    # partial state if it is None. If error is not None, the chunk was not
+    # parsed to the end, because of error.
+    #
+    # Chunks are tokenized all at once. Chunks with comments, or rows that do
+    # not have one cell per variable, are parsed line by line, so that errors
+    # are reported in the order of the lines that caused them.
+    def parse_chunk(self, chunk, partial=None):
+        if partial is None:
+            partial = self.new_partial()
+
+        legend_index = len(self.legend)
+
+        profiler = self.profiler
+
+        profiler.count("bytes", len(chunk))
+
+        with profiler.phase("tokenize"):
+            records = parse_record.parse_lines(chunk)
+
+        if records is not None and \
+           all(legend_index == n for n in map(len, records)):
+            profiler.count("rows", len(records))
+            self.group_records(partial, records)
+            return (partial, [], [], None)
+
+        with profiler.phase("tokenize"):
+            return self.parse_chunk_lines(chunk, partial)
+
+    # Parses a chunk line by line, see parse_chunk().
+    def parse_chunk_lines(self, chunk, partial):
+        legend_index = len(self.legend)
+
+        messages = []
+        comments = []
+
+        for line in chunk.split('\n'):
+            line = line.strip()
+
+            # Look for blank lines
+            if 0 == len(line):
+                continue
+
+            # Look for comments 
+            if '#' == line[0]:
+                if 1 < len(line) and '#' == line[1]:
+                    return (partial, messages, comments,
+                            "Variable declarations must come before any data.")
+
+                # If there is no legend, then preserve the comment.
+                if 0 == legend_index:
+                    comments.append(line)
+                continue
+
+            row = parse_record(line)
+
+            self.profiler.count("rows")
+
+            if len(row) != legend_index:
+                message = "Row '"+line+"' has only "+str(len(row))+\
+                          " variables, but the legend has "+\
+                          str(legend_index)+" variables."
+
+                # A record that is missing variables cannot be grouped.
+                if len(row) < legend_index:
+                    return (partial, messages, comments, message)
+
+                messages.append("ERROR: "+message)
+
+            self.group_records(partial, [row])
+
+        return (partial, messages, comments, None)
+
+    ###########################################################################
+    # Convert the cells (for columnar ingestion)
+
+    # Returns the cells of the records that pass the filters on CTLs and INDs.
+    # Each filter is evaluated once per distinct cell.
+    def drop_filtered_cells(self, cells):
+        keep = None
+
+        for (filters, inclusive) in ((self.inclusive_filters, True),
+                                     (self.exclusive_filters, False)):
+            for pred in filters:
+                index = self.legend.tags_to_indices[pred.tag]
+
+                if index not in self.civars.indices:
+                    continue
+
+                passed = dict((x, pred(try_int_or_float(x)) == inclusive)
+                              for x in set(cells[index]))
+
+                mask = map(passed.__getitem__, cells[index])
+
+                if keep is None:
+                    keep = mask
+                else:
+                    keep = map(and_, keep, mask)
+
+        if keep is None:
+            return cells
+
+        return [list(compress(c, keep)) for c in cells]
+
+    # Converts the cells into columns, unless the columns have been loaded.
+    # Unless keep_all is True, the records that the filters reject are dropped
+    # before their cells are converted.
+    def build_columns(self, keep_all=False):
+        if self.columns is None:
+            cells = self.cells
+
+            if not keep_all:
+                with self.profiler.phase("filter"):
+                    cells = self.drop_filtered_cells(cells)
+
+            with self.profiler.phase("convert columns"):
+                self.columns = [column(c) for c in cells]
+
+        self.cells = None
+
+    ###########################################################################
+    # Group the records
+
+    # Returns a sorted list of datasets, (CTL key, [(CTL and IND key, [number
+    # of samples of each DEP])]).
+    def group(self):
+        groups = []
+
+        cvars = self.cvars
+        civars = self.civars
+        dvars = self.dvars
+
+        if not self.columnar:
+            self.sorted_master = [(key, sorted(dataset.iteritems()))
+                                  for (key, dataset)
+                                  in sorted(self.master.iteritems())]
+
+            for (key, dataset) in self.sorted_master:
+                groups.append((key, [(iv, map(len, samples))
+                                     for (iv, samples) in dataset]))
+
+            return groups
+
+        self.build_columns()
+
+        columns = self.columns
+        tags_to_indices = self.legend.tags_to_indices
+
+        #######################################################################
+        # Apply filters
+
+        with self.profiler.phase("filter"):
+            selected = np.ones(len(columns[0]) if columns else 0, np.bool_)
+
+            for pred in self.inclusive_filters:
+                selected &= columns[tags_to_indices[pred.tag]].matches(pred)
+
+            for pred in self.exclusive_filters:
+                selected &= ~columns[tags_to_indices[pred.tag]].matches(pred)
+
+            selected = np.flatnonzero(selected)
+
+        #######################################################################
+        # Sort the records by CTL key, then CTL and IND key (which, within a
+        # dataset, orders by the INDs), and find the group boundaries.
+
+        ind_indices = tuple(x for x in civars.indices
+                            if x not in cvars.indices)
+
+        sort_keys = [columns[x].ranks()[selected]
+                     for x in cvars.indices + ind_indices]
+
+        # If the number of possible combinations of ranks fits, combine the
+        # keys into a single int64, which is much cheaper to sort than several
+        # keys.
+        radices = [int(k.max()) + 1 if len(k) else 1 for k in sort_keys]
+
+        if sort_keys and reduce(lambda a, b: a * b, radices) <= INT64_MAX:
+            combined = np.zeros(len(selected), np.int64)
+            for (k, radix) in zip(sort_keys, radices):
+                combined = combined * radix + k
+
+            # Mergesort is stable.
+            order = np.argsort(combined, kind="mergesort")
+            combined = combined[order]
+            changes = combined[1:] != combined[:-1]
+        elif sort_keys:
+            # lexsort() is stable and sorts by the last key first.
+            order = np.lexsort(sort_keys[::-1])
+            sorted_keys = np.array(sort_keys)[:, order]
+            changes = (sorted_keys[:, 1:] != sorted_keys[:, :-1]).any(axis=0)
+        else:
+            order = np.arange(len(selected))
+            changes = np.zeros(max(len(selected) - 1, 0), np.bool_)
+
+        starts = np.flatnonzero(np.concatenate(([True], changes)))
+        if 0 == len(selected):
+            starts = starts[:0]
+        group_sizes = np.diff(np.append(starts, len(selected)))
+
+        # Within a group the records keep their order in the file, so the first
+        # one is the one that created the group when grouping record by record.
+        first = selected[order[starts]]
+
+        civ_keys = zip(*[columns[x].values_at(first) for x in civars.indices])
+
+        ctl_positions = [civars.indices.index(x) for x in cvars.indices]
+
+        for (civ_key, n) in zip(civ_keys, group_sizes.tolist()):
+            ctl_key = tuple(civ_key[x] for x in ctl_positions)
+
+            if not groups or groups[-1][0] != ctl_key:
+                groups.append((ctl_key, []))
+
+            groups[-1][1].append((civ_key, [n] * len(dvars.indices)))
+
+        self.selected = selected
+        self.order = order
+        self.group_sizes = group_sizes
+
+        return groups
+
+    ###########################################################################
+    # Compute the statistics
+
+    # Returns the sample size: the number of samples of the first DEP of the
+    # first group. Prints a warning to log for each group and DEP with a
+    # different number of samples.
+    def sample_size(self, groups, log):
+        sample_size = None
+
+        for (key, dataset) in groups:
+            for (iv, counts) in dataset:
+                for n in counts:
+                    if sample_size is None:
+                        sample_size = n
+                    else:
+                        if sample_size != n:
+                            missing = abs(n - sample_size)
+                            print >> log, "WARNING: Missing "+str(missing)+\
+                                  " sample(s) for ("+\
+                                  ", ".join(str(x) for x in iv)+")."
+
+        return sample_size
+
+    # Returns the samples of a dependent variable (i is its legend index) for
+    # every group, in the order of group(): a list of running_stats
+    # accumulators when streaming, and otherwise packed_groups, without
+    # outliers if they are rejected.
+    def samples(self, i):
+        if self.columnar:
+            try:
+                samples = self.columns[i].floats()[self.selected[self.order]]
+            except ValueError:
+                raise bbb_error("Dependent variable '"+self.legend[i].tag+\
+                                "' has non-numeric values.")
+
+            samples = packed_groups(samples, self.group_sizes)
+        else:
+            x = self.dvars.indices.index(i)
+
+            samples = [s[x] for (key, dataset) in self.sorted_master
+                            for (iv, s) in dataset]
+
+            if self.streaming:
+                return samples
+
+            samples = packed_groups(concatenate_samples(samples),
+                                    np.fromiter(imap(len, samples), np.intp,
+                                                len(samples)))
+
+        if self.reject is not None:
+            samples = reject_outliers(samples, self.reject,
+                                      self.reject_threshold)
+
+        return samples
+
+    # Computes the statistics for every group of every dependent variable at
+    # once. Returns a dictionary which maps each DEP to a list with a tuple of
+    # the statistics in stat_columns for each group, in the order of group().
+    # When outliers are rejected, every statistic is computed without them.
+    # Bootstrap resamples are drawn with map_function, e.g. the map() of a
+    # process pool.
+    def statistics(self, map_function=map):
+        dep_stats = {}
+
+        for i in self.dvars.indices:
+            samples = self.samples(i)
+
+            if self.streaming:
+                dep_stats[i] = []
+
+                for s in samples:
+                    # 0.05 specifies a 95% confidence interval
+                    avg, median, stdev, min, max, confidence = s.stats(0.05)
+                    dep_stats[i].append((avg, stdev, confidence))
+            else:
+                # 0.05 specifies a 95% confidence interval
+                avg, median, stdev, min, max, confidence = \
+                    stats_batch(samples, 0.05)
+
+                columns = [avg, stdev, confidence]
+
+                if self.reject is not None:
+                    columns.append(samples.counts)
+
+                if self.percentiles is not None:
+                    columns.extend(
+                        percentiles_batch(samples, self.percentiles).T)
+                    columns.extend(median_interval_batch(samples, 0.05))
+
+                if self.robust:
+                    columns.extend(robust_batch(samples, self.trim))
+
+                if self.bootstrap is not None:
+                    columns.extend(bootstrap_batch(samples, 0.05,
+                                                   self.resamples,
+                                                   self.bootstrap, self.seed,
+                                                   map_function))
+
+                dep_stats[i] = zip(*[c.tolist() for c in columns])
+
+        return dep_stats
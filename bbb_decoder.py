@@ -0,0 +1,211 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+import numpy as np
+
+from operator import itemgetter
+
+from bbb_legend import CTL, IND, DEP, try_int_or_float
+
+# Returns a function that extracts the cells at the given indices of a row as
+# a tuple.
+def cell_getter(indices):
+    if   0 == len(indices): return lambda row: ()
+    elif 1 == len(indices): return lambda row, i=indices[0]: (row[i],)
+    else:                   return itemgetter(*indices)
+
+# Decodes the cells of a row into typed values. Built once the legend has been
+# closed, so that all the per-variable work (sorting the legend, finding
+# indices, resolving filter tags) happens once instead of once per row.
+#
+# The CTL and IND cells of a row are converted together and the result is
+# cached by their text: there are only as many distinct combinations as there
+# are groups, so each distinct cell is converted once and the group keys are
+# built once. Filters on CTL or IND variables are resolved as part of the same
+# cached conversion. DEP cells are always numeric, so they are converted
+# straight to float.
+class row_decoder:
+    def __init__(self, legend, inclusive_filters, exclusive_filters):
+        cvars  = legend.indices([CTL])
+        civars = legend.indices([CTL, IND])
+        dvars  = legend.indices([DEP])
+
+        self.civ_indices = civars.indices
+        self.dep_indices = dvars.indices
+
+        # Positions of the CTLs within the CTL and IND key.
+        self.ctl_positions = tuple(civars.indices.index(x)
+                                   for x in cvars.indices)
+
+        self.get_civ_cells = cell_getter(civars.indices)
+        self.get_dep_cells = cell_getter(dvars.indices)
+
+        # Filters on CTLs and INDs are evaluated once per distinct key, the
+        # rest once per row. Each filter is (index, predicate, inclusive).
+        self.key_filters = []
+        self.row_filters = []
+
+        for (filters, inclusive) in ((inclusive_filters, True),
+                                     (exclusive_filters, False)):
+            for pred in filters:
+                index = legend.tags_to_indices[pred.tag]
+
+                if index in civars.indices:
+                    self.key_filters.append(
+                        (civars.indices.index(index), pred, inclusive))
+                else:
+                    self.row_filters.append((index, pred, inclusive))
+
+        # Maps the text of the CTL and IND cells of a row to the keys of its
+        # group, (CTL key, CTL and IND key), or to None if the row is filtered
+        # out.
+        self.keys = {}
+
+    def decode_keys(self, cells):
+        # Only convert the cells of the rows that pass the filters.
+        for (position, pred, inclusive) in self.key_filters:
+            if pred(try_int_or_float(cells[position])) != inclusive:
+                return None
+
+        civ_key = tuple(try_int_or_float(x) for x in cells)
+
+        ctl_key = tuple(civ_key[x] for x in self.ctl_positions)
+
+        return (ctl_key, civ_key)
+
+    # Returns (CTL key, CTL and IND key, DEP values), or None if the row is
+    # filtered out.
+    def __call__(self, row):
+        cells = self.get_civ_cells(row)
+
+        try:
+            keys = self.keys[cells]
+        except KeyError:
+            keys = self.keys[cells] = self.decode_keys(cells)
+
+        if keys is None:
+            return None
+
+        for (index, pred, inclusive) in self.row_filters:
+            if pred(try_int_or_float(row[index])) != inclusive:
+                return None
+
+        try:
+            deps = [float(x) for x in self.get_dep_cells(row)]
+        except ValueError:
+            deps = [try_int_or_float(x) for x in self.get_dep_cells(row)]
+
+        return (keys[0], keys[1], deps)
+
+INT64_MAX = int(np.iinfo(np.int64).max)
+
+def is_int_cell(x):
+    try:
+        int(x)
+        return True
+    except ValueError:
+        return False
+
+# The cells of one variable for every record, converted in bulk with the same
+# results as try_int_or_float(). If every cell is an integer (or every cell is
+# a float) the column is stored as an int64 (float64) array. Otherwise it is
+# dictionary encoded: the distinct values, plus an array with the index of
+# each record's value.
+class column:
+    kind = None    # "int64", "float64" or "dict"
+    data = None    # Values, or indices into values for dictionary encoding
+    values = None  # Distinct values, for dictionary encoding
+    uniques = None # Distinct cells, for dictionary encoding
+
+    def __init__(self, cells=None):
+        # The column is loaded from a cache.
+        if cells is None:
+            return
+
+        # NumPy converts each cell with int() or float(), and stops at the
+        # first one that fails.
+        try:
+            self.kind = "int64"
+            self.data = np.array(cells, np.int64)
+            return
+        except (ValueError, OverflowError):
+            pass
+
+        try:
+            data = np.array(cells, np.float64)
+
+            # try_int_or_float() would have converted any integer cell to an
+            # int, so a column with some is not a float64 column.
+            if not any(is_int_cell(cells[x])
+                       for x in np.flatnonzero(data == np.floor(data))):
+                self.kind = "float64"
+                self.data = data
+                return
+        except ValueError:
+            pass
+
+        uniques, codes = np.unique(np.array(cells), return_inverse=True)
+
+        self.kind = "dict"
+        self.data = codes
+        self.uniques = uniques
+        self.values = [try_int_or_float(x) for x in uniques.tolist()]
+
+    def __len__(self):
+        return len(self.data)
+
+    # Returns (kind, data, uniques), the arrays the column can be loaded from.
+    def arrays(self):
+        if "dict" == self.kind:
+            return (np.array(self.kind), self.data, self.uniques)
+        else:
+            return (np.array(self.kind), self.data, np.array([], 'S'))
+
+    # Loads the column from the arrays returned by arrays().
+    def load(self, kind, data, uniques):
+        self.kind = kind.tolist()
+        self.data = data
+
+        if "dict" == self.kind:
+            self.uniques = uniques
+            self.values = [try_int_or_float(x) for x in uniques.tolist()]
+
+    # Returns, for each record, the rank of its value among the distinct
+    # values of the column in sorted() order. Equal values have equal ranks.
+    def ranks(self):
+        if "dict" == self.kind:
+            distinct = sorted(set(self.values))
+            rank = dict((v, r) for (r, v) in enumerate(distinct))
+            return np.array([rank[v] for v in self.values], np.intp)[self.data]
+        else:
+            return np.unique(self.data, return_inverse=True)[1]
+
+    # Returns the values of the given records as Python objects.
+    def values_at(self, records):
+        if "dict" == self.kind:
+            return [self.values[x] for x in self.data[records].tolist()]
+        else:
+            return self.data[records].tolist()
+
+    # Returns a mask of the records whose value passes a filter.
+    def matches(self, pred):
+        if "dict" == self.kind:
+            passed = np.array([pred(v) for v in self.values], np.bool_)
+            return passed[self.data]
+        else:
+            return pred.mask(self.data)
+
+    # Returns the values as a float64 array, or raises ValueError if some of
+    # them are not numeric.
+    def floats(self):
+        if "dict" == self.kind:
+            return np.array(self.values, np.float64)[self.data]
+        else:
+            return self.data.astype(np.float64)
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from random import Random
+
+from bbb_error import bbb_error
+
+# Returns the number of distinct values each of variables CTLs and INDs needs
+# for there to be at least groups distinct combinations.
+def values_per_variable(variables, groups):
+    if 0 == variables:
+        return 1
+
+    radix = max(1, int(round(groups ** (1.0 / variables))))
+
+    while radix ** variables < groups:
+        radix = radix + 1
+
+    return radix
+
+# Returns the text of each of the radix values of a CTL or IND variable: sizes
+# (multiples of 8) for INDs, small integers for CTLs, or, with probability
+# quoted, quoted strings that contain whitespace.
+def variable_values(name, ind, radix, quoted, random):
+    values = []
+
+    for v in range(radix):
+        if random.random() < quoted:
+            values.append('"'+name+' '+str(v)+'"')
+        elif ind:
+            values.append(str(8 * (v + 1)))
+        else:
+            values.append(str(v + 1))
+
+    return values
+
+# Writes a synthetic .bbb file to output: ctls CTL variables (C0, C1, ...),
+# inds IND variables (I0, I1, ...) and deps DEP variables (D0, D1, ...), and
+# about rows records, with samples records for each group (each distinct
+# combination of CTLs and INDs). A fraction quoted of the values of the first
+# CTL (or IND, if there are no CTLs) are quoted strings, and a fraction missing
+# of the records are left out at random, so that groups have different numbers
+# of samples. Only one variable has quoted values, as the record parser reads
+# every cell between the first and the last quote of a line as one string.
+#
+# The records of each group come one after another, as a benchmark that runs
+# each configuration several times would write them. The DEPs of a group are
+# spread around a random typical value. The output only depends on the
+# arguments, including seed.
+#
+# Returns the number of records written.
+def generate_bbb(output, ctls=1, inds=1, deps=1, rows=1000, samples=10,
+                 quoted=0.0, missing=0.0, seed=0):
+    if ctls < 0 or inds < 0 or deps < 1:
+        raise bbb_error("There must be at least one DEP, and no negative "+\
+                        "number of CTLs or INDs.")
+
+    if rows < 0 or samples < 1:
+        raise bbb_error("The number of records must not be negative, and "+\
+                        "each group must have at least one sample.")
+
+    if not 0 <= quoted <= 1 or not 0 <= missing < 1:
+        raise bbb_error("The fraction of quoted values must be between 0 "+\
+                        "and 1, and the fraction of missing samples at "+\
+                        "least 0 and less than 1.")
+
+    random = Random(seed)
+
+    names = ["C"+str(x) for x in range(ctls)] + \
+            ["I"+str(x) for x in range(inds)]
+
+    for name in names[:ctls]:
+        print >> output, "## CTL:"+name+":Control "+name[1:]+":"
+
+    for name in names[ctls:]:
+        print >> output, "## IND:"+name+":Independent "+name[1:]+":bytes"
+
+    for x in range(deps):
+        print >> output, "## DEP:D"+str(x)+":Dependent "+str(x)+":s"
+
+    # Without CTLs and INDs, every record is in the same group.
+    if 0 == len(names):
+        samples = max(rows, 1)
+
+    groups = (rows + samples - 1) // samples
+
+    radix = values_per_variable(len(names), groups)
+
+    values = [variable_values(name, ctls <= x, radix,
+                              quoted if 0 == x else 0.0, random)
+              for (x, name) in enumerate(names)]
+
+    written = 0
+
+    for g in range(groups):
+        # The values of the group are the digits of g in base radix.
+        key = []
+        digits = g
+
+        for x in reversed(range(len(names))):
+            key.append(values[x][digits % radix])
+            digits = digits // radix
+
+        key = " ".join(reversed(key))
+
+        typical = [10 ** random.uniform(-3, 3) for x in range(deps)]
+
+        for s in range(min(samples, rows - g * samples)):
+            if random.random() < missing:
+                continue
+
+            cells = ["%.6g" % (t * random.gauss(1, 0.05)) for t in typical]
+
+            if key:
+                print >> output, key, " ".join(cells)
+            else:
+                print >> output, " ".join(cells)
+
+            written = written + 1
+
+    return written
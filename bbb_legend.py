@@ -0,0 +1,348 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+import numpy as np
+
+from re import compile as regex_compile, error as regex_error
+
+from operator import eq, ne, lt, le, gt, ge
+
+from bbb_error import bbb_error
+
+CTL = 1 # Control variables, used to distinguish datasets
+IND = 2 # Independent variables
+DEP = 3 # Dependent variables (averaged and stdev'd)
+ 
+def vtype_to_str(vt):
+    if   CTL == vt: return "CTL"
+    elif IND == vt: return "IND"
+    elif DEP == vt: return "DEP"
+
+    else:
+        assert CTL == vt or IND == vt or DEP == vt
+        return None
+
+def str_to_vtype(s):
+    if   "CTL" == s: return CTL
+    elif "IND" == s: return IND
+    elif "DEP" == s: return DEP
+
+    else:
+        assert "CTL" == s or "IND" == s or "DEP" == s 
+        return None
+
+def try_int_or_float(x):
+    try:
+        try:
+            return int(x)
+        except ValueError:
+            return float(x)
+    except ValueError:
+        return x
+
+def is_string_cell(s):
+    if not isinstance(s, str):
+        return False
+
+    # An empty string is at least two characters: ""
+    if len(s) < 2:
+        return False
+
+    if '"' == s[0] and '"' == s[-1]:
+        return True
+    else:
+        return False
+
+def try_remove_quotes(s):
+    if is_string_cell(s):
+        return s[1:-1]
+    else:
+        return s
+
+###############################################################################
+
+# Returns (tag, vtype) where tag is a string and vtype is an integer
+class variable_classification_parser:
+    engine = None
+
+    ###########################################################################
+    # Grammar
+
+    def __init__(self):
+        # Parse a tag.
+        tag_rule = r'[a-zA-Z0-9_]+'
+
+        # Parse a variable type.
+        vtype_rule = r'(?:CTL)|(?:IND)|(?:DEP)'
+
+        # Parse a variable classification.        
+        variable_classification_rule = r'(' + tag_rule + r')'   \
+                                     + r'='                     \
+                                     + r'(' + vtype_rule + r')'
+
+        self.engine = regex_compile(variable_classification_rule)
+
+    ###########################################################################
+
+    def __call__(self, vc):
+        match = self.engine.match(vc)
+
+        if match is None:
+            raise bbb_error("Variable classification (-v) '"+vc+"' is "+\
+                            "invalid, the format is TAG=TYPE, where TAG is a "+\
+                            "variable tag and TYPE is either CTL, IND or DEP.")
+
+        return (match.group(1), str_to_vtype(match.group(2)))
+
+###############################################################################
+
+parse_variable_classification = variable_classification_parser()
+
+###############################################################################
+
+# A filter on the values of a variable (TAG), one of:
+#
+#   TAG=VALUE, TAG!=VALUE       Equal or not equal to VALUE.
+#   TAG<VALUE, TAG<=VALUE,      Ordered before or after VALUE. Numbers are only
+#   TAG>VALUE, TAG>=VALUE       ordered against numbers and strings against
+#                               strings.
+#   TAG in {VALUE,VALUE,...}    Equal to one of the VALUEs.
+#   TAG~REGEX                   A string matching REGEX (searched for in the
+#                               string, without its quotes).
+class predicate:
+    tag = None
+    op = None    # "=", "!=", "<", "<=", ">", ">=", "in" or "~"
+    value = None # A value, a frozenset of values (in) or a regex (~)
+    test = None  # The comparison, for "=", "!=", "<", "<=", ">" and ">="
+
+    def __init__(self, tag, op, value):
+        self.tag = tag
+        self.op = op
+        self.value = value
+        self.test = {
+            "=": eq, "!=": ne, "<": lt, "<=": le, ">": gt, ">=": ge
+        }.get(op)
+
+    # Returns True if a value (converted with try_int_or_float()) passes.
+    def __call__(self, value):
+        if "~" == self.op:
+            return is_string_value(value) and \
+                   self.value.search(try_remove_quotes(value)) is not None
+        elif "in" == self.op:
+            return value in self.value
+        elif "=" == self.op or "!=" == self.op:
+            return self.test(value, self.value)
+        else:
+            return is_string_value(value) == is_string_value(self.value) and \
+                   self.test(value, self.value)
+
+    # Returns a mask of the values in a numeric array that pass.
+    def mask(self, data):
+        if "~" == self.op:
+            return np.zeros(len(data), np.bool_)
+        elif "in" == self.op:
+            numbers = [x for x in self.value if not is_string_value(x)]
+            return np.in1d(data, numbers)
+        elif is_string_value(self.value):
+            return np.zeros(len(data), np.bool_) | ("!=" == self.op)
+        else:
+            return self.test(data, self.value)
+
+def is_string_value(value):
+    return isinstance(value, str)
+
+# Returns the predicate of a filter (see predicate above)
+class filter_parser:
+    engine = None
+
+    ###########################################################################
+    # Grammar
+
+    def __init__(self):
+        # Parse a tag.
+        tag_rule = r'[a-zA-Z0-9_]+'
+
+        # Parse a comparison.
+        op_rule = r'!=|>=|<=|=|<|>|~'
+
+        # Parse a value.
+        value_rule = r'.+'
+
+        # Parse a set of values.
+        set_rule = r'\{(.*)\}'
+
+        # Parse a filter.
+        filter_rule = r'(' + tag_rule + r')'                                \
+                    + r'(?:\s*(' + op_rule + r')\s*(' + value_rule + r')'    \
+                    + r'|\s+in\s+' + set_rule + r')$'
+
+        self.engine = regex_compile(filter_rule)
+
+    ###########################################################################
+
+    def __call__(self, fi):
+        match = self.engine.match(fi)
+
+        if match is None:
+            raise bbb_error("Filter '"+fi+"' is invalid, the format is "+\
+                            "TAG=VALUE, TAG!=VALUE, TAG<VALUE, TAG<=VALUE, "+\
+                            "TAG>VALUE, TAG>=VALUE, 'TAG in {VALUE,...}' or "+\
+                            "TAG~REGEX, where TAG is a variable tag and VALUE "+\
+                            "is a valid value for the variable.")
+
+        (tag, op, value, members) = match.groups()
+
+        if members is not None:
+            return predicate(tag, "in", frozenset(
+                try_int_or_float(x.strip()) for x in members.split(',')
+                if 0 != len(x.strip())))
+
+        if "~" == op:
+            try:
+                return predicate(tag, op, regex_compile(value))
+            except regex_error as e:
+                raise bbb_error("Filter '"+fi+"' has an invalid regular "+\
+                                "expression: "+str(e)+".")
+
+        return predicate(tag, op, try_int_or_float(value))
+
+###############################################################################
+
+parse_filter = filter_parser()
+
+class variable:
+    index = -1
+    vtype = 0
+    tag = ""
+    name = ""
+    units = ""
+
+    def __init__(self, index, vtype, tag, name, units):
+        self.index = index
+
+        try:
+            self.vtype = str_to_vtype(vtype)    
+        except AssertionError:
+            raise bbb_error("Variable "+str((index, vtype, tag, name, units))+\
+                            " has a invalid type, options are 'CTL', 'IND' "+\
+                            "and 'DEP'.")
+
+        self.tag = tag
+        self.name = name
+        self.units = units
+
+    def __str__(self):
+        return str((str(self.index), vtype_to_str(self.vtype), \
+                    self.tag, self.name, self.units))        
+
+class vtype_indices:
+    vtype = 0
+    indices = ()
+
+    def __init__(self, vtype, legend):
+        assert CTL in vtype or IND in vtype or DEP in vtype
+
+        l = []
+
+        for (index, v) in sorted(legend.iteritems()):
+            if v.vtype in vtype:
+                l.append(index)
+
+        self.vtype = vtype
+        self.indices = tuple(l)
+
+    def apply(self, row):
+        return tuple(try_int_or_float(row[x]) for x in self.indices)
+
+###############################################################################
+
+# Returns the fields of the variable declarations in the lines of a header.
+def declarations(lines):
+    return [[x.strip() for x in line.strip()[2:].split(':')]
+            for line in lines if line.strip().startswith('##')]
+
+# The variables declared by the header of a .bbb file, by index. Variables are
+# declared by lines of the form "## TYPE:TAG:NAME:UNITS", other lines of the
+# header are ignored.
+class legend:
+    variables = None       # Variables by index
+    tags_to_indices = None # Indices by tag
+    declarations = None    # The fields of each declaration, as declared
+
+    def __init__(self, header=()):
+        self.variables = {}
+        self.tags_to_indices = {}
+        self.declarations = []
+
+        for line in header:
+            self.parse_line(line)
+
+    def parse_line(self, line):
+        line = line.strip()
+
+        # Look for the legend 
+        if not line.startswith('##'):
+            return
+
+        # Chop off the ##
+        line = line[2:]
+
+        row = line.split(':')
+
+        if 4 != len(row):
+            raise bbb_error("Variable declaration '"+line+"' has "+\
+                            str(len(row))+" fields instead of 4.")
+
+        v = variable(len(self.variables), *(x.strip() for x in row)) 
+
+        if v.tag in self.tags_to_indices:
+            raise bbb_error("Variable declaration '"+line+"' is a "+\
+                            "duplicate.")
+
+        self.tags_to_indices[v.tag] = v.index
+
+        self.variables[v.index] = v                 
+
+        self.declarations.append([x.strip() for x in row])
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __getitem__(self, index):
+        return self.variables[index]
+
+    def iteritems(self):
+        return self.variables.iteritems()
+
+    # Returns the indices of the variables of the given types.
+    def indices(self, vtypes):
+        return vtype_indices(vtypes, self)
+
+    # Applies a variable classification (TAG=TYPE), which overrides the type
+    # declared for the variable.
+    def classify(self, vc):
+        (tag, vtype) = parse_variable_classification(vc)
+
+        if tag not in self.tags_to_indices:
+            raise bbb_error("Tag '"+tag+"' from variable classification "+\
+                            "(-v) '"+vc+"' not found in input file.")
+
+        self.variables[self.tags_to_indices[tag]].vtype = vtype
+
+    # Returns the predicate of a filter (described by option, e.g. "inclusive
+    # filter (-i)") on one of the variables.
+    def parse_filter(self, fi, option):
+        pred = parse_filter(fi)
+
+        if pred.tag not in self.tags_to_indices:
+            raise bbb_error("Tag '"+pred.tag+"' from "+option+" '"+fi+"' "+\
+                            "not found in input file.")
+
+        return pred
@@ -0,0 +1,1107 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+import numpy as np
+
+from sys import stdout, stderr
+
+from optparse import OptionParser
+
+from os import rename, stat
+
+from os.path import splitext, commonprefix, exists
+
+from glob import glob
+
+from itertools import imap
+
+from multiprocessing import Pool
+
+from hashlib import sha1
+
+from cPickle import load, dump, HIGHEST_PROTOCOL
+
+from cProfile import Profile
+
+import bbb_legend
+
+import bbb_profile
+
+from bbb_error import bbb_error
+
+from bbb_reader import chunked_reader
+
+from bbb_legend import declarations
+
+from bbb_decoder import column
+
+from statistics import cached_tinv
+
+from bbb_aggregate import aggregator
+
+from bbb_significance import write_significance
+
+from bbb_writer import write_legend, write_data, write_binary, \
+                       write_npz, write_jsonl
+
+# Adds the options of postprocess_bbb.py to an OptionParser.
+def add_postprocess_options(op):
+    op.add_option(
+        "-v", "--classify-variable",
+        help=("Classify a particular variable (TAG) as a control (CTL), "
+              "independent (IND) or dependent (DEP) variable. Overrides the "
+              "classification specified in the file. Parameters should be "
+              "specified as TAG=TYPE, where TAG is a variable tag, and TYPE "
+              "is either CTL, IND or DEP."),
+        action="append", type="string", dest="variable_classifications",
+        metavar="TAG=TYPE"
+    )
+
+    op.add_option(
+        "-i", "--filter-in",
+        help=("Only include records for which the specified variable (TAG) is "
+              "equal to the given value (VALUE). Other comparisons are "
+              "TAG!=VALUE, TAG<VALUE, TAG<=VALUE, TAG>VALUE, TAG>=VALUE, 'TAG "
+              "in {VALUE,...}' and TAG~REGEX, which matches strings "
+              "containing REGEX. Applied consecutively before --filter-out "
+              "options."),
+        action="append", type="string", dest="inclusive_filters",
+        metavar="TAG=VALUE"
+    )
+
+    op.add_option(
+        "-o", "--filter-out",
+        help=("Only include records for which the specified variable (TAG) is "
+              "not equal the given value (VALUE). Takes the same comparisons "
+              "as --filter-in. Applied consecutively before --filter-out "
+              "options."),
+        action="append", type="string", dest="exclusive_filters",
+        metavar="TAG=VALUE"
+    )
+
+    op.add_option(
+        "-s", "--streaming",
+        help=("Aggregate each dependent variable with a streaming accumulator "
+              "(count, mean, sum of squared deviations, min, max and a "
+              "quantile sketch for the median) instead of retaining every "
+              "sample. Memory use is proportional to the number of groups "
+              "instead of the number of samples. Averages and standard "
+              "deviations may differ from the default mode in the last few "
+              "digits."),
+        action="store_true", dest="streaming", default=False
+    )
+
+    op.add_option(
+        "-c", "--columnar",
+        help=("Parse the records into per-variable columns (int64 or float64 "
+              "arrays, or dictionary encoded), then filter, group and compute "
+              "statistics in bulk with NumPy instead of record by record. "
+              "Faster for files with millions of records, but keeps every "
+              "cell in memory."),
+        action="store_true", dest="columnar", default=False
+    )
+
+    op.add_option(
+        "-j", "--jobs",
+        help=("Parse and group the data in N processes. Each process groups a "
+              "part of the file and the parts are merged in order, so the "
+              "output is the same for any N."),
+        action="store", type="int", dest="jobs", default=1,
+        metavar="N"
+    )
+
+    op.add_option(
+        "-m", "--merge-input",
+        help=("Merge the records of another input file (FILE), or of the "
+              "files matching a glob pattern, with those of input-data. The "
+              "variable declarations of all the input files must match."),
+        action="append", type="string", dest="merge_inputs",
+        metavar="FILE"
+    )
+
+    op.add_option(
+        "-u", "--incremental",
+        help=("Save the grouped records, and how far each input file was "
+              "parsed, to STATE. If STATE exists and was saved with the same "
+              "variable declarations, classifications, filters and "
+              "aggregation mode, only parse what was appended to the input "
+              "files since then. Only complete lines (ending with a newline) "
+              "are parsed."),
+        action="store", type="string", dest="incremental",
+        metavar="STATE"
+    )
+
+    op.add_option(
+        "-k", "--column-cache",
+        help=("Cache the columns parsed from the input files in CACHE (a "
+              "NumPy .npz file), and use the cache instead of parsing the "
+              "input files while their sizes, modification times and contents "
+              "are unchanged. Classifications and filters are applied after "
+              "the cache is loaded, so they may differ between runs. Implies "
+              "--columnar."),
+        action="store", type="string", dest="column_cache",
+        metavar="CACHE"
+    )
+
+    op.add_option(
+        "-b", "--binary",
+        help=("Write output-data as gnuplot binary data instead of text: one "
+              "record of float64 values per group, with the same columns as "
+              "the text output, and one block of records per dataset. "
+              "Non-numeric CTL and IND values are written as NaN. The legend "
+              "is written to output-gnuplot-header as comments, along with "
+              "BINARY, the binary keywords for the data (e.g. \"plot 'data' "
+              "binary @BINARY index 0 using @SZ:@T_AVG\"), DATASETS, the "
+              "number of datasets, and TITLE_0, TITLE_1, ..., their titles. "
+              "Without output-data, it is named post_input-data.bin."),
+        action="store_true", dest="binary", default=False
+    )
+
+    op.add_option(
+        "-B", "--bootstrap",
+        help=("Add a bootstrap confidence interval of the average of each "
+              "DEP, which does not assume that the samples are normally "
+              "distributed, to the output data: its lower bound (TAG_BLO) and "
+              "upper bound (TAG_BHI). METHOD is either percentile or bca "
+              "(bias-corrected and accelerated, better for skewed samples). "
+              "Cannot be combined with --streaming. Uses --jobs processes."),
+        action="store", type="choice", choices=["percentile", "bca"],
+        dest="bootstrap", metavar="METHOD"
+    )
+
+    op.add_option(
+        "-R", "--resamples",
+        help=("Draw N bootstrap resamples of each group (default: 1000)."),
+        action="store", type="int", dest="resamples", default=1000,
+        metavar="N"
+    )
+
+    op.add_option(
+        "-S", "--seed",
+        help=("Seed the random numbers of the bootstrap resamples with N "
+              "(default: 0). The same seed gives the same results."),
+        action="store", type="int", dest="seed", default=0,
+        metavar="N"
+    )
+
+    op.add_option(
+        "-P", "--percentiles",
+        help=("Add the percentiles in LIST (comma separated numbers between 0 "
+              "and 100, e.g. 50,90,99,99.9) of each DEP to the output data, "
+              "as TAG_P50, TAG_P90, TAG_P99, TAG_P99_9, ..., along with the "
+              "bounds of a 95% confidence interval of the median (TAG_MLO and "
+              "TAG_MHI), which are order statistics and do not assume "
+              "anything about the distribution of the samples. Percentiles "
+              "interpolate linearly between samples, like NumPy's "
+              "percentile(). Cannot be combined with --streaming."),
+        action="store", type="string", dest="percentiles",
+        metavar="LIST"
+    )
+
+    op.add_option(
+        "-r", "--robust",
+        help=("Add statistics of each DEP which are less affected by outliers "
+              "to the output data: the median absolute deviation (TAG_MAD), "
+              "the trimmed mean (TAG_TRM) and winsorized mean (TAG_WIN) (see "
+              "--trim) and the interquartile range (TAG_IQR). Cannot be "
+              "combined with --streaming."),
+        action="store_true", dest="robust", default=False
+    )
+
+    op.add_option(
+        "-t", "--trim",
+        help=("Cut a fraction FRACTION of the samples of each group from each "
+              "end for the trimmed mean, and replace them with the nearest "
+              "remaining sample for the winsorized mean (default: 0.1)."),
+        action="store", type="float", dest="trim", default=0.1,
+        metavar="FRACTION"
+    )
+
+    op.add_option(
+        "-x", "--reject",
+        help=("Reject the outliers of each group before computing any "
+              "statistics, and add the number of remaining samples of each "
+              "DEP (TAG_NUM) to the output data. METHOD is either mad, which "
+              "rejects samples whose modified z-score (0.6745 times their "
+              "distance to the median, over the median absolute deviation) is "
+              "above K, or iqr, which rejects samples more than K times the "
+              "interquartile range below the first or above the third "
+              "quartile. Cannot be combined with --streaming."),
+        action="store", type="choice", choices=["mad", "iqr"],
+        dest="reject", metavar="METHOD"
+    )
+
+    op.add_option(
+        "-X", "--reject-threshold",
+        help=("The threshold K of --reject (default: 3.5 for mad, 1.5 for "
+              "iqr)."),
+        action="store", type="float", dest="reject_threshold",
+        metavar="K"
+    )
+
+    op.add_option(
+        "-W", "--significance",
+        help=("Test whether each pair of datasets differs significantly at "
+              "each IND key they share, for each DEP, with Welch's t-test, and "
+              "write the results to FILE, a compressed NumPy .npz file. FIRST "
+              "and SECOND are the datasets of each pair, DATASET_TITLES their "
+              "titles, and there is an array for each IND with its values at "
+              "each IND key. For each DEP T, T_WELCH_T, T_WELCH_DF and "
+              "T_WELCH_P hold t, the degrees of freedom and the two-sided "
+              "p-value, with a row for each pair and a column for each IND "
+              "key, or NaN where a dataset has no samples at the key."),
+        action="store", type="string", dest="significance",
+        metavar="FILE"
+    )
+
+    op.add_option(
+        "-U", "--mann-whitney",
+        help=("Also run the Mann-Whitney U test, which does not assume that "
+              "the samples are normally distributed, for --significance, and "
+              "write U and the two-sided p-value of each DEP T as T_MWU_U and "
+              "T_MWU_P. Cannot be combined with --streaming."),
+        action="store_true", dest="mann_whitney", default=False
+    )
+
+    op.add_option(
+        "-T", "--tinv-cache",
+        help=("Start with the t values (of Student's t distribution) for the "
+              "confidence intervals saved in FILE, if it exists, and save "
+              "them there again if any new ones were computed, so that later "
+              "runs do not have to compute them again. FILE is a text file "
+              "with one significance level, degree of freedom and t value per "
+              "line."),
+        action="store", type="string", dest="tinv_cache",
+        metavar="FILE"
+    )
+
+    op.add_option(
+        "-Q", "--profile",
+        help=("Report the wall and CPU time of each phase (legend, "
+              "tokenize, filter, group, sample size, statistics, write, ...), "
+              "the rows and bytes parsed per second, the number of groups "
+              "and samples, the peak resident set size and the hits and "
+              "misses of the t value cache to standard error. With --jobs, "
+              "the times of the phases run by the worker processes are "
+              "added up over the workers. Without --columnar, records are "
+              "decoded (and filtered) and grouped in separate passes while "
+              "profiling, which is a little slower."),
+        action="store_true", dest="profile", default=False
+    )
+
+    op.add_option(
+        "-J", "--profile-json",
+        help=("Write the report of --profile to FILE as JSON instead of to "
+              "standard error."),
+        action="store", type="string", dest="profile_json",
+        metavar="FILE"
+    )
+
+    op.add_option(
+        "-C", "--cprofile",
+        help=("Profile the run with cProfile and write the statistics to "
+              "FILE, which can be read with the pstats module. With --jobs, "
+              "the worker processes are not profiled."),
+        action="store", type="string", dest="cprofile",
+        metavar="FILE"
+    )
+
+    op.add_option(
+        "-z", "--npz",
+        help=("Also write the output data set to FILE, a NumPy .npz file with "
+              "an array for each variable of the output data, named after its "
+              "tag (e.g. TH, T_AVG, T_STD and T_CON), and T_N, the number of "
+              "samples of each group for each DEP T. DATASET is the index of "
+              "the dataset of each group, and DATASET_TITLES the title of "
+              "each dataset."),
+        action="store", type="string", dest="npz",
+        metavar="FILE"
+    )
+
+    op.add_option(
+        "-l", "--jsonl",
+        help=("Also write the output data set to FILE as JSON Lines: one "
+              "object per group, with the same names and values as --npz, "
+              "and TITLE, the title of the dataset."),
+        action="store", type="string", dest="jsonl",
+        metavar="FILE"
+    )
+
+# An OptionParser that raises bbb_error for invalid arguments instead of
+# exiting.
+class args_parser(OptionParser):
+    def error(self, msg):
+        raise bbb_error(msg)
+
+# Returns (options, args) for the command line arguments of postprocess_bbb.py,
+# without the name of the program. Raises bbb_error if they are invalid.
+def parse_postprocess_args(argv):
+    op = args_parser(add_help_option=False)
+
+    add_postprocess_options(op)
+
+    (options, args) = op.parse_args(argv)
+
+    if len(args) != 1 and len(args) != 3:
+        raise bbb_error("Expected input-data, or input-data output-data "+\
+                        "output-gnuplot-header, but got "+str(len(args))+\
+                        " arguments.")
+
+    return (options, args)
+
+# The options of postprocess(), with the same names and defaults as those of
+# postprocess_bbb.py. The options parsed by postprocess_bbb.py can be passed to
+# postprocess() as they are.
+class postprocess_options:
+    variable_classifications = None # TAG=TYPE strings (-v)
+    inclusive_filters = None        # Filter strings (-i)
+    exclusive_filters = None        # Filter strings (-o)
+    streaming = False               # -s
+    columnar = False                # -c
+    jobs = 1                        # -j
+    merge_inputs = None             # Names of other input files (-m)
+    incremental = None              # Name of the state file (-u)
+    column_cache = None             # Name of the cache file (-k)
+    binary = False                  # -b
+    bootstrap = None                # Bootstrap method (-B)
+    resamples = 1000                # -R
+    seed = 0                        # -S
+    percentiles = None              # Comma separated percentiles (-P)
+    robust = False                  # -r
+    trim = 0.1                      # -t
+    reject = None                   # Outlier rejection method (-x)
+    reject_threshold = None         # -X
+    significance = None             # Name of the significance file (-W)
+    mann_whitney = False            # -U
+    tinv_cache = None               # Name of the tinv cache file (-T)
+    profile = False                 # -Q
+    profile_json = None             # Name of the profile report file (-J)
+    cprofile = None                 # Name of the cProfile output file (-C)
+    npz = None                      # Name of the .npz output file (-z)
+    jsonl = None                    # Name of the JSON Lines output file (-l)
+
+    def __init__(self, **kwargs):
+        for (name, value) in kwargs.iteritems():
+            if not hasattr(postprocess_options, name):
+                raise TypeError("Unknown option '"+name+"'.")
+
+            setattr(self, name, value)
+
+# Raises bbb_error if options cannot be combined.
+def check_options(options):
+    if options.column_cache is not None:
+        if options.streaming:
+            raise bbb_error("Streaming (-s) aggregation cannot be combined "+\
+                            "with a column cache (-k).")
+
+        if options.incremental is not None:
+            raise bbb_error("Incremental processing (-u) cannot be combined "+\
+                            "with a column cache (-k).")
+
+    if options.streaming and options.columnar:
+        raise bbb_error("Streaming (-s) and columnar (-c) aggregation "+\
+                        "cannot be combined.")
+
+    if options.jobs < 1:
+        raise bbb_error("The number of jobs (-j) must be at least 1.")
+
+    if options.bootstrap is not None:
+        if options.streaming:
+            raise bbb_error("Bootstrap confidence intervals (-B) cannot be "+\
+                            "combined with streaming (-s) aggregation.")
+
+        if options.bootstrap not in ("percentile", "bca"):
+            raise bbb_error("The bootstrap method (-B) must be either "+\
+                            "percentile or bca.")
+
+        if options.resamples < 1:
+            raise bbb_error("The number of resamples (-R) must be at least 1.")
+
+    if options.mann_whitney:
+        if options.significance is None:
+            raise bbb_error("Mann-Whitney U tests (-U) need a significance "+\
+                            "file (-W).")
+
+        if options.streaming:
+            raise bbb_error("Mann-Whitney U tests (-U) cannot be combined "+\
+                            "with streaming (-s) aggregation.")
+
+    if options.percentiles is not None:
+        if options.streaming:
+            raise bbb_error("Percentiles (-P) cannot be combined with "+\
+                            "streaming (-s) aggregation.")
+
+        parse_percentiles(options.percentiles)
+
+    if options.robust:
+        if options.streaming:
+            raise bbb_error("Robust statistics (-r) cannot be combined with "+\
+                            "streaming (-s) aggregation.")
+
+        if not 0 <= options.trim < 0.5:
+            raise bbb_error("The trimmed fraction (-t) must be at least 0 "+\
+                            "and less than 0.5.")
+
+    if options.reject is not None:
+        if options.streaming:
+            raise bbb_error("Outlier rejection (-x) cannot be combined with "+\
+                            "streaming (-s) aggregation.")
+
+        if options.reject not in ("mad", "iqr"):
+            raise bbb_error("The outlier rejection method (-x) must be "+\
+                            "either mad or iqr.")
+
+        if options.reject_threshold is not None and \
+           not 0 < options.reject_threshold:
+            raise bbb_error("The outlier rejection threshold (-X) must be "+\
+                            "positive.")
+
+# Returns the numbers in a comma separated list of percentiles. Raises
+# bbb_error if they are not distinct numbers between 0 and 100.
+def parse_percentiles(text):
+    percentiles = []
+
+    for p in text.split(","):
+        try:
+            percentile = float(p)
+        except ValueError:
+            percentile = None
+
+        if percentile is None or not 0 <= percentile <= 100:
+            raise bbb_error("Percentile '"+p.strip()+"' (-P) is not a "+\
+                            "number between 0 and 100.")
+
+        if percentile in percentiles:
+            raise bbb_error("Percentile '"+p.strip()+"' (-P) is listed "+\
+                            "twice.")
+
+        percentiles.append(percentile)
+
+    return percentiles
+
+# Returns the names of the files matching a glob pattern, in sorted order, or
+# the name itself if it is not a pattern.
+def expand_input(pattern):
+    if not any(c in pattern for c in "*?["):
+        return [pattern]
+
+    names = sorted(glob(pattern))
+
+    if 0 == len(names):
+        raise bbb_error("No input files match '"+pattern+"'.")
+
+    return names
+
+# Returns the prefix of the names of the output files for the given input
+# files. Several input files are named after what their names have in common.
+def output_prefix(input_names):
+    if 1 == len(input_names):
+        return splitext(input_names[0])[0]
+
+    prefix = commonprefix([splitext(x)[0] for x in input_names])
+    prefix = prefix.rstrip("_-.")
+
+    if 0 == len(prefix) or prefix.endswith("/"):
+        prefix = prefix + "merged"
+
+    return prefix
+
+###############################################################################
+# Incremental state (--incremental)
+#
+# The state is the master dictionary (or the cells) and how far each input file
+# was parsed. It can only be used if it was saved with the same options that
+# decide how records are grouped, and if the input files still begin with the
+# bytes that were parsed.
+
+STATE_VERSION = 2
+
+# Returns a checksum of the header of an input file and of the last bytes it
+# had when it was parsed up to offset end, to tell whether the file has been
+# rewritten instead of appended to.
+def input_checksum(reader, data_offset, end):
+    checksum = sha1()
+    checksum.update(reader.data[:data_offset])
+    checksum.update(reader.data[max(data_offset, end - 4096):end])
+    return checksum.hexdigest()
+
+# Returns the saved state, or None if there is none or it cannot be used.
+def load_state(name, state_key, input_names, input_data, data_offsets, log):
+    if not exists(name):
+        return None
+
+    state_file = open(name, 'rb')
+    state = load(state_file)
+    state_file.close()
+
+    if state["key"] != state_key:
+        print >> log, "WARNING: State '"+name+"' was saved with different "+\
+              "variable declarations, classifications, filters or options, "+\
+              "reprocessing the input files."
+        return None
+
+    for (input_name, end, checksum) in state["inputs"]:
+        if input_name not in input_names:
+            print >> log, "WARNING: State '"+name+"' includes '"+\
+                  input_name+"', which is not an input file, reprocessing "+\
+                  "the input files."
+            return None
+
+        index = input_names.index(input_name)
+        reader = input_data[index]
+
+        if reader.size < end or \
+           checksum != input_checksum(reader, data_offsets[index], end):
+            print >> log, "WARNING: '"+input_name+"' has changed since "+\
+                  "state '"+name+"' was saved, reprocessing the input files."
+            return None
+
+    return state
+
+def save_state(name, state):
+    # Replace the old state only once the new one is complete.
+    state_file = open(name + ".tmp", 'wb')
+    dump(state, state_file, HIGHEST_PROTOCOL)
+    state_file.close()
+
+    rename(name + ".tmp", name)
+
+###############################################################################
+# tinv cache (--tinv-cache)
+#
+# The t values for the confidence intervals are cached in memory by
+# statistics.cached_tinv, and the cache is saved between runs.
+
+def load_tinv_cache(name, log):
+    if not exists(name):
+        return
+
+    try:
+        cached_tinv.load(name)
+    except IOError as e:
+        raise bbb_error("Cannot read tinv cache '"+name+"': "+e.strerror+".")
+    except ValueError:
+        print >> log, "WARNING: '"+name+"' is not a tinv cache, ignoring "+\
+              "the rest of it."
+
+def save_tinv_cache(name):
+    try:
+        cached_tinv.save(name)
+    except IOError as e:
+        raise bbb_error("Cannot write tinv cache '"+name+"': "+\
+                        e.strerror+".")
+
+###############################################################################
+# Column cache (--column-cache)
+#
+# The cache holds the columns of the input files, before any classification or
+# filter is applied, and the messages and comments from parsing them. It is
+# keyed by the size, modification time and SHA-1 of each input file.
+
+CACHE_VERSION = 1
+
+# Returns (size, modification time, SHA-1) of an input file.
+def input_fingerprint(name, reader):
+    checksum = sha1()
+
+    for chunk in reader.chunks(0):
+        checksum.update(chunk)
+
+    info = stat(name)
+
+    return (info.st_size, info.st_mtime, checksum.hexdigest())
+
+# Returns (columns, messages, comments) from the cache, or None if there is no
+# cache or it was saved for different input files.
+def load_column_cache(name, cache_key, variables):
+    if not exists(name):
+        return None
+
+    cache = np.load(name)
+
+    try:
+        if cache_key != cache["key"].tolist():
+            return None
+
+        columns = []
+
+        for x in range(variables):
+            c = column()
+            c.load(cache["kind_"+str(x)], cache["data_"+str(x)],
+                   cache["uniques_"+str(x)])
+            columns.append(c)
+
+        return (columns, cache["messages"].tolist(),
+                cache["comments"].tolist())
+    finally:
+        cache.close()
+
+def save_column_cache(name, cache_key, columns, messages, comments):
+    arrays = {
+        "key": np.array(cache_key),
+        "messages": np.array(messages, 'S'),
+        "comments": np.array(comments, 'S')
+    }
+
+    for (x, c) in enumerate(columns):
+        (arrays["kind_"+str(x)], arrays["data_"+str(x)],
+         arrays["uniques_"+str(x)]) = c.arrays()
+
+    # Replace the old cache only once the new one is complete.
+    cache_file = open(name + ".tmp", 'wb')
+    np.savez(cache_file, **arrays)
+    cache_file.close()
+
+    rename(name + ".tmp", name)
+
+###############################################################################
+# Parse data
+#
+# The data of each input file is split into chunks, and each chunk is parsed
+# and grouped into a partial state, either in this process or in a process pool
+# (--jobs). The partial states are merged in the order of the files and the
+# chunks, so the result does not depend on the number of jobs.
+
+# (aggregator, input files) of the running postprocess(). The workers of its
+# process pool are forked once this is set, so they share the legend, the
+# indices and the memory maps of the inputs.
+pool_context = None
+
+# Returns (aggregator.parse_chunk() for a span, (index of the input file, begin,
+# end), totals of the profiler of the aggregator for the span). Runs in the
+# workers of the process pool.
+def parse_span(span):
+    (agg, input_data) = pool_context
+    (index, begin, end) = span
+    agg.profiler.clear()
+    result = agg.parse_chunk(input_data[index].data[begin:end])
+    return (result, agg.profiler.totals())
+
+# Yields the results of aggregator.parse_chunk() from the results of
+# parse_span(), and adds the totals of the workers' profilers to profiler.
+def span_results(results, profiler):
+    for (result, totals) in results:
+        profiler.add(totals)
+        yield result
+
+# Yields (index of the input file, begin, end) for every chunk of every file.
+def input_spans(input_data, parse_begins, parse_ends):
+    for (index, reader) in enumerate(input_data):
+        for (begin, end) in reader.spans(parse_begins[index],
+                                         parse_ends[index]):
+            yield (index, begin, end)
+
+# Returns the aggregator for the input files, with the records of every input
+# file grouped. Preserved comments are written to comment_output. The phases
+# are measured by profiler (see bbb_profile).
+def parse_inputs(input_names, input_data, comment_output, options, log,
+                 profiler=bbb_profile.NULL_PROFILER):
+    global pool_context
+
+    columnar = options.columnar or options.column_cache is not None
+
+    # The legend phase covers the next two sections.
+    profiler.enter("legend")
+
+    ###########################################################################
+    # Parse the legend, and check that the other input files declare the same
+    # variables
+
+    (header, data_offset) = input_data[0].header()
+
+    legend = bbb_legend.legend(header)
+
+    data_offsets = [data_offset]
+
+    for (name, reader) in zip(input_names, input_data)[1:]:
+        (other_header, data_offset) = reader.header()
+
+        if declarations(other_header) != legend.declarations:
+            raise bbb_error("The variable declarations of '"+name+"' do not "+\
+                            "match those of '"+input_names[0]+"'.")
+
+        data_offsets.append(data_offset)
+
+    ###########################################################################
+    # Parse variable classifications and filters
+
+    if options.variable_classifications is not None:
+        for vc in options.variable_classifications:
+            legend.classify(vc)
+
+    inclusive_filters = [legend.parse_filter(fi, "inclusive filter (-i)")
+                         for fi in options.inclusive_filters or ()]
+
+    exclusive_filters = [legend.parse_filter(fi, "exclusive filter (-o)")
+                         for fi in options.exclusive_filters or ()]
+
+    agg = aggregator(legend, inclusive_filters, exclusive_filters,
+                     options.streaming, columnar, options.bootstrap,
+                     options.resamples, options.seed, options.robust,
+                     options.trim, options.reject, options.reject_threshold,
+                     None if options.percentiles is None else
+                     parse_percentiles(options.percentiles))
+
+    agg.profiler = profiler
+
+    profiler.exit()
+
+    ###########################################################################
+    # Load the state saved by the last incremental run (--incremental)
+
+    # Offsets of the data of each input file to parse.
+    parse_begins = list(data_offsets)
+    parse_ends = [None] * len(input_data)
+
+    if options.incremental is not None:
+        state_key = (STATE_VERSION, legend.declarations,
+                     options.variable_classifications,
+                     options.inclusive_filters, options.exclusive_filters,
+                     options.streaming, columnar)
+
+        # The last line may still be being written.
+        parse_ends = [max(reader.end_of_complete_lines(), data_offset)
+                      for (reader, data_offset)
+                      in zip(input_data, data_offsets)]
+
+        with profiler.phase("load state"):
+            state = load_state(options.incremental, state_key, input_names,
+                               input_data, data_offsets, log)
+
+        if state is not None:
+            if columnar:
+                agg.cells = state["cells"]
+            else:
+                agg.master = state["master"]
+
+            for (input_name, end, checksum) in state["inputs"]:
+                parse_begins[input_names.index(input_name)] = end
+
+    ###########################################################################
+    # Load the columns cached by an earlier run (--column-cache)
+
+    # Messages and preserved comments from parsing the data.
+    parse_messages = []
+    parse_comments = []
+
+    if options.column_cache is not None:
+        cache_key = repr((CACHE_VERSION, [input_fingerprint(name, reader)
+                          for (name, reader) in zip(input_names, input_data)]))
+
+        with profiler.phase("load cache"):
+            cache = load_column_cache(options.column_cache, cache_key,
+                                      len(legend))
+
+        if cache is not None:
+            (agg.columns, parse_messages, parse_comments) = cache
+
+            for message in parse_messages:
+                print >> log, message
+
+            for comment in parse_comments:
+                print >> comment_output, comment + "\n", 
+
+    ###########################################################################
+    # Parse data
+
+    if agg.columns is not None:
+        # Cached columns need no parsing.
+        spans = []
+    else:
+        spans = input_spans(input_data, parse_begins, parse_ends)
+
+    pool = None
+
+    # Without a pool, samples can be appended straight to the master
+    # dictionary (or the cells), which is what merging would do. Accumulators
+    # are merged instead of appended to in every case, as the two are not
+    # exactly equivalent.
+    direct = None
+
+    if 1 < options.jobs:
+        pool_context = (agg, input_data)
+        pool = Pool(options.jobs)
+        partials = span_results(pool.imap(parse_span, spans), profiler)
+    else:
+        if columnar:
+            direct = agg.cells
+        elif not options.streaming:
+            direct = agg.master
+
+        partials = imap(lambda (index, begin, end): agg.parse_chunk(
+                            input_data[index].data[begin:end], direct), spans)
+
+    # Without a pool, the parse phase is the time spent outside of the phases
+    # of aggregator.parse_chunk(); with a pool, it is mostly the time spent
+    # waiting for the workers.
+    profiler.enter("parse")
+
+    try:
+        for (partial, messages, comments, error) in partials:
+            for message in messages:
+                print >> log, message
+
+            for comment in comments:
+                print >> comment_output, comment + "\n", 
+
+            parse_messages.extend(messages)
+            parse_comments.extend(comments)
+
+            if error is not None:
+                if pool is not None:
+                    pool.terminate()
+                    pool = None
+                raise bbb_error(error)
+
+            if partial is not direct:
+                with profiler.phase("merge"):
+                    agg.merge(partial)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        pool_context = None
+
+    profiler.exit()
+
+    ###########################################################################
+    # Save the state for the next incremental run (--incremental)
+
+    if options.incremental is not None:
+        profiler.enter("save state")
+
+        save_state(options.incremental, {
+            "key": state_key,
+            "inputs": [(name, end, input_checksum(reader, data_offset, end))
+                       for (name, reader, data_offset, end)
+                       in zip(input_names, input_data, data_offsets,
+                              parse_ends)],
+            "master": agg.master,
+            "cells": agg.cells
+        })
+
+        profiler.exit()
+
+    ###########################################################################
+    # Convert the cells (for columnar ingestion)
+
+    if columnar and agg.columns is None:
+        # The cache must hold every record, but otherwise records can be
+        # dropped before their cells are converted.
+        agg.build_columns(keep_all=options.column_cache is not None)
+
+        if options.column_cache is not None:
+            with profiler.phase("save cache"):
+                save_column_cache(options.column_cache, cache_key,
+                                  agg.columns, parse_messages, parse_comments)
+
+    return agg
+
+###############################################################################
+
+# Post-processes the .bbb files named by input_names, whose records are merged:
+# writes the average, standard deviation and confidence interval of each DEP
+# for each group of records with the same CTLs and INDs to output_data, as text
+# or, with options.binary, as gnuplot binary data, and the gnuplot column
+# indices of the variables to output_header. Messages are printed to log.
+#
+# Returns (legend, groups, statistics), where groups is a sorted list of
+# datasets, (CTL key, [(CTL and IND key, [number of samples of each DEP])]),
+# and statistics maps the index of each DEP to a tuple with the statistics of
+# each group, in order: the average, standard deviation and confidence
+# interval, then the bootstrap bounds with options.bootstrap.
+#
+# With options.profile or options.profile_json, reports the time of each phase
+# (see bbb_profile) to standard error or to the file, and with
+# options.cprofile, writes the statistics of cProfile to the file.
+#
+# Raises bbb_error for invalid options or input files.
+def postprocess(input_names, output_data, output_header, options=None,
+                log=stdout):
+    if options is None:
+        options = postprocess_options()
+
+    check_options(options)
+
+    if options.profile or options.profile_json is not None:
+        profiler = bbb_profile.profiler()
+    else:
+        profiler = bbb_profile.NULL_PROFILER
+
+    if options.cprofile is not None:
+        cprofile = Profile()
+
+        try:
+            result = cprofile.runcall(process, input_names, output_data,
+                                      output_header, options, log, profiler)
+        finally:
+            cprofile.dump_stats(options.cprofile)
+    else:
+        result = process(input_names, output_data, output_header, options,
+                         log, profiler)
+
+    if profiler is not bbb_profile.NULL_PROFILER:
+        profiler.stop()
+
+        if options.profile_json is not None:
+            profile_file = open(options.profile_json, 'w')
+            profiler.write_json(profile_file)
+            profile_file.close()
+        else:
+            profiler.write(stderr)
+
+    return result
+
+# Does the work of postprocess(), measuring the phases with profiler.
+def process(input_names, output_data, output_header, options, log, profiler):
+    tinv_hits = cached_tinv.hits
+    tinv_misses = cached_tinv.misses
+
+    input_data = []
+
+    try:
+        for name in input_names:
+            try:
+                input_data.append(chunked_reader(name))
+            except IOError as e:
+                raise bbb_error("Cannot read input file '"+name+"': "+\
+                                e.strerror+".")
+
+        # Binary data cannot hold comments.
+        if options.binary:
+            comment_output = output_header
+        else:
+            comment_output = output_data
+
+        agg = parse_inputs(input_names, input_data, comment_output, options,
+                           log, profiler)
+    finally:
+        for reader in input_data:
+            reader.close()
+
+    with profiler.phase("group"):
+        groups = agg.group()
+
+    with profiler.phase("sample size"):
+        sample_size = agg.sample_size(groups, log)
+
+    # The legend describes the statistics by the number of samples of the
+    # groups, so there must be some.
+    if sample_size is None:
+        if options.inclusive_filters or options.exclusive_filters:
+            raise bbb_error("No records matched the filters (-i, -o).")
+
+        raise bbb_error("The input files have no records.")
+
+    stat_columns = agg.stat_columns
+
+    profiler.enter("write")
+
+    write_legend(output_data, output_header, agg.legend, sample_size,
+                 stat_columns, options.binary)
+
+    profiler.exit()
+
+    if options.tinv_cache is not None:
+        with profiler.phase("load tinv cache"):
+            load_tinv_cache(options.tinv_cache, log)
+
+    loaded_tinv_misses = cached_tinv.misses
+
+    profiler.enter("statistics")
+
+    # Bootstrap resamples are drawn in a process pool.
+    if 1 < options.jobs and options.bootstrap is not None:
+        pool = Pool(options.jobs)
+
+        try:
+            dep_stats = agg.statistics(pool.map)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        dep_stats = agg.statistics()
+
+    profiler.exit()
+
+    if options.tinv_cache is not None and \
+       loaded_tinv_misses != cached_tinv.misses:
+        with profiler.phase("save tinv cache"):
+            save_tinv_cache(options.tinv_cache)
+
+    profiler.enter("write")
+
+    if options.binary:
+        write_binary(output_data, output_header, agg.legend, groups,
+                     dep_stats, stat_columns)
+    else:
+        write_data(output_data, agg.legend, groups, dep_stats, stat_columns)
+
+    if options.npz is not None:
+        write_npz(options.npz, agg.legend, groups, dep_stats, stat_columns)
+
+    if options.jsonl is not None:
+        jsonl_file = open(options.jsonl, 'w')
+        write_jsonl(jsonl_file, agg.legend, groups, dep_stats, stat_columns)
+        jsonl_file.close()
+
+    profiler.exit()
+
+    if options.significance is not None:
+        with profiler.phase("significance"):
+            write_significance(options.significance, agg, groups,
+                               options.mann_whitney)
+
+    profiler.set("datasets", len(groups))
+    profiler.set("groups", sum(len(dataset) for (key, dataset) in groups))
+    profiler.set("samples", sum(sum(counts) for (key, dataset) in groups
+                                for (iv, counts) in dataset))
+    profiler.set("tinv_hits", cached_tinv.hits - tinv_hits)
+    profiler.set("tinv_misses", cached_tinv.misses - tinv_misses)
+
+    return (agg.legend, groups, dep_stats)
+
+# Runs postprocess() as postprocess_bbb.py does, for its options and arguments:
+# input-data, and optionally output-data and output-gnuplot-header. Without
+# them, the output files are named after the input files.
+def postprocess_args(options, args, log=stdout):
+    assert len(args) == 1 or len(args) == 3
+
+    check_options(options)
+
+    input_names = expand_input(args[0])
+
+    if options.merge_inputs is not None:
+        for mi in options.merge_inputs:
+            input_names.extend(expand_input(mi))
+
+    if len(args) == 1:
+        prefix = output_prefix(input_names)
+
+        if options.binary:
+            output_names = ("post_"+prefix+".bin", "post_"+prefix+".gpi")
+        else:
+            output_names = ("post_"+prefix+".bbb", "post_"+prefix+".gpi")
+    else:
+        output_names = (args[1], args[2])
+
+    if options.binary:
+        output_data = open(output_names[0], 'wb')
+    else:
+        output_data = open(output_names[0], 'w')
+    output_header = open(output_names[1], 'w')
+
+    try:
+        return postprocess(input_names, output_data, output_header, options,
+                           log)
+    finally:
+        output_data.close()
+        output_header.close()
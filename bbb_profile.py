@@ -0,0 +1,242 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from time import time
+
+from json import dumps
+
+from collections import OrderedDict
+
+from resource import getrusage, RUSAGE_SELF, RUSAGE_CHILDREN
+
+# Returns the CPU time (user and system) used by this process, or by its
+# children that have been waited for, in seconds.
+def cpu_time(who=RUSAGE_SELF):
+    usage = getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+# Returns the peak resident set size of this process, or of the largest of its
+# children that have been waited for, in kilobytes.
+def peak_rss(who=RUSAGE_SELF):
+    return getrusage(who).ru_maxrss
+
+# A phase of a profiler, used as a context manager.
+class phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.profiler.exit()
+        return False
+
+# Measures the wall and CPU time of each phase of post-processing, and counts
+# things (rows, bytes, ...) along the way.
+#
+# Phases can be nested; the time of a phase does not include the time of the
+# phases within it, so the times of all the phases add up to the time spent in
+# any of them. Phases with the same name are added up.
+class profiler:
+    phases = None   # Maps the name of each phase to [wall, CPU, calls]
+    counters = None # Maps the name of each counter to its count
+    stack = None    # [name, wall, CPU, inner wall, inner CPU] of open phases
+
+    start_wall = None
+    start_cpu = None
+    start_children_cpu = None
+    stop_wall = None
+    stop_cpu = None
+    stop_children_cpu = None
+
+    def __init__(self):
+        self.clear()
+
+        self.start_wall = time()
+        self.start_cpu = cpu_time()
+        self.start_children_cpu = cpu_time(RUSAGE_CHILDREN)
+
+    # Forgets the phases and counters.
+    def clear(self):
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self.stack = []
+
+    # Returns a context manager that measures a phase.
+    def phase(self, name):
+        return phase(self, name)
+
+    def enter(self, name):
+        self.stack.append([name, time(), cpu_time(), 0.0, 0.0])
+
+    def exit(self):
+        (name, wall, cpu, inner_wall, inner_cpu) = self.stack.pop()
+
+        wall = time() - wall
+        cpu = cpu_time() - cpu
+
+        totals = self.phases.get(name)
+
+        if totals is None:
+            totals = self.phases[name] = [0.0, 0.0, 0]
+
+        totals[0] += wall - inner_wall
+        totals[1] += cpu - inner_cpu
+        totals[2] += 1
+
+        if self.stack:
+            self.stack[-1][3] += wall
+            self.stack[-1][4] += cpu
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    # Returns (phases, counters), which can be added to another profiler with
+    # add(), e.g. to add up the work done in a process pool.
+    def totals(self):
+        return (self.phases, self.counters)
+
+    def add(self, totals):
+        if totals is None:
+            return
+
+        (phases, counters) = totals
+
+        for (name, (wall, cpu, calls)) in phases.iteritems():
+            mine = self.phases.get(name)
+
+            if mine is None:
+                self.phases[name] = [wall, cpu, calls]
+            else:
+                mine[0] += wall
+                mine[1] += cpu
+                mine[2] += calls
+
+        for (name, n) in counters.iteritems():
+            self.count(name, n)
+
+    # Stops the clocks of the whole run.
+    def stop(self):
+        self.stop_wall = time()
+        self.stop_cpu = cpu_time()
+        self.stop_children_cpu = cpu_time(RUSAGE_CHILDREN)
+
+    # Returns the profile as a dictionary:
+    #
+    #   phases               [{name, wall, cpu, calls}] in the order in which
+    #                        they were first entered.
+    #   wall, cpu            The wall and CPU time of the whole run.
+    #   children_cpu         The CPU time of the child processes (e.g. of -j).
+    #   rows_per_second      The counters rows and bytes over the wall time of
+    #   bytes_per_second     the whole run, if they were counted.
+    #   peak_rss_kb          The peak resident set size of this process, and
+    #   children_peak_rss_kb of the largest child process.
+    #
+    # and the counters, by name.
+    def report(self):
+        if self.stop_wall is None:
+            self.stop()
+
+        wall = self.stop_wall - self.start_wall
+
+        report = OrderedDict()
+
+        report["phases"] = [OrderedDict([("name", name), ("wall", w),
+                                         ("cpu", c), ("calls", calls)])
+                            for (name, (w, c, calls))
+                            in self.phases.iteritems()]
+
+        report["wall"] = wall
+        report["cpu"] = self.stop_cpu - self.start_cpu
+        report["children_cpu"] = self.stop_children_cpu - \
+                                 self.start_children_cpu
+
+        report.update(self.counters)
+
+        for name in ("rows", "bytes"):
+            if name in self.counters:
+                report[name + "_per_second"] = \
+                    self.counters[name] / wall if 0 < wall else None
+
+        report["peak_rss_kb"] = peak_rss()
+        report["children_peak_rss_kb"] = peak_rss(RUSAGE_CHILDREN)
+
+        return report
+
+    # Writes the profile (see report()) to output as a table.
+    def write(self, output):
+        report = self.report()
+
+        print >> output, "%-24s %12s %12s %10s" % ("Phase", "Wall (s)",
+                                                   "CPU (s)", "Calls")
+
+        for p in report["phases"]:
+            print >> output, "%-24s %12.6f %12.6f %10d" % \
+                (p["name"], p["wall"], p["cpu"], p["calls"])
+
+        print >> output, "%-24s %12.6f %12.6f" % ("total", report["wall"],
+                                                  report["cpu"])
+
+        if 0 < report["children_cpu"]:
+            print >> output, "%-24s %12s %12.6f" % ("child processes", "",
+                                                    report["children_cpu"])
+
+        for (name, value) in report.iteritems():
+            if name in ("phases", "wall", "cpu", "children_cpu"):
+                continue
+
+            if isinstance(value, float):
+                print >> output, "%-24s %12.1f" % (name, value)
+            elif value is not None:
+                print >> output, "%-24s %12d" % (name, value)
+
+    # Writes the profile (see report()) to output as JSON.
+    def write_json(self, output):
+        print >> output, dumps(self.report(), indent=2)
+
+# A profiler that measures nothing, for when profiling is off.
+class null_profiler:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return False
+
+    def clear(self):
+        pass
+
+    def phase(self, name):
+        return self
+
+    def enter(self, name):
+        pass
+
+    def exit(self):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def totals(self):
+        return None
+
+    def add(self, totals):
+        pass
+
+NULL_PROFILER = null_profiler()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from os import fstat
+
+from mmap import mmap, ACCESS_READ
+
+# Default size of the chunks handed out by chunked_reader, in bytes.
+CHUNK_SIZE = 1024 * 1024
+
+# Reads a .bbb file through a read-only memory map. The header (the comments
+# and variable declarations before the first record) is read line by line, and
+# the rest of the file is handed out in large chunks that always end at a
+# newline (or at the end of the file), so no line is ever split across chunks.
+class chunked_reader:
+    name = None
+    file = None
+    data = None
+    size = 0
+
+    def __init__(self, name):
+        self.name = name
+        self.file = open(name, 'rb')
+        self.size = fstat(self.file.fileno()).st_size
+
+        # Empty files cannot be mapped.
+        if 0 == self.size:
+            self.data = ""
+        else:
+            self.data = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+
+    def close(self):
+        if 0 != self.size:
+            self.data.close()
+        self.file.close()
+
+    # Returns the offset of the end of the line that starts at begin (after
+    # its newline, if any).
+    def end_of_line(self, begin):
+        end = self.data.find('\n', begin)
+        return self.size if -1 == end else end + 1
+
+    # Returns the offset of the end of the last complete line (after its
+    # newline), or 0 if there is none.
+    def end_of_complete_lines(self):
+        return self.data.rfind('\n') + 1
+
+    # Returns (lines, offset): the lines of the header, without their
+    # newlines, and the offset of the first record. The header is every line
+    # before the first one that is neither blank nor starts with a '#'.
+    def header(self):
+        lines = []
+        begin = 0
+
+        while begin < self.size:
+            end = self.end_of_line(begin)
+            line = self.data[begin:end]
+
+            stripped = line.strip()
+            if 0 != len(stripped) and '#' != stripped[0]:
+                break
+
+            lines.append(line.rstrip('\n'))
+            begin = end
+
+        return (lines, begin)
+
+    # Yields the offsets (begin, end) of chunks of the file from begin to end
+    # (by default, the end of the file), which are about chunk_size bytes
+    # long and end at a newline.
+    def spans(self, begin, end=None, chunk_size=CHUNK_SIZE):
+        if end is None:
+            end = self.size
+
+        while begin < end:
+            if begin + chunk_size >= end:
+                split = end
+            else:
+                split = min(self.end_of_line(begin + chunk_size - 1), end)
+
+            yield (begin, split)
+
+            begin = split
+
+    # Yields the chunks of the file from begin to end (see spans()).
+    def chunks(self, begin, end=None, chunk_size=CHUNK_SIZE):
+        for (b, e) in self.spans(begin, end, chunk_size):
+            yield self.data[b:e]
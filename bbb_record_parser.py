@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from re import compile as regex_compile
+
+# We take a single line as an input, and need to produce a tuple of cells. The
+# input contains NO new lines and is NOT empty (so we assume it has at least
+# one cell). The delimiter between cells is whitespace and multiple whitespace
+# characters are collapsed. Cells which begin and end with quotations are
+# strings and may contain whitespace.
+#
+# Precondition: line has been strip()'d and is not an empty string
+class record_parser:
+    engine = None
+
+    # Characters the grammar treats as whitespace (see whitespace_rule).
+    whitespace = ' \t\r\n'
+
+    ###########################################################################
+    # Grammar
+
+    def __init__(self):
+        # Parse a quote character.
+        quote_rule = r'["]'
+
+        # Parse a non-quote character or a quote character preceded by a
+        # backslash.
+        non_quote_rule = r'(?:[^"]|(?:\"))'
+
+        # Parse a string cell.
+        string_rule = quote_rule + non_quote_rule + r'*' + quote_rule
+
+        # Parse a whitespace character.
+        whitespace_rule = r'[ \t\r\n]'
+
+        # Parse a non-whitespace character.
+        non_whitespace_rule = r'[^ \t\r\n]'
+        
+        # Parse a cell.
+        cell_rule = r'(?:' + string_rule + r')'            \
+                  + r'|(?:' + non_whitespace_rule + r'+)'
+
+        # Parse a record
+        record_rule = r'(' + cell_rule + r')'           \
+                    + r'(?:(?:' + whitespace_rule + r'+)|$)'
+
+        self.engine = regex_compile(record_rule) 
+
+    ###########################################################################
+
+    # Every match of the grammar ends after a run of whitespace or at the end
+    # of the line, so once the line starts with a cell, successive matches are
+    # exactly what a single findall() scan returns.
+    #
+    # Lines without quotes only contain non-whitespace cells, which str.split()
+    # produces directly, as long as the line has none of the characters that
+    # str.split() considers whitespace but the grammar does not (\v and \f).
+    def __call__(self, line):
+        # A line that is empty or starts with whitespace has no cells.
+        assert line[:1] not in self.whitespace
+
+        if '"' in line or '\v' in line or '\f' in line:
+            record = self.engine.findall(line)
+        else:
+            record = line.split()
+
+        assert len(record) is not 0
+
+        return record
+
+    ###########################################################################
+
+    # Tokenizes a chunk of whole lines at once: each line is strip()'d and
+    # blank lines are skipped. Returns the records of the lines, or None if
+    # the chunk has lines that must be handled one at a time: comments, or
+    # lines with \v or \f (which strip() removes but the grammar does not).
+    def parse_lines(self, chunk):
+        if '#' in chunk or '\v' in chunk or '\f' in chunk:
+            return None
+
+        if '"' not in chunk:
+            return [r for r in (line.split() for line in chunk.split('\n')) if r]
+
+        findall = self.engine.findall
+
+        records = []
+
+        for line in chunk.split('\n'):
+            line = line.strip()
+
+            if 0 == len(line):
+                continue
+
+            if '"' in line:
+                records.append(findall(line))
+            else:
+                records.append(line.split())
+
+        return records
+
+###############################################################################
+
+parse_record = record_parser() 
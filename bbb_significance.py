@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+import numpy as np
+
+from statistics import stats_batch, welch_batch, mann_whitney_batch, \
+                       size_batches, packed_groups
+
+from bbb_legend import CTL, IND, DEP
+
+from bbb_writer import dataset_titles, key_array
+
+# Number of values (test results, or samples for Mann-Whitney U tests) that
+# are handled at once, which bounds the memory used by the tests.
+SIGNIFICANCE_BATCH_VALUES = 1 << 20
+
+# Returns (positions, keys, table) for the groups of each dataset, in the order
+# of group(): the positions of the INDs in the CTL and IND key of a group, the
+# distinct IND keys of the groups (tuples of IND values in legend order),
+# sorted, and a 2D array with the index of the group of each dataset (row) at
+# each IND key (column), or -1 if the dataset has no group there.
+def align_groups(legend, groups):
+    civars = legend.indices([CTL, IND])
+
+    positions = [x for (x, i) in enumerate(civars.indices)
+                   if IND == legend[i].vtype]
+
+    dataset_keys = [[tuple(iv[x] for x in positions)
+                     for (iv, counts) in dataset]
+                    for (key, dataset) in groups]
+
+    keys = sorted(set(k for ks in dataset_keys for k in ks))
+    columns = dict((k, x) for (x, k) in enumerate(keys))
+
+    table = np.empty((len(groups), len(keys)), np.intp)
+    table.fill(-1)
+
+    group_index = 0
+
+    for (d, ks) in enumerate(dataset_keys):
+        for k in ks:
+            table[d, columns[k]] = group_index
+            group_index = group_index + 1
+
+    return (positions, keys, table)
+
+# Returns (average, variance, count) arrays for the samples of each group (see
+# aggregator.samples()), followed by a missing group (NaN average and no
+# samples), which index -1 refers to.
+def moments(samples):
+    if isinstance(samples, packed_groups):
+        count = samples.counts
+        average, median, stdev, min, max, confidence = stats_batch(samples)
+    else:
+        count = np.array([len(s) for s in samples], np.intp)
+        stats = [s.stats() for s in samples]
+        average = np.array([x[0] for x in stats], np.float64)
+        stdev = np.array([x[2] for x in stats], np.float64)
+
+    return (np.append(average, np.nan), np.append(stdev * stdev, np.nan),
+            np.append(count, 0))
+
+# Returns the names and arrays of the significance tests between every pair of
+# datasets, at each IND key they share, for each DEP:
+#
+#   FIRST, SECOND        The datasets of each pair (FIRST < SECOND), in the
+#                        order of the datasets in the output data.
+#   DATASET_TITLES       The title of each dataset.
+#   TAG                  The values of each IND at each IND key.
+#   TAG_WELCH_T          For each DEP, Welch's t, its degrees of freedom and
+#   TAG_WELCH_DF         the two-sided p-value, with one row per pair and one
+#   TAG_WELCH_P          column per IND key (NaN where a dataset lacks the key
+#                        or the test is undefined).
+#   TAG_MWU_U            For each DEP, the Mann-Whitney U of FIRST and the
+#   TAG_MWU_P            two-sided p-value, if mann_whitney is true.
+#
+# The pairs are those of the condensed distance matrices of
+# scipy.spatial.distance, so a row of any array can be turned into a matrix
+# with squareform().
+def significance_arrays(agg, groups, mann_whitney=False):
+    legend = agg.legend
+
+    (positions, keys, table) = align_groups(legend, groups)
+
+    (first, second) = np.triu_indices(len(groups), 1)
+
+    names = ["FIRST", "SECOND", "DATASET_TITLES"]
+    arrays = [first.astype(np.int64), second.astype(np.int64)]
+
+    titles = dataset_titles(legend, groups)
+
+    if titles is None:
+        titles = [""] * len(groups)
+
+    arrays.append(np.array(titles, 'S'))
+
+    civars = legend.indices([CTL, IND])
+
+    for (x, p) in enumerate(positions):
+        names.append(legend[civars.indices[p]].tag)
+        arrays.append(key_array(keys, x))
+
+    # Pairs of datasets whose tests are computed at once.
+    step = max(1, SIGNIFICANCE_BATCH_VALUES // max(1, len(keys)))
+
+    for i in legend.indices([DEP]).indices:
+        tag = legend[i].tag
+
+        samples = agg.samples(i)
+
+        (average, variance, count) = moments(samples)
+
+        results = [np.empty((len(first), len(keys)))
+                   for x in range(5 if mann_whitney else 3)]
+
+        for r in results:
+            r.fill(np.nan)
+
+        for begin in range(0, len(first), step):
+            end = min(begin + step, len(first))
+
+            a = table[first[begin:end]]
+            b = table[second[begin:end]]
+
+            for (r, x) in zip(results, welch_batch(average[a], variance[a],
+                                                   count[a], average[b],
+                                                   variance[b], count[b])):
+                r[begin:end] = x
+
+            if not mann_whitney:
+                continue
+
+            # Only test the IND keys that both datasets have, a few of similar
+            # sizes at a time, as the samples of each are padded to the
+            # largest of them.
+            (pair, column) = np.nonzero((0 <= a) & (0 <= b))
+            sizes = np.maximum(count[a[pair, column]], count[b[pair, column]])
+
+            for tests in size_batches(sizes, SIGNIFICANCE_BATCH_VALUES // 2):
+                (p, c) = (pair[tests], column[tests])
+
+                (u, pvalue) = mann_whitney_batch(samples[a[p, c]],
+                                                 samples[b[p, c]])
+
+                # The samples are padded with NaN, so mann_whitney_batch()
+                # would skip NaN samples; those groups have a NaN average.
+                undefined = np.isnan(average[a[p, c]]) | \
+                            np.isnan(average[b[p, c]])
+                u[undefined] = np.nan
+                pvalue[undefined] = np.nan
+
+                results[3][begin + p, c] = u
+                results[4][begin + p, c] = pvalue
+
+        names.extend([tag + "_WELCH_T", tag + "_WELCH_DF", tag + "_WELCH_P"])
+
+        if mann_whitney:
+            names.extend([tag + "_MWU_U", tag + "_MWU_P"])
+
+        arrays.extend(results)
+
+    return (names, arrays)
+
+# Writes the significance tests between every pair of datasets (see
+# significance_arrays()) to a compressed NumPy .npz file.
+def write_significance(name, agg, groups, mann_whitney=False):
+    (names, arrays) = significance_arrays(agg, groups, mann_whitney)
+
+    # savez_compressed() would add .npz to the name.
+    npz_file = open(name, 'wb')
+    np.savez_compressed(npz_file, **dict(zip(names, arrays)))
+    npz_file.close()
@@ -0,0 +1,393 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+import numpy as np
+
+from math import isinf, isnan
+
+from json import dumps
+
+from operator import itemgetter
+
+from bbb_legend import CTL, IND, DEP, vtype_to_str, try_remove_quotes
+
+# Given a collection of equal-length sequences, this algorithm finds the set of
+# indices which refer to elements that are NOT equal in each sequence.
+def find_distinguishing_variables(datasets):
+    assert bool(datasets) # Check for emptiness
+
+    cvars_len = len(datasets[0])
+
+    dist_vars = []
+
+    for cvar in range(0, cvars_len):
+        different = False
+        last_value = None
+        for ds in range(0, len(datasets)-1):
+            assert len(datasets[ds])   == cvars_len
+            assert len(datasets[ds+1]) == cvars_len
+
+            if datasets[ds][cvar] != datasets[ds+1][cvar]:
+                different = True
+                break
+            else:
+                last_value = datasets[ds][cvar]
+
+        if different:
+            dist_vars.append(cvar)
+
+    return dist_vars
+
+###############################################################################
+# Print the legend for the output data file and generate the GPI header
+
+# Returns (data lines, header lines): the variable declarations of the output
+# data file and the gnuplot column index of each of its variables.
+#
+# stat_columns lists the statistics of each DEP in the output data, (tag
+# suffix, description), e.g. ("AVG", "Average of {samples:d} Samples"). The
+# descriptions are formatted with the sample size.
+def legend_lines(legend, sample_size, stat_columns):
+    data_lines = []
+    header_lines = []
+
+    post_index = 0 
+
+    for (vindex, v) in sorted(legend.iteritems()):
+        assert CTL == v.vtype or IND == v.vtype or DEP == v.vtype
+
+        # For CTLs and INDs, we do no post-processing
+        if CTL == v.vtype or IND == v.vtype:
+            # FIXME: The only place we use this, we do i0 + 1, so shouldn't we
+            # just add 1 here? 
+            i0 = post_index
+
+            data_lines.append('## %s:%s:%s:%s' \
+                % (vtype_to_str(v.vtype), v.tag, v.name, v.units))
+
+            # The column indices in gnuplot start at 1, not 0 
+            header_lines.append('%s="%i"' % (v.tag, i0 + 1))
+
+            post_index = post_index + 1
+
+        else:
+            for (suffix, description) in stat_columns:
+                description = description.format(samples=sample_size)
+
+                data_lines.append('## %s:%s_%s:%s - %s:%s' \
+                    % (vtype_to_str(v.vtype), v.tag, suffix, v.name,
+                       description, v.units))
+
+                header_lines.append('%s_%s="%i"' \
+                    % (v.tag, suffix, post_index + 1))
+
+                post_index = post_index + 1
+
+    return (data_lines, header_lines)
+
+def write_lines(output, lines):
+    if lines:
+        output.write("\n".join(lines) + "\n")
+
+# For binary output data, the variable declarations are written to the GPI
+# header as comments.
+def write_legend(output_data, output_header, legend, sample_size, stat_columns,
+                 binary=False):
+    (data_lines, header_lines) = legend_lines(legend, sample_size,
+                                              stat_columns)
+
+    if binary:
+        write_lines(output_header, ["# " + x for x in data_lines])
+    else:
+        write_lines(output_data, data_lines)
+
+    write_lines(output_header, header_lines)
+
+###############################################################################
+# Print the output data set
+#
+# groups is a sorted list of datasets, (CTL key, [(CTL and IND key, [number of
+# samples of each DEP])]), and dep_stats maps each DEP to a tuple with the
+# statistics of each group (see legend_lines()), in order.
+
+# Returns the title of each dataset, which lists the values of the
+# distinguishing control variables (e.g. ones that AREN'T the same for all
+# datasets), or None if there is only one dataset.
+def dataset_titles(legend, groups):
+    cvars = legend.indices([CTL])
+
+    datasets = [key for (key, dataset) in groups]
+
+    if len(datasets) <= 1:
+        return None
+
+    dist_vars = find_distinguishing_variables(datasets)
+
+    titles = []
+
+    for key in datasets:
+        if len(dist_vars) > 1:
+            dist_keys = []
+
+            for x in dist_vars:
+                name  = legend[cvars.indices[x]].name
+                units = legend[cvars.indices[x]].units
+
+                if "" != units:
+                    units = " ["+units+"]"
+
+                dist_keys.append(name+": "+\
+                                 str(try_remove_quotes(key[x]))+units)
+
+            titles.append(", ".join(dist_keys))
+        else:
+            units = legend[cvars.indices[dist_vars[0]]].units
+
+            if "" != units:
+                units = " ["+units+"]"
+
+            titles.append(str(try_remove_quotes(key[dist_vars[0]])) + units)
+
+    return titles
+
+# Returns a function that gives the values of the output variables of a group
+# in legend order, given the CTL and IND key of the group, followed by the
+# statistics of each DEP (of which there are width).
+def row_getter(legend, width):
+    civars = legend.indices([CTL, IND])
+    dvars  = legend.indices([DEP])
+
+    positions = []
+
+    for (i, v) in sorted(legend.iteritems()):
+        if DEP == v.vtype: # Dependent variable
+            x = len(civars.indices) + width * dvars.indices.index(i)
+            positions.extend(range(x, x + width))
+        else: # Independent or control variable
+            positions.append(civars.indices.index(i))
+
+    if 1 >= len(positions):
+        return lambda values: tuple(values[x] for x in positions)
+
+    return itemgetter(*positions)
+
+# Each dataset is written as one block of text, and each row is formatted at
+# once.
+def write_data(output_data, legend, groups, dep_stats, stat_columns):
+    titles = dataset_titles(legend, groups)
+
+    dvars = legend.indices([DEP])
+
+    get_row = row_getter(legend, len(stat_columns))
+
+    row_format = " ".join(["%s"] * (len(legend) + (len(stat_columns) - 1) *
+                                    len(dvars.indices)))
+
+    if dvars.indices:
+        stats = zip(*[dep_stats[i] for i in dvars.indices])
+    else:
+        stats = [()] * sum(len(dataset) for (key, dataset) in groups)
+
+    group_index = 0
+
+    for (d, (key, dataset)) in enumerate(groups):
+        lines = []
+
+        if 0 != d:
+            lines.append("\n")
+
+        if titles is not None:
+            lines.append("\""+titles[d]+"\"")
+
+        # iv is the tuple of CTL and IND values.
+        for (iv, counts) in dataset:
+            values = iv
+
+            for s in stats[group_index]:
+                values = values + s
+
+            lines.append(row_format % get_row(values))
+
+            group_index = group_index + 1
+
+        write_lines(output_data, lines)
+
+###############################################################################
+# Write the output data set as gnuplot binary data
+
+# Returns a gnuplot string literal.
+def gnuplot_string(s):
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+# Writes one record of little-endian float64 values per group, with the same
+# columns as write_data(). Non-numeric CTL and IND values are written as NaN.
+# Each dataset is one block of records, which gnuplot selects with index. The
+# binary keywords to read the data (BINARY), the number of datasets (DATASETS)
+# and their titles (TITLE_0, TITLE_1, ...) are written to the GPI header.
+def write_binary(output_data, output_header, legend, groups, dep_stats,
+                 stat_columns):
+    titles = dataset_titles(legend, groups)
+
+    civars = legend.indices([CTL, IND])
+    dvars  = legend.indices([DEP])
+
+    keys = [iv for (key, dataset) in groups for (iv, counts) in dataset]
+
+    nan = float("nan")
+
+    columns = []
+
+    for (i, v) in sorted(legend.iteritems()):
+        if DEP == v.vtype: # Dependent variable
+            columns.append(np.array(dep_stats[i], np.float64)
+                           .reshape(-1, len(stat_columns)))
+        else: # Independent or control variable
+            x = civars.indices.index(i)
+            columns.append(np.array(
+                [iv[x] if isinstance(iv[x], (int, long, float)) else nan
+                 for iv in keys], np.float64).reshape(-1, 1))
+
+    width = len(legend) + (len(stat_columns) - 1) * len(dvars.indices)
+
+    data = np.empty((len(keys), width), '<f8')
+
+    begin = 0
+
+    for c in columns:
+        data[:, begin:begin + c.shape[1]] = c
+        begin = begin + c.shape[1]
+
+    output_data.write(data.tostring())
+
+    records = ":".join(str(len(dataset)) for (key, dataset) in groups)
+
+    lines = ["BINARY='format=\"%" + str(width) + "float64\" endian=little " +
+             "record=" + records + "'",
+             "DATASETS=" + str(len(groups))]
+
+    if titles is not None:
+        for (d, title) in enumerate(titles):
+            lines.append("TITLE_" + str(d) + "=" + gnuplot_string(title))
+
+    write_lines(output_header, lines)
+
+###############################################################################
+# Write the output data set as NumPy arrays (.npz) or JSON Lines
+
+# Returns the values of the CTL or IND at index x of the CTL and IND keys of
+# the groups: an int64 or float64 array if they are all numbers, or else an
+# array of strings, without their quotes.
+def key_array(keys, x):
+    values = [iv[x] for iv in keys]
+
+    if all(isinstance(v, (int, long)) for v in values):
+        try:
+            return np.array(values, np.int64)
+        except OverflowError:
+            return np.array(values, np.float64)
+
+    if all(isinstance(v, (int, long, float)) for v in values):
+        return np.array(values, np.float64)
+
+    return np.array([str(try_remove_quotes(v)) for v in values], 'S')
+
+# Returns (names, arrays) for the output variables: each CTL and IND is named
+# after its tag, and each DEP has one array per statistic, named like in the
+# text output (e.g. TAG_AVG), plus TAG_N, the number of samples of each group.
+# DATASET is the index of the dataset of each group.
+def output_arrays(legend, groups, dep_stats, stat_columns):
+    civars = legend.indices([CTL, IND])
+    dvars  = legend.indices([DEP])
+
+    keys = [iv for (key, dataset) in groups for (iv, counts) in dataset]
+
+    counts = [c for (key, dataset) in groups for (iv, c) in dataset]
+
+    names = []
+    arrays = []
+
+    for (i, v) in sorted(legend.iteritems()):
+        if DEP == v.vtype: # Dependent variable
+            stats = np.array(dep_stats[i], np.float64) \
+                .reshape(-1, len(stat_columns))
+
+            for (x, (suffix, description)) in enumerate(stat_columns):
+                names.append(v.tag + "_" + suffix)
+                arrays.append(stats[:, x])
+
+            names.append(v.tag + "_N")
+            arrays.append(np.array([c[dvars.indices.index(i)]
+                                    for c in counts], np.int64))
+        else: # Independent or control variable
+            names.append(v.tag)
+            arrays.append(key_array(keys, civars.indices.index(i)))
+
+    names.append("DATASET")
+    arrays.append(np.array([d for (d, (key, dataset)) in enumerate(groups)
+                              for iv in dataset], np.int64))
+
+    return (names, arrays)
+
+# Writes one array per output variable (see output_arrays()), plus
+# DATASET_TITLES, the title of each dataset (empty if there is only one), to an
+# uncompressed .npz file.
+def write_npz(name, legend, groups, dep_stats, stat_columns):
+    (names, arrays) = output_arrays(legend, groups, dep_stats, stat_columns)
+
+    titles = dataset_titles(legend, groups)
+
+    if titles is None:
+        titles = [""] * len(groups)
+
+    output = dict(zip(names, arrays))
+    output["DATASET_TITLES"] = np.array(titles, 'S')
+
+    # savez() would add .npz to the name.
+    npz_file = open(name, 'wb')
+    np.savez(npz_file, **output)
+    npz_file.close()
+
+# Returns the JSON encoding of each value of an output array. Each distinct
+# string is encoded once.
+def json_values(a):
+    if isinstance(a, np.ndarray) and np.float64 == a.dtype:
+        return ["null" if isnan(x) or isinf(x) else repr(x)
+                for x in a.tolist()]
+
+    if isinstance(a, np.ndarray) and np.int64 == a.dtype:
+        return [str(x) for x in a.tolist()]
+
+    if isinstance(a, np.ndarray):
+        a = a.tolist()
+
+    encoded = dict((x, dumps(x)) for x in set(a))
+
+    return [encoded[x] for x in a]
+
+# Writes one JSON object per group, with the values of the output variables
+# (see output_arrays()) in legend order, and TITLE, the title of the dataset
+# if there are several. Values that are not finite are written as null. Each
+# row is formatted at once from the encoded values.
+def write_jsonl(output, legend, groups, dep_stats, stat_columns):
+    (names, arrays) = output_arrays(legend, groups, dep_stats, stat_columns)
+
+    titles = dataset_titles(legend, groups)
+
+    if titles is not None:
+        names.append("TITLE")
+        arrays.append([titles[d] for d in arrays[-1].tolist()])
+
+    row_format = "{" + ", ".join(dumps(x).replace("%", "%%") + ": %s"
+                                 for x in names) + "}"
+
+    lines = [row_format % values
+             for values in zip(*[json_values(a) for a in arrays])]
+
+    write_lines(output, lines)
@@ -0,0 +1,368 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from sys import exit, stdout
+
+from os import remove, fdopen
+
+from time import time
+
+from json import dumps, loads
+
+from tempfile import mkstemp
+
+from optparse import OptionParser
+
+from collections import OrderedDict
+
+import bbb_legend
+
+from bbb_legend import DEP
+
+from bbb_error import bbb_error
+
+from bbb_reader import chunked_reader
+
+from bbb_record_parser import parse_record
+
+from bbb_aggregate import aggregator
+
+from bbb_generate import generate_bbb
+
+from statistics import stats, stats_batch, tinv, lru_cache
+
+op = OptionParser(
+    # Usage:
+    usage=("%prog [options]\n"
+           "\n"
+           "Times the record parser, the aggregation of records into groups, "
+           "the statistics and tinv on synthetic .bbb files (see "
+           "generate_bbb.py) of several sizes, and prints the best time of "
+           "each benchmark at each size and its throughput. Results can be "
+           "saved, and compared with those of an earlier run.")
+)
+
+op.add_option(
+    "-n", "--rows",
+    help=("Comma separated list of the numbers of records of the input files "
+          "(default: 10000,100000)."),
+    action="store", type="string", dest="rows", default="10000,100000",
+    metavar="LIST"
+)
+
+op.add_option(
+    "-b", "--benchmarks",
+    help=("Comma separated list of the benchmarks to run (default: all of "
+          "them): "+", ".join(["parse_lines", "parse_record", "aggregate",
+                               "aggregate_columnar", "stats", "stats_batch",
+                               "tinv", "cached_tinv"])+"."),
+    action="store", type="string", dest="benchmarks",
+    metavar="LIST"
+)
+
+op.add_option(
+    "-r", "--repeat",
+    help="Run each benchmark N times, and keep the best time (default: 3).",
+    action="store", type="int", dest="repeat", default=3,
+    metavar="N"
+)
+
+op.add_option(
+    "-c", "--ctls",
+    help="The number of CTL variables of the input files (default: 2).",
+    action="store", type="int", dest="ctls", default=2,
+    metavar="N"
+)
+
+op.add_option(
+    "-i", "--inds",
+    help="The number of IND variables of the input files (default: 1).",
+    action="store", type="int", dest="inds", default=1,
+    metavar="N"
+)
+
+op.add_option(
+    "-d", "--deps",
+    help="The number of DEP variables of the input files (default: 2).",
+    action="store", type="int", dest="deps", default=2,
+    metavar="N"
+)
+
+op.add_option(
+    "-s", "--samples",
+    help="The number of records of each group (default: 10).",
+    action="store", type="int", dest="samples", default=10,
+    metavar="N"
+)
+
+op.add_option(
+    "-q", "--quoted",
+    help=("The fraction of the values of the first CTL that are quoted "
+          "strings (default: 0.1)."),
+    action="store", type="float", dest="quoted", default=0.1,
+    metavar="FRACTION"
+)
+
+op.add_option(
+    "-m", "--missing",
+    help="The fraction of the records that are left out (default: 0.05).",
+    action="store", type="float", dest="missing", default=0.05,
+    metavar="FRACTION"
+)
+
+op.add_option(
+    "-o", "--output",
+    help="Also write the results to FILE, as JSON.",
+    action="store", type="string", dest="output",
+    metavar="FILE"
+)
+
+op.add_option(
+    "-p", "--compare",
+    help=("Compare the results with those of an earlier run, saved with "
+          "--output in FILE, and print the speedup of each benchmark (the "
+          "earlier time over the new one)."),
+    action="store", type="string", dest="compare",
+    metavar="FILE"
+)
+
+(options, args) = op.parse_args()
+
+if len(args) != 0:
+    op.print_help()
+    exit(1)
+
+try:
+    sizes = [int(x) for x in options.rows.split(",")]
+except ValueError:
+    print "ERROR: The numbers of records (-n) must be integers."
+    exit(1)
+
+if any(x < 1 for x in sizes):
+    print "ERROR: The numbers of records (-n) must be at least 1."
+    exit(1)
+
+if options.repeat < 1:
+    print "ERROR: The number of repetitions (-r) must be at least 1."
+    exit(1)
+
+baseline = {}
+
+if options.compare is not None:
+    try:
+        for result in loads(open(options.compare).read())["results"]:
+            baseline[(result["benchmark"], result["rows"])] = result["seconds"]
+    except (IOError, ValueError, KeyError, TypeError) as e:
+        print "ERROR: Cannot read the results in '"+options.compare+"': "+\
+              str(e)+"."
+        exit(1)
+
+###############################################################################
+# Benchmarks
+
+# The input of the benchmarks at one size: a synthetic .bbb file, read once to
+# find its legend, chunks and lines, and aggregated once to find the samples
+# of its groups.
+class fixture:
+    def __init__(self, rows):
+        (fd, self.name) = mkstemp(suffix=".bbb")
+
+        output = fdopen(fd, 'w')
+        self.rows = generate_bbb(output, options.ctls, options.inds,
+                                 options.deps, rows, options.samples,
+                                 options.quoted, options.missing)
+        output.close()
+
+        reader = chunked_reader(self.name)
+
+        try:
+            (header, data_offset) = reader.header()
+
+            self.header = header
+            self.chunks = list(reader.chunks(data_offset))
+        finally:
+            reader.close()
+
+        self.lines = [line.strip() for chunk in self.chunks
+                      for line in chunk.split('\n') if line.strip()]
+
+        agg = self.aggregate(False)
+
+        # The samples of each group, for each DEP.
+        self.samples = [agg.samples(i) for i in agg.dvars.indices]
+        self.sample_lists = [groups.tolist() for groups in self.samples]
+
+        self.groups = len(self.samples[0]) if self.samples else 0
+
+    def close(self):
+        remove(self.name)
+
+    def aggregate(self, columnar):
+        agg = aggregator(bbb_legend.legend(self.header), columnar=columnar)
+
+        direct = agg.cells if columnar else agg.master
+
+        for chunk in self.chunks:
+            (partial, messages, comments, error) = \
+                agg.parse_chunk(chunk, direct)
+
+            if error is not None:
+                raise bbb_error(error)
+
+        agg.group()
+
+        return agg
+
+def parse_lines(f):
+    for chunk in f.chunks:
+        parse_record.parse_lines(chunk)
+
+    return f.rows
+
+def parse_record_lines(f):
+    for line in f.lines:
+        parse_record(line)
+
+    return f.rows
+
+def aggregate(f):
+    f.aggregate(False)
+    return f.rows
+
+def aggregate_columnar(f):
+    f.aggregate(True)
+    return f.rows
+
+def scalar_stats(f):
+    for lists in f.sample_lists:
+        for samples in lists:
+            stats(samples)
+
+    return f.groups
+
+def batch_stats(f):
+    for groups in f.samples:
+        stats_batch(groups)
+
+    return f.groups
+
+# tinv for as many degrees of freedom as there are groups, none of which are
+# cached.
+def uncached_tinv(f):
+    for df in range(1, f.groups + 1):
+        tinv(0.05, df)
+
+    return f.groups
+
+# Looks up the t value of every group in a cache that has them all.
+def cached_tinv(f):
+    cache = lru_cache(tinv, f.groups)
+
+    dfs = [len(samples) - 1 for samples in f.sample_lists[0]]
+
+    for df in set(dfs):
+        cache(0.05, df)
+
+    begin = time()
+
+    for df in dfs:
+        cache(0.05, df)
+
+    # The time of filling the cache is not counted.
+    return (f.groups, time() - begin)
+
+# Maps the name of each benchmark to (function, unit). The function returns
+# the number of items it processed, in units, or (items, seconds) if it does
+# its own timing.
+BENCHMARKS = OrderedDict([
+    ("parse_lines",        (parse_lines,        "rows")),
+    ("parse_record",       (parse_record_lines, "rows")),
+    ("aggregate",          (aggregate,          "rows")),
+    ("aggregate_columnar", (aggregate_columnar, "rows")),
+    ("stats",              (scalar_stats,       "groups")),
+    ("stats_batch",        (batch_stats,        "groups")),
+    ("tinv",               (uncached_tinv,      "calls")),
+    ("cached_tinv",        (cached_tinv,        "lookups"))
+])
+
+if options.benchmarks is None:
+    names = BENCHMARKS.keys()
+else:
+    names = options.benchmarks.split(",")
+
+    for name in names:
+        if name not in BENCHMARKS:
+            print "ERROR: Unknown benchmark '"+name+"'."
+            exit(1)
+
+###############################################################################
+# Run the benchmarks
+
+results = []
+
+print "%-20s %10s %10s %-7s %12s %14s" % ("benchmark", "rows", "items", "",
+                                          "best (s)", "items/s"),
+print "%9s" % "speedup" if baseline else ""
+
+for rows in sizes:
+    f = fixture(rows)
+
+    try:
+        for name in names:
+            (function, unit) = BENCHMARKS[name]
+
+            best = None
+
+            for repeat in range(options.repeat):
+                begin = time()
+                items = function(f)
+                seconds = time() - begin
+
+                if isinstance(items, tuple):
+                    (items, seconds) = items
+
+                if best is None or seconds < best:
+                    best = seconds
+
+            results.append(OrderedDict([("benchmark", name), ("rows", rows),
+                                        ("items", items), ("unit", unit),
+                                        ("seconds", best)]))
+
+            print "%-20s %10d %10d %-7s %12.6f %14.1f" % \
+                (name, rows, items, unit, best,
+                 items / best if 0 < best else float("inf")),
+
+            old = baseline.get((name, rows))
+
+            if old is not None and 0 < best:
+                print "%8.2fx" % (old / best)
+            else:
+                print
+
+            stdout.flush()
+    except bbb_error as e:
+        print "ERROR: " + str(e)
+        exit(1)
+    finally:
+        f.close()
+
+if options.output is not None:
+    output = open(options.output, 'w')
+    print >> output, dumps(OrderedDict([
+        ("settings", OrderedDict([("ctls", options.ctls),
+                                  ("inds", options.inds),
+                                  ("deps", options.deps),
+                                  ("samples", options.samples),
+                                  ("quoted", options.quoted),
+                                  ("missing", options.missing),
+                                  ("repeat", options.repeat)])),
+        ("results", results)
+    ]), indent=2)
+    output.close()
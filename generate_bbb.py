@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from sys import exit, stdout
+
+from optparse import OptionParser
+
+from bbb_error import bbb_error
+
+from bbb_generate import generate_bbb
+
+op = OptionParser(
+    # Usage:
+    usage=("%prog [options] output-data\n"
+           "\n"
+           "Writes a synthetic .bbb file, for testing and benchmarking, to "
+           "output-data (or to standard output, if it is '-'). The same "
+           "options always write the same file.")
+)
+
+op.add_option(
+    "-c", "--ctls",
+    help="The number of CTL variables (default: 1).",
+    action="store", type="int", dest="ctls", default=1,
+    metavar="N"
+)
+
+op.add_option(
+    "-i", "--inds",
+    help="The number of IND variables (default: 1).",
+    action="store", type="int", dest="inds", default=1,
+    metavar="N"
+)
+
+op.add_option(
+    "-d", "--deps",
+    help="The number of DEP variables (default: 1).",
+    action="store", type="int", dest="deps", default=1,
+    metavar="N"
+)
+
+op.add_option(
+    "-n", "--rows",
+    help=("The number of records, before any are left out by --missing "
+          "(default: 1000)."),
+    action="store", type="int", dest="rows", default=1000,
+    metavar="N"
+)
+
+op.add_option(
+    "-s", "--samples",
+    help=("The number of records (samples) of each group (default: 10). The "
+          "number of groups is the number of records over this."),
+    action="store", type="int", dest="samples", default=10,
+    metavar="N"
+)
+
+op.add_option(
+    "-q", "--quoted",
+    help=("The fraction of the values of the first CTL (or IND, if there are "
+          "no CTLs) that are quoted strings (default: 0)."),
+    action="store", type="float", dest="quoted", default=0.0,
+    metavar="FRACTION"
+)
+
+op.add_option(
+    "-m", "--missing",
+    help=("The fraction of the records that are left out at random, so that "
+          "groups have different numbers of samples (default: 0)."),
+    action="store", type="float", dest="missing", default=0.0,
+    metavar="FRACTION"
+)
+
+op.add_option(
+    "-S", "--seed",
+    help="The seed of the random values (default: 0).",
+    action="store", type="int", dest="seed", default=0,
+    metavar="SEED"
+)
+
+(options, args) = op.parse_args()
+
+if len(args) != 1:
+    op.print_help()
+    exit(1)
+
+if "-" == args[0]:
+    output = stdout
+else:
+    try:
+        output = open(args[0], 'w')
+    except IOError as e:
+        print "ERROR: Cannot write output file '"+args[0]+"': "+\
+              e.strerror+"."
+        exit(1)
+
+try:
+    generate_bbb(output, options.ctls, options.inds, options.deps,
+                 options.rows, options.samples, options.quoted,
+                 options.missing, options.seed)
+except bbb_error as e:
+    print "ERROR: " + str(e)
+    exit(1)
+
+output.close()
@@ -2,9 +2,9 @@
 
 """Basic statistics utility functions.
 
-The implementation of Student's t distribution inverse CDF was ported to Python
-from JSci. The parameters are set to only be accurate to approximately 5
-decimal places.
+The implementation of Student's t distribution CDF was ported to Python from
+JSci. The inverse CDF is computed with Hill's algorithm refined by Newton's
+method, and is accurate to nearly full double precision.
 
 The JSci port comes frist. "New" code is near the bottom.
 
@@ -16,6 +16,12 @@ Original Licence: LGPL
 
 import math
 
+import numpy as np
+
+from os import rename, getpid
+
+from collections import OrderedDict
+
 # Relative machine precision.
 EPS = 2.22e-16
 # The smallest positive floating-point number such that 1/xminin is machine representable.
@@ -268,18 +274,136 @@ def StudentTCDF(degree_of_freedom, X):
     return A
 
 
-def InverseStudentT(degree_of_freedom, probability):
-    """Inverse of Student's T distribution CDF. Returns the value x such that CDF(x) = probability.
+# Coefficients of Acklam's rational approximation of the inverse normal CDF.
+in_a = [ -3.969683028665376e+01, 2.209460984245205e+02,
+    -2.759285104469687e+02, 1.383577518672690e+02,
+    -3.066479806614716e+01, 2.506628277459239e+00 ]
+in_b = [ -5.447609879822406e+01, 1.615858368580409e+02,
+    -1.556989798598866e+02, 6.680131188771972e+01,
+    -1.328068155288572e+01 ]
+in_c = [ -7.784894002430293e-03, -3.223964580411365e-01,
+    -2.400758277161838e+00, -2.549732539343734e+00,
+    4.374664141464968e+00, 2.938163982698783e+00 ]
+in_d = [ 7.784695709041462e-03, 3.224671290700398e-01,
+    2.445134137142996e+00, 3.754408661907416e+00 ]
+IN_P_LOW = 0.02425
+def InverseNormal(probability):
+    """Inverse of the standard normal distribution CDF.
+
+    Acklam's rational approximation (relative error below 1.15e-9), refined
+    with one step of Halley's method to nearly full double precision."""
+
+    assert 0 <= probability <= 1
+
+    if probability == 1:
+        return float("inf")
+    if probability == 0:
+        return float("-inf")
+
+    if probability < IN_P_LOW or probability > 1 - IN_P_LOW:
+        q = math.sqrt(-2*math.log(min(probability, 1 - probability)))
+        x = (((((in_c[0]*q+in_c[1])*q+in_c[2])*q+in_c[3])*q+in_c[4])*q+in_c[5]) / \
+            ((((in_d[0]*q+in_d[1])*q+in_d[2])*q+in_d[3])*q+1)
+        if probability > 0.5:
+            x = -x
+    else:
+        q = probability - 0.5
+        r = q*q
+        x = (((((in_a[0]*r+in_a[1])*r+in_a[2])*r+in_a[3])*r+in_a[4])*r+in_a[5])*q / \
+            (((((in_b[0]*r+in_b[1])*r+in_b[2])*r+in_b[3])*r+in_b[4])*r+1)
+
+    e = 0.5 * math.erfc(-x/math.sqrt(2)) - probability
+    u = e * SQRT2PI * math.exp(x*x/2)
+    return x - u/(1 + x*u/2)
+
+
+def StudentTPDF(degree_of_freedom, X):
+    """Student's T distribution probability density function."""
+
+    n = float(degree_of_freedom)
+    return math.exp(logGamma((n+1)/2) - logGamma(n/2) - 0.5*math.log(n*math.pi)
+                    - (n+1)/2 * math.log1p(X*X/n))
+
+
+def StudentTUpperTail(degree_of_freedom, X):
+    """Returns the probability that a Student's T distributed value is > X,
+    for X >= 0, without the cancellation of 1 - StudentTCDF(X)."""
+
+    n = float(degree_of_freedom)
+    return 0.5 * incompleteBeta(n/(n+X*X), 0.5*n, 0.5)
+
+
+# Relative size of the last Newton step; the error left after it is roughly its
+# square, which is below the precision of incompleteBeta.
+NEWTON_ACCURACY = 10**-12
+MAX_NEWTON_ITERATIONS = 50
+def InverseStudentTUpper(degree_of_freedom, q):
+    """Returns the value x >= 0 such that the probability of a value > x is q,
+    for 0 < q <= 0.5.
 
-    Ported from Java: http://jsci.sourceforge.net/
+    Hill's algorithm (G. W. Hill, 'Algorithm 396: Student's t-Quantiles,'
+    Comm. ACM 13, 1970, pp. 617-619), as used by R's qt(), gives a starting
+    point that Newton's method then refines to full double precision."""
 
-    This is not the best algorithm in the world. SciPy has a Fortran version
-    (see special.stdtrit):
-    http://svn.scipy.org/svn/scipy/trunk/scipy/stats/distributions.py
-    http://svn.scipy.org/svn/scipy/trunk/scipy/special/cdflib/cdft.f
+    assert 0 < q <= 0.5
 
-    Very detailed information:
-    http://www.maths.ox.ac.uk/~shaww/finpapers/tdist.pdf
+    n = float(degree_of_freedom)
+    P = 2*q # Two-tailed probability
+
+    if abs(n - 2) < EPS:
+        t = math.sqrt(2/(P*(2-P)) - 2)
+    elif n < 1 + EPS:
+        t = math.cos(P*math.pi/2) / math.sin(P*math.pi/2)
+    else:
+        a = 1/(n-0.5)
+        b = 48/(a*a)
+        c = ((20700*a/b-98)*a-16)*a+96.36
+        d = ((94.5/(b+c)-3)/b+1)*math.sqrt(a*math.pi/2)*n
+        y = (d*P)**(2/n)
+
+        if y > 0.05+a:
+            # Asymptotic inverse expansion about the normal.
+            x = InverseNormal(0.5*P)
+            y = x*x
+            if n < 5:
+                c += 0.3*(n-4.5)*(x+0.6)
+            c = (((0.05*d*x-5)*x-7)*x-2)*x+b+c
+            y = (((((0.4*y+6.3)*y+36)*y+94.5)/c-y-3)/b+1)*x
+            y = math.expm1(a*y*y)
+        else:
+            y = ((1/(((n+6)/(n*y)-0.089*d-0.822)*(n+2)*3)+0.5/(n+4))*y-1) \
+              * (n+1)/(n+2)+1/y
+
+        t = math.sqrt(n*y)
+
+    # Newton's method; the derivative of the upper tail is -PDF.
+    step = float("inf")
+    for i in xrange(MAX_NEWTON_ITERATIONS):
+        step = (StudentTUpperTail(n, t) - q) / StudentTPDF(n, t)
+        if not step - step == 0: # Infinite or NaN
+            break
+        if step < -t:
+            step = -t/2
+        t += step
+        if abs(step) <= NEWTON_ACCURACY * t:
+            return t
+
+    # For very large degrees of freedom incompleteBeta is too noisy for the
+    # iteration to settle, but it still gets closer than bisection would.
+    if abs(step) <= ACCURACY * t:
+        return t
+
+    # Fall back on bisection if Newton's method did not converge.
+    return findRoot(1 - q, 0, 10**4, lambda x: StudentTCDF(n, x))
+
+
+def InverseStudentT(degree_of_freedom, probability):
+    """Inverse of Student's T distribution CDF. Returns the value x such that CDF(x) = probability.
+
+    Computed directly with InverseStudentTUpper(), which is accurate to nearly
+    full double precision. The original JSci port bisected over StudentTCDF,
+    which was only accurate to about 1e-7 and cost thousands of incomplete beta
+    function evaluations.
     """
     
     assert 0 <= probability <= 1
@@ -291,11 +415,124 @@ def InverseStudentT(degree_of_freedom, probability):
     if probability == 0.5:
         return 0.0
 
-    def f(x):
-        return StudentTCDF(degree_of_freedom, x)
+    if probability > 0.5:
+        return InverseStudentTUpper(degree_of_freedom, 1 - probability)
+    else:
+        return -InverseStudentTUpper(degree_of_freedom, probability)
 
-    return findRoot(probability, -10**4, 10**4, f)
 
+# Precomputed two-tailed critical values, TINV_TABLE[p][degree_of_freedom - 1]
+# == tinv(p, degree_of_freedom), for the most common confidence levels.
+TINV_TABLE = {
+    0.1: (
+        6.313751514675043, 2.9199855803537256, 2.3533634348018238,
+        2.1318467863266504, 2.0150483733330242, 1.9431802805153031,
+        1.8945786050900073, 1.8595480375308984, 1.8331129326562372,
+        1.8124611228116765, 1.7958848187040442, 1.78228755564932,
+        1.770933395986873, 1.7613101357748921, 1.7530503556925736,
+        1.74588367627625, 1.739606726075073, 1.7340636066175388,
+        1.7291328115213696, 1.7247182429207872, 1.7207429028118786,
+        1.7171443743802428, 1.713871527747048, 1.7108820799094284,
+        1.7081407612518993, 1.7056179197592731, 1.7032884457221271,
+        1.7011309342659315, 1.6991270265334977, 1.6972608865939578,
+        1.6955187825458655, 1.6938887483837106, 1.6923603090303445,
+        1.6909242551868549, 1.689572457780266, 1.6882977141168163,
+        1.6870936195962636, 1.6859544601667373, 1.6848751217112254,
+        1.6838510133356526, 1.6828780021327083, 1.6819523574675341,
+        1.6810707032025196, 1.6802299765721171, 1.6794273926523549,
+        1.6786604135568655, 1.677926721641861, 1.677224196124339,
+        1.676550892616854, 1.6759050251630976, 1.6752849504249103,
+        1.6746891537260256, 1.6741162367031008, 1.6735649063521614,
+        1.6730339652899118, 1.6725223030755776, 1.672028888460953,
+        1.6715527624548592, 1.671093032103895, 1.6706488649046365,
+        1.6702194837737374, 1.6698041625120115, 1.6694022217068132,
+        1.6690130250240902, 1.6686359758475526, 1.6682705142276328,
+        1.667916114107425, 1.6675722807967084, 1.6672385486685533,
+        1.6669144790559567, 1.6665996583285339, 1.6662936961315353,
+        1.6659962237714316, 1.6657068927340237, 1.6654253733225632,
+        1.665151353404695, 1.6648845372582055, 1.6646246445066153,
+        1.664371409136551, 1.6641245785896674, 1.6638839129226006,
+        1.6636491840290772, 1.663420174918885, 1.6631966790489097,
+        1.6629784997019048, 1.662765449409071, 1.6625573494128778,
+        1.6623540291668961, 1.6621553258697004, 1.661961084030162,
+        1.6617711550616951, 1.6615853969032337, 1.661403673664899,
+        1.661225855296512, 1.6610518172772415, 1.6608814403248384,
+        1.6607146101230248, 1.6605512170657337, 1.6603911560169908,
+        1.6602343260853396,
+    ),
+    0.05: (
+        12.706204736174705, 4.302652729749464, 3.1824463052837095,
+        2.7764451051977943, 2.5705818356363155, 2.44691185114497,
+        2.3646242515927853, 2.3060041352041667, 2.2621571627982053,
+        2.228138851986275, 2.2009851600916397, 2.178812829667229,
+        2.1603686564627926, 2.144786687917804, 2.1314495455597755,
+        2.1199052992212546, 2.109815577833317, 2.1009220402410387,
+        2.0930240544083096, 2.085963447265865, 2.0796138447276804,
+        2.0738730679040263, 2.0686576104190486, 2.063898561628026,
+        2.0595385527532977, 2.055529438642873, 2.0518305164802855,
+        2.048407141795245, 2.0452296421327043, 2.042272456301238,
+        2.0395134463964086, 2.036933343460102, 2.034515297449339,
+        2.032244509317719, 2.0301079282503434, 2.028094000980451,
+        2.0261924630291097, 2.02439416391197, 2.0226909200367613,
+        2.0210753903062733, 2.0195409704413763, 2.018081702818445,
+        2.0166921992278244, 2.015367574443764, 2.0141033888808466,
+        2.012895598919429, 2.011740513729766, 2.0106347576242323,
+        2.0095752371292397, 2.008559112100761, 2.007583770315836,
+        2.0066468050616884, 2.005745995317869, 2.004879288188057,
+        2.004044783289146, 2.0032407188478722, 2.0024654592910074,
+        2.001717484145236, 2.000995378088268, 2.0002978220142604,
+        1.9996235849949398, 1.998971517033379, 1.9983405425207417,
+        1.997729654317693, 1.997137908392004, 1.996564418952312,
+        1.9960083540252966, 1.995468931429844, 1.994945415107238,
+        1.9944371117711865, 1.9939433678456258, 1.9934635666618723,
+        1.9929971258898551, 1.9925434951809327, 1.992102154002242,
+        1.9916726096446644, 1.991254395388385, 1.9908470688116908,
+        1.990450210230129, 1.9900634212544461, 1.9896863234569029,
+        1.9893185571365726, 1.9889597801751628, 1.9886096669757092,
+        1.988267907477222, 1.9879342062390206, 1.9876082815890712,
+        1.9872898648311697, 1.9869786995062815, 1.9866745407037683,
+        1.9863771544186182, 1.9860863169511305, 1.9858018143458234,
+        1.9855234418666043, 1.9852510035054982, 1.9849843115224575,
+        1.9847231860139847, 1.9844674545084817, 1.9842169515864174,
+        1.9839715185235522,
+    ),
+    0.01: (
+        63.65674116287158, 9.924843200918293, 5.840909309733357,
+        4.604094871349993, 4.032142983555228, 3.70742802132478,
+        3.499483297350494, 3.3553873313333953, 3.2498355415921263,
+        3.1692726726169513, 3.105806515539281, 3.054539589392902,
+        3.0122758387165787, 2.976842734370835, 2.946712883475239,
+        2.9207816224251, 2.8982305196774187, 2.878440472738608,
+        2.860934606464979, 2.8453397097861086, 2.83135955802305,
+        2.8187560606001436, 2.807335683769999, 2.796939504774456,
+        2.7874358136769706, 2.778714533329683, 2.770682957122212,
+        2.7632624554614447, 2.7563859036706053, 2.7499956535672254,
+        2.7440419192942693, 2.738481482012188, 2.733276642350836,
+        2.7283943670707203, 2.7238055892080917, 2.7194846304500078,
+        2.7154087215499882, 2.7115576019130825, 2.707913183517662,
+        2.7044592674331627, 2.7011813035785224, 2.6980661862199846,
+        2.6951020791576754, 2.692278265693022, 2.689585019374643,
+        2.687013492242216, 2.6845556178665246, 2.682204026950216,
+        2.6799519736315522, 2.6777932709408443, 2.6757222341106477,
+        2.6737336306472197, 2.671822636241004, 2.6699847957348917,
+        2.668215988486194, 2.6665123975560636, 2.6648704822419718,
+        2.6632869535376584, 2.6617587521629673, 2.660283028855037,
+        2.6588571266539263, 2.6574785649511563, 2.6561450250998617,
+        2.654854337411085, 2.653604469382925, 2.652393515028316,
+        2.6512196851836576, 2.6500812986947295, 2.6489767743886263,
+        2.647904623751151, 2.646863444238392, 2.645851913159326,
+        2.6448687820733823, 2.64391287165309, 2.6429830669673935,
+        2.642078313145992, 2.641197611389272, 2.640340015292127,
+        2.6395046274532206, 2.638690596344183, 2.6378971134157765,
+        2.6371234104203745, 2.636368756932123, 2.635632458047961,
+        2.634913852254306, 2.6342123094456342, 2.6335272290824965,
+        2.632858038477645, 2.632204191200009, 2.631565165587159,
+        2.6309404633577644, 2.6303296083162886, 2.629732145142835,
+        2.6291476382617054, 2.6285756707827432, 2.62801584351007,
+        2.6274677740132524, 2.626931095756374, 2.6264054572808275,
+        2.6258905214380177,
+    ),
+}
 
 def tinv(p, degree_of_freedom):
     """Similar to the TINV function in Excel
@@ -303,20 +540,98 @@ def tinv(p, degree_of_freedom):
     p: 1-confidence (eg. 0.05 = 95% confidence)"""
     
     assert 0 <= p <= 1
-    confidence = 1 - p
-    return InverseStudentT(degree_of_freedom, (1+confidence)/2.0)
 
+    table = TINV_TABLE.get(p)
+    if table is not None and degree_of_freedom == int(degree_of_freedom) \
+       and 1 <= degree_of_freedom <= len(table):
+        return table[int(degree_of_freedom) - 1]
+
+    if p == 0:
+        return float("inf")
+    if p == 1:
+        return 0.0
+
+    return InverseStudentTUpper(degree_of_freedom, p/2.0)
+
+
+class lru_cache:
+    """Caches the results of a function of numbers, keeping at most maxsize of
+    them and evicting the least recently used one first. Counts the calls
+    which found their result in the cache (hits) and those which did not
+    (misses).
+
+    The cache can be saved to a text file, with the arguments and result of
+    each call on a line, and loaded back, so that later processes start with
+    the results of earlier ones."""
+
+    def __init__(self, function, maxsize=4096):
+        assert 0 < maxsize
+        self.function = function
+        self.maxsize = maxsize
+        self.cache = OrderedDict() # From least to most recently used
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *args):
+        try:
+            result = self.cache.pop(args)
+            self.hits += 1
+        except KeyError:
+            result = self.function(*args)
+            self.misses += 1
+
+            if len(self.cache) >= self.maxsize:
+                self.cache.popitem(last=False)
 
-def memoize(function):
-    cache = {}
-    def closure(*args):
-        if args not in cache:
-            cache[args] = function(*args)
-        return cache[args]
-    return closure
+        self.cache[args] = result
+        return result
+
+    def __len__(self):
+        return len(self.cache)
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, name):
+        """Adds the results saved in a file to the cache, as the most recently
+        used ones. Raises IOError if the file cannot be read, and ValueError
+        if it is not a saved cache."""
+
+        with open(name) as f:
+            for line in f:
+                if line.startswith("#") or 0 == len(line.strip()):
+                    continue
+
+                values = [float(x) for x in line.split()]
+                if len(values) < 2:
+                    raise ValueError("Invalid line '"+line.rstrip()+"'.")
+
+                args = tuple(values[:-1])
+                self.cache.pop(args, None)
+
+                if len(self.cache) >= self.maxsize:
+                    self.cache.popitem(last=False)
+
+                self.cache[args] = values[-1]
+
+    def save(self, name):
+        """Writes the results in the cache to a file, from least to most
+        recently used. The old file is only replaced once the new one is
+        complete, so processes can share the file."""
+
+        temporary = name + "." + str(getpid()) + ".tmp"
+
+        with open(temporary, "w") as f:
+            f.write("# Arguments and result of each call, least recent first\n")
+            f.writelines(" ".join(repr(float(x)) for x in args + (result,)) +
+                         "\n" for (args, result) in self.cache.iteritems())
+
+        rename(temporary, name)
 
 # Cache tinv results, since we typically call it with the same args over and over
-cached_tinv = memoize(tinv)
+cached_tinv = lru_cache(tinv)
 
 
 def stats(r, confidence_interval=0.05):
@@ -348,3 +663,1112 @@ def stats(r, confidence_interval=0.05):
     # confidence = +/- t * s_m
     confidence = cached_tinv(confidence_interval, len(r)-1) * s_m if 1 < len(r) else 0.0
     return average, median, standard_deviation, minimum, maximum, confidence
+
+
+def logGammaArray(x):
+    """logGamma() of each element of an array, with the same rational
+    approximations evaluated across the whole array.
+
+    Unlike logGamma(), arguments above 2.25e76 do not fail an assertion (the
+    asymptotic expansion is used for them too)."""
+
+    y = np.asarray(x, np.float64)
+    result = np.empty(y.shape)
+
+    # Evaluates the rational function xnum / xden of the scalar code.
+    def ratio(z, p, q, xden):
+        xnum = np.zeros(z.shape)
+        xden = np.full(z.shape, xden)
+        for i in xrange(8):
+            xnum = xnum * z + p[i]
+            xden = xden * z + q[i]
+        return xnum / xden
+
+    bad = (y < 0.0) | (y > LOG_GAMMA_X_MAX_VALUE)
+    tiny = ~bad & (y <= EPS)
+    low = ~bad & ~tiny & (y <= 1.5)
+    middle = ~bad & ~tiny & ~low & (y <= 4.0)
+    high = ~bad & ~tiny & ~low & ~middle & (y <= 12.0)
+    large = ~(bad | tiny | low | middle | high)
+
+    result[bad] = float("inf")
+
+    result[tiny] = -np.log(y[tiny])
+
+    # y <= 0.5 or y >= pnt68 use p1 and q1 around 0 (or 1), and values in
+    # between use p2 and q2 around 1.
+    z = y[low]
+    corr = np.where(z < pnt68, -np.log(z), 0.0)
+    first = (z <= 0.5) | (z >= pnt68)
+    xm1 = np.where(z < pnt68, z, z - 1.0)
+    xm2 = z - 1.0
+    result[low] = np.where(
+        first,
+        corr + xm1 * (lg_d1 + xm1 * ratio(xm1, lg_p1, lg_q1, 1.0)),
+        corr + xm2 * (lg_d2 + xm2 * ratio(xm2, lg_p2, lg_q2, 1.0)))
+
+    xm2 = y[middle] - 2.0
+    result[middle] = xm2 * (lg_d2 + xm2 * ratio(xm2, lg_p2, lg_q2, 1.0))
+
+    xm4 = y[high] - 4.0
+    result[high] = lg_d4 + xm4 * ratio(xm4, lg_p4, lg_q4, -1.0)
+
+    z = y[large]
+    res = np.full(z.shape, lg_c[6])
+    ysq = z * z
+    for i in xrange(6):
+        res = res / ysq + lg_c[i]
+    res /= z
+    corr = np.log(z)
+    res = res + LOGSQRT2PI - 0.5 * corr
+    res += z * (corr - 1.0)
+    result[large] = res
+
+    return result
+
+
+def betaFractionArray(x, p, q):
+    """betaFraction() of each element of arrays (which are broadcast
+    together), evaluating the continued fraction across the whole array. Each
+    element is dropped from the evaluation as soon as it converges."""
+
+    (x, p, q) = np.broadcast_arrays(*[np.asarray(a, np.float64)
+                                      for a in (x, p, q)])
+    shape = x.shape
+    (x, p, q) = (x.ravel(), p.ravel(), q.ravel())
+
+    def floor(a):
+        return np.where(np.abs(a) < XMININ, XMININ, a)
+
+    sum_pq  = p + q
+    p_plus  = p + 1.0
+    p_minus = p - 1.0
+    h = 1.0 / floor(1.0 - sum_pq * x / p_plus)
+    frac = h
+    c = np.ones(x.shape)
+
+    result = np.empty(x.shape)
+    index = np.arange(len(x))
+    m = 1
+
+    while 0 < len(index):
+        m2 = 2 * m
+
+        # even index for d
+        d = m * (q - m) * x / ((p_minus + m2) * (p + m2))
+        h = 1.0 / floor(1.0 + d * h)
+        c = floor(1.0 + d / c)
+        frac = frac * (h * c)
+
+        # odd index for d
+        d = -(p + m) * (sum_pq + m) * x / ((p + m2) * (p_plus + m2))
+        h = 1.0 / floor(1.0 + d * h)
+        c = floor(1.0 + d / c)
+        delta = h * c
+        frac = frac * delta
+        m += 1
+
+        done = ~(np.abs(delta - 1.0) > PRECISION)
+        if m > MAX_ITERATIONS:
+            done[:] = True
+
+        if done.any():
+            result[index[done]] = frac[done]
+
+            left = ~done
+            (index, x, p, q, sum_pq, p_plus, p_minus, h, c, frac) = \
+                [a[left] for a in (index, x, p, q, sum_pq, p_plus, p_minus,
+                                   h, c, frac)]
+
+    return result.reshape(shape)
+
+
+def incompleteBetaArray(x, p, q):
+    """incompleteBeta() of each element of arrays (which are broadcast
+    together)."""
+
+    (x, p, q) = np.broadcast_arrays(*[np.asarray(a, np.float64)
+                                      for a in (x, p, q)])
+
+    assert ((0 <= x) & (x <= 1)).all()
+    assert (p > 0).all()
+    assert (q > 0).all()
+
+    result = np.where(x >= 1.0, 1.0, 0.0)
+
+    inside = (0.0 < x) & (x < 1.0) & (p + q <= LOG_GAMMA_X_MAX_VALUE)
+    (x, p, q) = (x[inside], p[inside], q[inside])
+
+    log_beta = logGammaArray(p) + logGammaArray(q) - logGammaArray(p + q)
+    beta_gam = np.exp(-log_beta + p * np.log(x) + q * np.log(1.0 - x))
+
+    # The continued fraction converges quickly below the mean of the
+    # distribution; above it, use the symmetry I(x, p, q) = 1 - I(1-x, q, p).
+    lower = x < (p + 1.0) / (p + q + 2.0)
+    fraction = betaFractionArray(np.where(lower, x, 1.0 - x),
+                                 np.where(lower, p, q),
+                                 np.where(lower, q, p))
+    result[inside] = np.where(lower, beta_gam * fraction / p,
+                              1.0 - (beta_gam * fraction / q))
+
+    return result
+
+
+def StudentTCDFArray(degree_of_freedom, X):
+    """StudentTCDF() of each element of arrays (which are broadcast
+    together)."""
+
+    n = np.asarray(degree_of_freedom, np.float64)
+    X = np.asarray(X, np.float64)
+
+    A = 0.5 * incompleteBetaArray(n / (n + X * X), 0.5 * n, 0.5)
+    return np.where(X > 0, 1 - A, A)
+
+
+def pad_samples(samples):
+    """Packs a ragged sequence of sequences into a 2D array, one row per
+    sequence, padded with NaN."""
+
+    lengths = np.fromiter((len(r) for r in samples), np.intp, len(samples))
+    total = int(lengths.sum())
+
+    flat = np.fromiter((x for r in samples for x in r), np.float64, total)
+
+    return pad_groups(flat, lengths)
+
+
+def pad_groups(values, counts):
+    """Packs consecutive groups of values into a 2D array, one row per group,
+    padded with NaN. counts[i] is the number of values in the i-th group."""
+
+    counts = np.asarray(counts, np.intp)
+    total = int(counts.sum())
+    width = int(counts.max()) if len(counts) else 0
+
+    assert len(values) == total
+
+    padded = np.empty((len(counts), width))
+    padded.fill(np.nan)
+
+    rows = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    columns = np.arange(total) - np.repeat(offsets, counts)
+    padded[rows, columns] = values
+
+    return padded
+
+
+# Maximum number of cells (values and padding) of the 2D arrays that the
+# batched statistics pad groups into, which bounds their memory use (a few
+# arrays of this many float64s) however uneven the groups are.
+BATCH_CELLS = 1 << 20
+
+def size_batches(sizes, cells=BATCH_CELLS):
+    """Splits items of different sizes (e.g. groups of values) into batches of
+    items of similar sizes, which are padded to the largest size of their
+    batch.
+
+    Yields the indices of the items of each batch, in order of size. The
+    number of items of a batch times its largest size is at most cells, unless
+    the batch is a single item."""
+
+    sizes = np.asarray(sizes, np.intp)
+    order = np.argsort(sizes, kind="mergesort")
+    sorted_sizes = sizes[order]
+
+    begin = 0
+
+    while begin < len(order):
+        # Bisect for the largest end with (end - begin) * sorted_sizes[end - 1]
+        # <= cells, which grows with end.
+        (low, high) = (begin + 1, len(order))
+
+        while low < high:
+            middle = (low + high + 1) // 2
+            if (middle - begin) * int(sorted_sizes[middle - 1]) <= cells:
+                low = middle
+            else:
+                high = middle - 1
+
+        yield order[begin:low]
+
+        begin = low
+
+
+class packed_groups:
+    """Many sequences of numbers (groups), stored one after another in a flat
+    array, with the number of values of each. Unlike a 2D array padded with
+    NaN, whose size is the number of groups times the length of the longest,
+    this takes memory in proportion to the number of values, and NaN values
+    are samples like any other. The batched statistics pad a batch of groups
+    of similar lengths at a time (see batches())."""
+
+    def __init__(self, values, counts):
+        self.values = np.asarray(values, np.float64)
+        self.counts = np.asarray(counts, np.intp)
+        self.offsets = np.cumsum(self.counts) - self.counts
+
+        assert len(self.values) == self.counts.sum()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def take(self, rows):
+        """Returns packed_groups with the groups rows (an array of indices), in
+        that order."""
+
+        rows = np.asarray(rows, np.intp)
+        counts = self.counts[rows]
+
+        within = np.arange(int(counts.sum())) - \
+                 np.repeat(np.cumsum(counts) - counts, counts)
+
+        return packed_groups(
+            self.values[np.repeat(self.offsets[rows], counts) + within], counts)
+
+    def __getitem__(self, rows):
+        """Returns a 2D array with the values of the groups rows (an array of
+        indices), one group per row, padded with NaN to the longest of them."""
+
+        groups = self.take(rows)
+        return pad_groups(groups.values, groups.counts)
+
+    def batches(self, cells=BATCH_CELLS):
+        """Yields (rows, padded, counts) for batches of groups of similar
+        lengths (see size_batches()): the indices of the groups of a batch, a
+        2D array with their values (see __getitem__()), which has at most cells
+        cells unless it is a single group, and the number of values of each."""
+
+        for rows in size_batches(self.counts, cells):
+            yield (rows, self[rows], self.counts[rows])
+
+    def tolist(self):
+        """Returns a list with a list of the values of each group."""
+
+        if 0 == len(self.counts):
+            return []
+
+        return [v.tolist() for v in np.split(self.values,
+                                             np.cumsum(self.counts)[:-1])]
+
+
+def pack_samples(samples):
+    """Returns samples as packed_groups.
+
+    The batched statistics take samples in any of three forms: packed_groups,
+    a ragged sequence of sequences of numbers, or a 2D array with one sequence
+    per row, padded with NaN. In the last, NaN values are padding; in the
+    others they are samples, which make the results they are part of NaN, as
+    in stats()."""
+
+    if isinstance(samples, packed_groups):
+        return samples
+
+    if isinstance(samples, np.ndarray) and 2 == samples.ndim:
+        present = ~np.isnan(samples)
+        return packed_groups(samples[present], present.sum(axis=1))
+
+    lengths = np.fromiter((len(r) for r in samples), np.intp, len(samples))
+    total = int(lengths.sum())
+
+    flat = np.fromiter((x for r in samples for x in r), np.float64, total)
+
+    return packed_groups(flat, lengths)
+
+
+def map_batches(function, samples, cells=BATCH_CELLS):
+    """Applies function to samples (see pack_samples()) a batch of groups of
+    similar lengths at a time (see packed_groups.batches()). function(padded,
+    counts) takes a 2D array with one group per row, padded with NaN, and the
+    number of values of each, and returns a tuple of arrays with one element
+    (or row) per group.
+
+    Returns the tuple of arrays for every group, in order."""
+
+    groups = pack_samples(samples)
+
+    results = None
+
+    for (rows, padded, counts) in groups.batches(cells):
+        batch = function(padded, counts)
+
+        if results is None:
+            results = tuple(np.empty((len(groups),) + r.shape[1:], r.dtype)
+                            for r in batch)
+
+        for (result, r) in zip(results, batch):
+            result[rows] = r
+
+    if results is None:
+        results = function(np.empty((0, 0)), np.empty(0, np.intp))
+
+    return results
+
+
+def partition_rows(padded, counts, kth):
+    """Partially sorts the rows of a 2D array, padded with NaN, with
+    np.partition(), which takes linear time per row instead of a full sort.
+    counts[i] is the number of values of the i-th row, and kth(n) the indices
+    to partition the rows with n values around.
+
+    Yields (rows, n, partitioned) for each distinct number of values n: the
+    indices of the rows with n values, and their partitioned values."""
+
+    order = np.argsort(counts, kind="mergesort")
+    sizes, starts = np.unique(counts[order], return_index=True)
+
+    for (n, rows) in zip(sizes, np.split(order, starts[1:])):
+        n = int(n)
+        yield (rows, n, np.partition(padded[rows, :n], kth(n), axis=1))
+
+
+def stats_batch(samples, confidence_interval=0.05):
+    """Returns statistics about many sequences of numbers at once (see
+    pack_samples()). Each result matches what stats() would return for the
+    corresponding sequence, except that NaN samples sort after the others.
+
+    Returns arrays (average, median, standard deviation, min, max, confidence interval)"""
+
+    return map_batches(
+        lambda padded, counts: stats_rows(padded, counts, confidence_interval),
+        samples)
+
+
+def stats_rows(padded, counts, confidence_interval=0.05):
+    """stats_batch() of the rows of a 2D array, padded past counts[i] values in
+    the i-th row."""
+
+    if 0 == len(padded):
+        return tuple(np.empty(0) for i in range(6))
+
+    assert (0 < counts).all()
+
+    present = np.arange(padded.shape[1]) < counts[:, np.newaxis]
+
+    n = counts.astype(np.float64)
+
+    # Accumulate left to right, like sum() does, so that the results are
+    # bit-for-bit identical to stats().
+    values = np.where(present, padded, 0.0)
+    average = np.cumsum(values, axis=1)[:, -1] / n
+    deviation = np.where(present, padded - average[:, np.newaxis], 0.0)
+    sum_deviation_squared = np.cumsum(deviation * deviation, axis=1)[:, -1]
+    standard_deviation = np.sqrt(sum_deviation_squared / np.maximum(n - 1, 1))
+
+    # Select the median and extremes instead of sorting, and skip the padding.
+    median = np.empty(len(padded))
+    minimum = np.empty(len(padded))
+    maximum = np.empty(len(padded))
+    for (rows, size, partitioned) in partition_rows(
+            padded, counts, lambda n: [0, n // 2, n - 1]):
+        median[rows] = partitioned[:, size // 2]
+        minimum[rows] = partitioned[:, 0]
+        maximum[rows] = partitioned[:, size - 1]
+
+    # One t value per distinct sample size.
+    sizes, inverse = np.unique(counts, return_inverse=True)
+    t = np.array([cached_tinv(confidence_interval, int(size) - 1)
+                  if 1 < size else 0.0 for size in sizes])
+    s_m = standard_deviation / np.sqrt(n)
+    confidence = t[inverse] * s_m
+
+    return average, median, standard_deviation, minimum, maximum, confidence
+
+
+def quantiles_batch(padded, counts, q):
+    """Returns the q[j]-th quantiles of each row of a 2D array, padded with
+    NaN, interpolating linearly between order statistics like np.percentile().
+    counts[i] is the number of values of the i-th row.
+
+    Returns a 2D array with one row per row of padded, and one column per
+    quantile."""
+
+    q = np.asarray(q, np.float64)
+
+    def positions(n):
+        position = q * (n - 1)
+        below = np.floor(position).astype(np.intp)
+        above = np.minimum(below + 1, n - 1)
+        return (position - below, below, above)
+
+    result = np.empty((len(padded), len(q)))
+
+    for (rows, n, partitioned) in partition_rows(
+            padded, counts, lambda n: np.union1d(*positions(n)[1:])):
+        (fraction, below, above) = positions(n)
+        result[rows] = partitioned[:, below] + fraction * \
+                       (partitioned[:, above] - partitioned[:, below])
+
+    return result
+
+
+def robust_batch(samples, trim=0.1):
+    """Returns statistics about many sequences of numbers at once (see
+    pack_samples()) which are less affected by outliers than those of
+    stats_batch(). trim is the fraction of the values of a sequence that is
+    cut from each end for the trimmed mean, and replaced by the nearest
+    remaining value for the winsorized mean (int(trim * n) values, like
+    scipy.stats.trim_mean()).
+
+    Returns arrays (median absolute deviation, trimmed mean, winsorized mean, interquartile range)"""
+
+    assert 0 <= trim < 0.5
+
+    return map_batches(
+        lambda padded, counts: robust_rows(padded, counts, trim), samples)
+
+
+def robust_rows(padded, counts, trim=0.1):
+    """robust_batch() of the rows of a 2D array, padded past counts[i] values
+    in the i-th row."""
+
+    if 0 == len(padded):
+        return tuple(np.empty(0) for i in range(4))
+
+    assert (0 < counts).all()
+
+    quartiles = quantiles_batch(padded, counts, [0.25, 0.5, 0.75])
+    interquartile_range = quartiles[:, 2] - quartiles[:, 0]
+
+    deviation = np.abs(padded - quartiles[:, 1:2])
+    median_absolute_deviation = quantiles_batch(deviation, counts, [0.5])[:, 0]
+
+    trimmed_mean = np.empty(len(padded))
+    winsorized_mean = np.empty(len(padded))
+
+    for (rows, n, partitioned) in partition_rows(
+            padded, counts, lambda n: [int(trim * n), n - int(trim * n) - 1]):
+        k = int(trim * n)
+        middle = partitioned[:, k:n - k].sum(axis=1)
+        trimmed_mean[rows] = middle / (n - 2 * k)
+        winsorized_mean[rows] = \
+            (middle + k * (partitioned[:, k] + partitioned[:, n - k - 1])) / n
+
+    return (median_absolute_deviation, trimmed_mean, winsorized_mean,
+            interquartile_range)
+
+
+def percentiles_batch(samples, percentiles):
+    """Returns percentiles of many sequences of numbers at once (see
+    pack_samples()), interpolating linearly between order statistics like
+    np.percentile(). percentiles is a sequence of numbers between 0 and 100.
+
+    Returns a 2D array with one row per sequence, and one column per
+    percentile."""
+
+    q = np.asarray(percentiles, np.float64) / 100
+
+    def rows(padded, counts):
+        assert (0 < counts).all()
+        return (quantiles_batch(padded, counts, q),)
+
+    return map_batches(rows, samples)[0]
+
+
+def median_interval_ranks(n, confidence_interval=0.05):
+    """Returns (j, k), the 0-based ranks of the order statistics of n values
+    which bound a confidence interval of their median, without assuming
+    anything about their distribution: the number of values below the median
+    is binomially distributed, so x[j] <= median <= x[k] with a probability
+    of at least 1 - 2 * P(B(n, 0.5) <= j), which is the largest below
+    1 - confidence_interval. With 5 or fewer values, no interval is wide
+    enough, and (0, n - 1) is returned."""
+
+    assert 0 < n
+
+    # P(B(n, 0.5) <= i) for i = 0, 1, ..., n // 2.
+    i = np.arange(n // 2 + 1)
+    log_gamma = np.frompyfunc(math.lgamma, 1, 1)
+    log_pmf = (math.lgamma(n + 1) - log_gamma(i + 1) - log_gamma(n - i + 1)
+               - n * math.log(2)).astype(np.float64)
+    cdf = np.cumsum(np.exp(log_pmf))
+
+    j = max(int(np.searchsorted(cdf, confidence_interval / 2, "right")) - 1, 0)
+
+    return (j, n - 1 - j)
+
+
+def median_interval_batch(samples, confidence_interval=0.05):
+    """Returns distribution-free confidence intervals of the medians of many
+    sequences of numbers at once (see pack_samples()), bounded by order
+    statistics (see median_interval_ranks()).
+
+    Returns arrays (lower bound, upper bound)"""
+
+    return map_batches(
+        lambda padded, counts: median_interval_rows(padded, counts,
+                                                    confidence_interval),
+        samples)
+
+
+def median_interval_rows(padded, counts, confidence_interval=0.05):
+    """median_interval_batch() of the rows of a 2D array, padded past
+    counts[i] values in the i-th row."""
+
+    lower = np.empty(len(padded))
+    upper = np.empty(len(padded))
+
+    if 0 == len(padded):
+        return (lower, upper)
+
+    assert (0 < counts).all()
+
+    ranks = {}
+    def kth(n):
+        ranks[n] = median_interval_ranks(n, confidence_interval)
+        return list(ranks[n])
+
+    for (rows, n, partitioned) in partition_rows(padded, counts, kth):
+        lower[rows] = partitioned[:, ranks[n][0]]
+        upper[rows] = partitioned[:, ranks[n][1]]
+
+    return (lower, upper)
+
+
+# Default thresholds of reject_outliers(), by method.
+REJECT_THRESHOLDS = {
+    "mad": 3.5,
+    "iqr": 1.5
+}
+
+def kept_samples(padded, counts, method, threshold):
+    """Returns a boolean 2D array which is true for the values of a 2D array,
+    padded past counts[i] values in the i-th row, that reject_outliers()
+    keeps. Rows with NaN values are kept whole."""
+
+    present = np.arange(padded.shape[1]) < counts[:, np.newaxis]
+
+    # Comparisons with NaN are false.
+    with np.errstate(invalid="ignore"):
+        if "mad" == method:
+            median = quantiles_batch(padded, counts, [0.5])
+            deviation = np.abs(padded - median)
+            spread = quantiles_batch(deviation, counts, [0.5])
+            outlier = (0.6745 * deviation > threshold * spread) & \
+                      (deviation > spread)
+        else:
+            quartiles = quantiles_batch(padded, counts, [0.25, 0.75])
+            spread = quartiles[:, 1:2] - quartiles[:, 0:1]
+            outlier = (padded < quartiles[:, 0:1] - threshold * spread) | \
+                      (padded > quartiles[:, 1:2] + threshold * spread)
+
+        return present & ~(outlier & (0 < spread))
+
+
+def reject_outliers(samples, method="mad", threshold=None):
+    """Removes the outliers of many sequences of numbers at once.
+
+    samples takes any form pack_samples() does. method is either "mad", which
+    rejects values whose modified z-score, 0.6745 * |x - median| / (median
+    absolute deviation), is above threshold (by default 3.5, Iglewicz and
+    Hoaglin 1993), or "iqr", which rejects values more than threshold times
+    the interquartile range below the first or above the third quartile (by
+    default 1.5, Tukey's fences). Sequences whose median absolute deviation or
+    interquartile range is 0 are left as they are, and values between the
+    quartiles, or within one median absolute deviation of the median, are
+    never rejected, so no sequence is left empty.
+
+    Returns the remaining values of each sequence, in order: in a 2D array
+    padded with NaN if samples is one, and otherwise as packed_groups."""
+
+    assert method in REJECT_THRESHOLDS
+
+    if threshold is None:
+        threshold = REJECT_THRESHOLDS[method]
+
+    if isinstance(samples, np.ndarray) and 2 == samples.ndim:
+        padded = np.asarray(samples, np.float64)
+
+        if 0 == len(padded):
+            return padded
+
+        kept = kept_samples(padded, (~np.isnan(padded)).sum(axis=1), method,
+                            threshold)
+
+        return pad_groups(padded[kept], kept.sum(axis=1))
+
+    groups = pack_samples(samples)
+
+    if 0 == len(groups):
+        return groups
+
+    # The remaining values of the batches are in order of size; put them back
+    # in the order of the groups.
+    (order, values, counts) = ([], [], [])
+
+    for (rows, padded, batch_counts) in groups.batches():
+        kept = kept_samples(padded, batch_counts, method, threshold)
+
+        order.append(rows)
+        values.append(padded[kept])
+        counts.append(kept.sum(axis=1))
+
+    order = np.concatenate(order)
+
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+
+    return packed_groups(np.concatenate(values),
+                         np.concatenate(counts)).take(inverse)
+
+
+# Number of values drawn at once by bootstrap_batch(), which bounds its memory
+# use (a few arrays of this many float64s). It also decides how groups are
+# batched, and so the random numbers each group gets.
+BOOTSTRAP_BATCH_VALUES = 1 << 21
+
+def NormalCDF(x):
+    """Returns the standard normal CDF of each element of an array."""
+
+    erfc = np.frompyfunc(math.erfc, 1, 1)
+    return 0.5 * erfc(-np.asarray(x, np.float64) / math.sqrt(2)).astype(np.float64)
+
+
+def sorted_quantiles(s, q):
+    """Returns the q[i]-th quantile of each row i of an array with sorted rows,
+    interpolating linearly between order statistics like np.percentile()."""
+
+    rows = np.arange(len(s))
+    position = np.asarray(q, np.float64) * (s.shape[1] - 1)
+    below = np.floor(position).astype(np.intp)
+    above = np.minimum(below + 1, s.shape[1] - 1)
+    fraction = position - below
+    return s[rows, below] + fraction * (s[rows, above] - s[rows, below])
+
+
+def bootstrap_means(job):
+    """Returns the averages of resamples of a batch of groups.
+
+    job is (padded, counts, seed, resamples): padded is a 2D array with one
+    group per row, padded (with anything), and counts the number of values of
+    each group. Each resample of a group draws as many of its values, with
+    replacement, using np.random.RandomState(seed).
+
+    Returns a 2D array with the average of each resample, one row per group."""
+
+    (padded, counts, seed, resamples) = job
+
+    width = padded.shape[1]
+    n = counts.astype(np.float64)[:, np.newaxis, np.newaxis]
+
+    # Draws past the end of a group are not part of the resample.
+    if (width == counts).all():
+        drawn = None
+    else:
+        drawn = (np.arange(width) < counts[:, np.newaxis])[:, np.newaxis, :]
+
+    random = np.random.RandomState(seed)
+
+    means = np.empty((len(padded), resamples))
+
+    # Resample in steps of at most BOOTSTRAP_BATCH_VALUES values.
+    step = max(1, BOOTSTRAP_BATCH_VALUES // (len(padded) * width))
+
+    for begin in range(0, resamples, step):
+        end = min(begin + step, resamples)
+
+        draws = random.random_sample((len(padded), end - begin, width))
+        indices = (draws * n).astype(np.intp)
+        del draws
+
+        values = np.take_along_axis(padded[:, np.newaxis, :], indices, axis=2)
+        del indices
+
+        if drawn is not None:
+            values = np.where(drawn, values, 0.0)
+
+        means[:, begin:end] = values.sum(axis=2) / n[:, :, 0]
+
+    return means
+
+
+def bootstrap_batch(samples, confidence_interval=0.05, resamples=1000,
+                    method="percentile", seed=0, map_function=map):
+    """Returns bootstrap confidence intervals of the averages of many sequences
+    of numbers at once, which do not assume that the averages are normally
+    distributed.
+
+    samples takes any form pack_samples() does; sequences with NaN samples
+    have NaN bounds. method is either "percentile" or "bca" (bias-corrected
+    and accelerated, Efron 1987).
+
+    The sequences are resampled in batches of sequences of similar lengths,
+    each with a np.random.RandomState seeded with (seed, index of the batch),
+    so the results only depend on the samples and seed. The batches are
+    resampled with map_function, e.g. the map() of a process pool.
+
+    Returns arrays (lower bound, upper bound)"""
+
+    assert method in ("percentile", "bca")
+
+    groups = pack_samples(samples)
+
+    if 0 == len(groups):
+        return (np.empty(0), np.empty(0))
+
+    counts = groups.counts
+    assert (0 < counts).all()
+
+    undefined = np.zeros(len(groups), np.bool_)
+
+    if "bca" == method:
+        average = np.empty(len(groups))
+        d2 = np.empty(len(groups))
+        d3 = np.empty(len(groups))
+
+    # Batch sequences of similar lengths, so that little of each batch is
+    # padding.
+    (order, jobs) = ([], [])
+
+    for rows in size_batches(counts, BOOTSTRAP_BATCH_VALUES // resamples):
+        padded = groups[rows]
+
+        present = np.arange(padded.shape[1]) < counts[rows][:, np.newaxis]
+        values = np.where(present, padded, 0.0)
+
+        undefined[rows] = np.isnan(values).any(axis=1)
+
+        order.append(rows)
+        jobs.append((values, counts[rows], (seed, len(jobs)), resamples))
+
+        if "bca" == method:
+            # Sum over the width of the batch, like bootstrap_means() does, so
+            # that resamples which draw the values in order tie with the
+            # average.
+            average[rows] = values.sum(axis=1) / counts[rows]
+
+            deviation = np.where(present,
+                                 padded - average[rows][:, np.newaxis], 0.0)
+            d2[rows] = (deviation ** 2).sum(axis=1)
+            d3[rows] = (deviation ** 3).sum(axis=1)
+
+    means = np.empty((len(groups), resamples))
+    means[np.concatenate(order)] = \
+        np.concatenate(list(map_function(bootstrap_means, jobs)))
+
+    means.sort(axis=1)
+
+    if "percentile" == method:
+        q = np.array([confidence_interval / 2, 1 - confidence_interval / 2])
+        q = np.tile(q, (len(groups), 1))
+    else:
+        # Comparisons with the NaN of sequences with NaN samples are false.
+        with np.errstate(invalid="ignore"):
+            # Bias correction: the fraction of resample averages below the
+            # average (counting ties as half), kept away from 0 and 1.
+            below = (means < average[:, np.newaxis]).sum(axis=1) \
+                  + 0.5 * (means == average[:, np.newaxis]).sum(axis=1)
+            below = np.clip(below / resamples, 0.5 / resamples,
+                            1 - 0.5 / resamples)
+            z0 = np.array([InverseNormal(x) for x in below])
+
+            # Acceleration, from the jackknife averages: the skewness of the
+            # samples over 6.
+            a = np.where(0 < d2,
+                         d3 / (6 * np.power(np.where(0 < d2, d2, 1), 1.5)),
+                         0.0)
+
+        q = np.empty((len(groups), 2))
+        for (x, tail) in enumerate((confidence_interval / 2,
+                                    1 - confidence_interval / 2)):
+            z = z0 + InverseNormal(tail)
+            q[:, x] = NormalCDF(z0 + z / (1 - a * z))
+
+    (lower, upper) = (sorted_quantiles(means, q[:, 0]),
+                      sorted_quantiles(means, q[:, 1]))
+
+    lower[undefined] = np.nan
+    upper[undefined] = np.nan
+
+    return (lower, upper)
+
+
+def welch_batch(average1, variance1, count1, average2, variance2, count2):
+    """Welch's t-test of many pairs of sequences of numbers at once, from the
+    average, sample variance and number of values of each sequence. Does not
+    assume that the variances of a pair are equal.
+
+    Returns arrays (t, degrees of freedom, two-sided p-value), which are NaN
+    where a sequence has fewer than 2 values (or is missing, with a NaN
+    average), or neither sequence varies and their averages are equal. If
+    neither varies but their averages differ, t is infinite, the degrees of
+    freedom NaN and p 0."""
+
+    (average1, variance1, count1, average2, variance2, count2) = \
+        [np.asarray(a, np.float64) for a in
+         (average1, variance1, count1, average2, variance2, count2)]
+
+    t = np.empty(np.broadcast(average1, average2).shape)
+    t.fill(np.nan)
+    degrees_of_freedom = t.copy()
+    p = t.copy()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        s1 = variance1 / count1
+        s2 = variance2 / count2
+        se2 = s1 + s2
+
+        valid = (1 < count1) & (1 < count2) & (0 < se2) & \
+                ~np.isnan(average1) & ~np.isnan(average2)
+
+        constant = (1 < count1) & (1 < count2) & (0 == se2) & \
+                   (average1 != average2)
+        greater = np.broadcast_to(average1 > average2, t.shape)
+
+    t[constant] = np.where(greater[constant], np.inf, -np.inf)
+    p[constant] = 0.0
+
+    s1 = np.broadcast_to(s1, t.shape)[valid]
+    s2 = np.broadcast_to(s2, t.shape)[valid]
+    se2 = s1 + s2
+
+    t[valid] = (np.broadcast_to(average1, t.shape)[valid] -
+                np.broadcast_to(average2, t.shape)[valid]) / np.sqrt(se2)
+
+    # Welch-Satterthwaite equation.
+    degrees_of_freedom[valid] = se2 * se2 / (
+        s1 * s1 / (np.broadcast_to(count1, t.shape)[valid] - 1) +
+        s2 * s2 / (np.broadcast_to(count2, t.shape)[valid] - 1))
+
+    # The probability of |T| > |t| is I(df / (df + t^2), df / 2, 1 / 2).
+    df = degrees_of_freedom[valid]
+    p[valid] = incompleteBetaArray(df / (df + t[valid] * t[valid]), 0.5 * df,
+                                   0.5)
+
+    return (t, degrees_of_freedom, p)
+
+
+def mann_whitney_batch(x, y):
+    """Mann-Whitney U test of many pairs of sequences of numbers at once,
+    which does not assume that the values are normally distributed.
+
+    x and y are 2D arrays with the first and second sequence of each pair in
+    their rows, padded with NaN. The p-value uses the normal approximation,
+    corrected for ties and continuity (like scipy.stats.mannwhitneyu() with
+    alternative="two-sided"), which needs a few values in each sequence to be
+    accurate.
+
+    Returns arrays (U of x, two-sided p-value), which are NaN where a sequence
+    has no values or every value of a pair is the same."""
+
+    x = np.asarray(x, np.float64)
+    y = np.asarray(y, np.float64)
+
+    assert len(x) == len(y)
+
+    n1 = (~np.isnan(x)).sum(axis=1).astype(np.float64)
+    n2 = (~np.isnan(y)).sum(axis=1).astype(np.float64)
+    n = n1 + n2
+
+    # Sort both sequences of a pair together; the padding sorts to the end.
+    combined = np.concatenate([x, y], axis=1)
+    order = np.argsort(combined, axis=1, kind="mergesort")
+    rows = np.arange(len(combined))[:, np.newaxis]
+    s = combined[rows, order]
+
+    # Ties share the average of their ranks, which is (first + last) / 2 + 1
+    # for the first and last 0-based position of the run of ties.
+    width = s.shape[1]
+    position = np.broadcast_to(np.arange(width), s.shape)
+
+    begins = np.ones(s.shape, bool)
+    begins[:, 1:] = s[:, 1:] != s[:, :-1]
+    ends = np.ones(s.shape, bool)
+    ends[:, :-1] = begins[:, 1:]
+
+    first = np.maximum.accumulate(np.where(begins, position, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends, position, width)[:, ::-1],
+                                 axis=1)[:, ::-1]
+
+    present = position < n[:, np.newaxis]
+    ranks = (first + last) / 2.0 + 1
+
+    rank_sum = np.where(present & (order < x.shape[1]), ranks, 0.0).sum(axis=1)
+    u = rank_sum - n1 * (n1 + 1) / 2
+
+    # Each run of t ties contributes t^3 - t, or t^2 - 1 for each of its values.
+    ties = last - first + 1.0
+    tie_sum = np.where(present, ties * ties - 1, 0.0).sum(axis=1)
+
+    p = np.empty(len(x))
+    p.fill(np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = n1 * n2 / 12.0 * ((n + 1) - tie_sum / (n * (n - 1)))
+        valid = (0 < n1) & (0 < n2) & (0 < variance)
+
+    z = (np.abs(u[valid] - n1[valid] * n2[valid] / 2) - 0.5) / \
+        np.sqrt(variance[valid])
+    p[valid] = np.minimum(2 * NormalCDF(-z), 1.0)
+
+    u[~((0 < n1) & (0 < n2))] = np.nan
+
+    return (u, p)
+
+
+class quantile_sketch:
+    """Bounded-memory, mergeable approximation of a distribution.
+
+    This is a merging t-digest (Dunning & Ertl, "Computing Extremely Accurate
+    Quantiles Using t-Digests", 2019): samples are kept as (mean, weight)
+    centroids, and neighbouring centroids are merged once there are more than
+    `compression` of them, keeping small centroids near the tails. Until that
+    happens every sample is its own centroid and quantiles are exact."""
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = [] # Sorted (mean, weight) pairs
+        self.buffer = []    # Unsorted (mean, weight) pairs
+        self.count = 0
+
+    def append(self, x):
+        self.buffer.append((x, 1))
+        self.count += 1
+
+        if len(self.buffer) > self.compression:
+            self.compress()
+
+    def merge(self, other):
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        self.count += other.count
+
+        if len(self.buffer) > self.compression:
+            self.compress()
+
+    def compress(self):
+        points = self.centroids + self.buffer
+        points.sort()
+        self.buffer = []
+
+        if len(points) <= self.compression:
+            self.centroids = points
+            return
+
+        # Merge neighbours while the merged centroid spans at most one unit
+        # of the k1 scale function, k(q) = compression/(2 pi) asin(2q - 1).
+        def limit(q):
+            k = self.compression / (2.0 * math.pi) * math.asin(2.0 * q - 1.0)
+            k = min(k + 1.0, self.compression / 4.0)
+            return (math.sin(2.0 * math.pi * k / self.compression) + 1.0) / 2.0
+
+        total = float(self.count)
+        centroids = []
+        (mean, weight) = points[0]
+        cumulative = 0.0
+        q_limit = limit(0.0)
+
+        for (m, w) in points[1:]:
+            if (cumulative + weight + w) / total <= q_limit:
+                mean = mean + (m - mean) * w / float(weight + w)
+                weight = weight + w
+            else:
+                centroids.append((mean, weight))
+                cumulative += weight
+                q_limit = limit(cumulative / total)
+                (mean, weight) = (m, w)
+
+        centroids.append((mean, weight))
+
+        self.centroids = centroids
+
+    def quantile(self, q):
+        """Returns the sample at index int(q * count) of the sorted samples,
+        or an interpolated estimate of it once centroids have been merged."""
+
+        assert 0 <= q <= 1
+        assert 0 < self.count
+
+        if self.buffer:
+            self.compress()
+
+        index = min(int(q * self.count), self.count - 1)
+
+        if len(self.centroids) == self.count:
+            return self.centroids[index][0]
+
+        # Each centroid is centered at its cumulative weight minus half its
+        # own weight; interpolate between the two centers around the index.
+        rank = index + 0.5
+        cumulative = 0.0
+        previous = None
+
+        for (mean, weight) in self.centroids:
+            center = cumulative + weight / 2.0
+            if rank <= center:
+                if previous is None:
+                    return mean
+                (previous_mean, previous_center) = previous
+                t = (rank - previous_center) / (center - previous_center)
+                return previous_mean + t * (mean - previous_mean)
+            previous = (mean, center)
+            cumulative += weight
+
+        return self.centroids[-1][0]
+
+
+class running_stats:
+    """Streaming accumulator for a sequence of numbers.
+
+    Keeps only the count, mean, sum of squared deviations (Welford's
+    algorithm), min, max and a quantile_sketch for the median, so memory does
+    not grow with the number of samples. Accumulators can be merged (Chan et
+    al.'s parallel algorithm)."""
+
+    def __init__(self, compression=100):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.sketch = quantile_sketch(compression)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / float(self.count)
+        self.m2 += delta * (x - self.mean)
+
+        if self.minimum is None or x < self.minimum:
+            self.minimum = x
+        if self.maximum is None or x > self.maximum:
+            self.maximum = x
+
+        self.sketch.append(x)
+
+    def merge(self, other):
+        if 0 == other.count:
+            return
+
+        if 0 == self.count:
+            self.minimum = other.minimum
+            self.maximum = other.maximum
+        else:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / float(count)
+        self.m2 += other.m2 + delta * delta * self.count * other.count / float(count)
+        self.count = count
+
+        self.sketch.merge(other.sketch)
+
+    def stats(self, confidence_interval=0.05):
+        """Returns the same statistics as stats() would for the accumulated
+        samples; the median is estimated once the sketch has been compressed.
+
+        Returns (average, median, standard deviation, min, max, confidence interval)"""
+
+        assert 0 < self.count
+
+        n = self.count
+        standard_deviation = math.sqrt(self.m2/(n-1 or 1))
+        s_m = standard_deviation / math.sqrt(n)
+        confidence = cached_tinv(confidence_interval, n-1) * s_m if 1 < n else 0.0
+        return self.mean, self.sketch.quantile(0.5), standard_deviation, \
+               self.minimum, self.maximum, confidence
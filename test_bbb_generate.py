@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from sys import exit
+
+from StringIO import StringIO
+
+import bbb_legend
+
+from bbb_error import bbb_error
+
+from bbb_aggregate import aggregator
+
+from bbb_generate import generate_bbb
+
+###############################################################################
+
+def check(condition, fail_msg):
+    if not condition:
+        print fail_msg
+        exit(1)
+
+# Returns (contents, number of records) of generate_bbb().
+def generate(*args, **kwargs):
+    output = StringIO()
+    written = generate_bbb(output, *args, **kwargs)
+    return (output.getvalue(), written)
+
+# Returns the groups of a .bbb file, see aggregator.group().
+def groups_of(contents):
+    lines = contents.splitlines(True)
+    header = [l.rstrip('\n') for l in lines if l.startswith('#')]
+
+    agg = aggregator(bbb_legend.legend(header))
+
+    (partial, messages, comments, error) = \
+        agg.parse_chunk("".join(lines[len(header):]), agg.master)
+
+    check(error is None and [] == messages,
+          "ERROR: Generated file has errors: "+str((error, messages))+".")
+
+    return agg.group()
+
+# Every group has the requested number of samples, and the values of the first
+# CTL are quoted strings or integers.
+(contents, written) = generate(2, 2, 3, 1000, 8, quoted=0.5, seed=1)
+
+groups = groups_of(contents)
+
+check(1000 == written and 1000 == len(contents.splitlines()) - 7,
+      "ERROR: generate_bbb() wrote "+str(written)+" records.")
+
+check(125 == sum(len(dataset) for (key, dataset) in groups) and
+      all([8, 8, 8] == counts for (key, dataset) in groups
+                              for (iv, counts) in dataset),
+      "ERROR: generate_bbb() wrote the groups "+str(groups)+".")
+
+check(any(isinstance(key[0], str) for (key, dataset) in groups) and
+      any(isinstance(key[0], int) for (key, dataset) in groups),
+      "ERROR: generate_bbb() quoted the values "+\
+      str([key for (key, dataset) in groups])+".")
+
+# Missing samples leave groups with fewer samples. The same seed gives the same
+# file.
+(contents, written) = generate(1, 1, 1, 1000, 10, missing=0.3, seed=2)
+
+counts = [counts[0] for (key, dataset) in groups_of(contents)
+                    for (iv, counts) in dataset]
+
+check(written == sum(counts) and 600 < written < 800 and max(counts) <= 10 and
+      min(counts) < 10,
+      "ERROR: generate_bbb() wrote "+str(written)+" records with the "+\
+      "counts "+str(counts)+".")
+
+check(contents == generate(1, 1, 1, 1000, 10, missing=0.3, seed=2)[0] and
+      contents != generate(1, 1, 1, 1000, 10, missing=0.3, seed=3)[0],
+      "ERROR: generate_bbb() does not depend on the seed only.")
+
+# Without CTLs and INDs there is one group.
+groups = groups_of(generate(0, 0, 2, 50, 10)[0])
+
+check(1 == len(groups) and [((), [50, 50])] == groups[0][1],
+      "ERROR: generate_bbb() wrote the groups "+str(groups)+".")
+
+for (args, kwargs) in (((1, 1, 0), {}), ((1, 1, 1, 10, 0), {}),
+                       ((), {"quoted": 2.0}), ((), {"missing": 1.0})):
+    try:
+        generate(*args, **kwargs)
+        check(False, "ERROR: generate_bbb() accepted "+str((args, kwargs))+".")
+    except bbb_error:
+        pass
+
+print "generate: OK"
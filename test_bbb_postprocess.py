@@ -0,0 +1,310 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from sys import exit
+
+from os import remove, fdopen
+
+from tempfile import mkstemp
+
+from StringIO import StringIO
+
+from json import loads
+
+from re import findall as re_findall
+
+from pstats import Stats
+
+import numpy as np
+
+from bbb_error import bbb_error
+
+from bbb_postprocess import postprocess, postprocess_options, \
+                            parse_postprocess_args
+
+###############################################################################
+
+def check(condition, fail_msg):
+    if not condition:
+        print fail_msg
+        exit(1)
+
+def write_input(contents):
+    (fd, name) = mkstemp(suffix=".bbb")
+    f = fdopen(fd, 'w')
+    f.write(contents)
+    f.close()
+    return name
+
+# Returns (output data, output header, log, result) of postprocess().
+def run(names, options=None):
+    output_data = StringIO()
+    output_header = StringIO()
+    log = StringIO()
+
+    result = postprocess(names, output_data, output_header, options, log)
+
+    return (output_data.getvalue(), output_header.getvalue(), log.getvalue(),
+            result)
+
+contents = ("## CTL:TH:Threads:\n"
+            "## IND:SZ:Size:bytes\n"
+            "## DEP:T:Time:s\n"
+            "1 8 1.0\n"
+            "1 8 3.0\n"
+            "2 8 2.0\n"
+            "1 16 4.0\n"
+            "2 8 2.0\n"
+            "1 16 5.0\n")
+
+name = write_input(contents)
+other = write_input("## CTL:TH:Threads:\n## DEP:T:Time:s\n1 1.0\n")
+
+try:
+    ###########################################################################
+    # postprocess() can be called repeatedly, and every mode gives the same
+    # groups
+
+    expected = None
+
+    for options in (None, postprocess_options(columnar=True),
+                    postprocess_options(streaming=True)):
+        for repeat in range(2):
+            (data, header, log, (legend, groups, dep_stats)) = \
+                run([name], options)
+
+            check([(key, [iv for (iv, counts) in dataset])
+                   for (key, dataset) in groups] ==
+                  [((1,), [(1, 8), (1, 16)]), ((2,), [(2, 8)])],
+                  "ERROR: postprocess() grouped "+str(groups)+".")
+
+            check(dep_stats[2][0][0] == 2.0 and dep_stats[2][1][0] == 4.5,
+                  "ERROR: postprocess() averaged "+str(dep_stats)+".")
+
+            check('T_AVG="3"' in header,
+                  "ERROR: postprocess() wrote the header "+repr(header)+".")
+
+            if expected is None:
+                expected = data
+
+            if options is None or not options.streaming:
+                check(expected == data,
+                      "ERROR: postprocess() wrote "+repr(data)+", expected "+\
+                      repr(expected)+".")
+
+    # Binary output has the values of the text output.
+    (binary, header, log, result) = \
+        run([name], postprocess_options(binary=True))
+
+    rows = [[float(x) for x in line.split()]
+            for line in expected.splitlines()
+            if line and '#' != line[0] and '"' != line[0]]
+
+    check(np.allclose(np.fromstring(binary, '<f8'), sum(rows, []), 1e-9),
+          "ERROR: postprocess() wrote the binary data "+\
+          str(np.fromstring(binary, '<f8'))+" for "+str(rows)+".")
+
+    check("format=\"%5float64\" endian=little record=2:1'" in header and
+          'TITLE_1="2"' in header,
+          "ERROR: postprocess() wrote the binary header "+repr(header)+".")
+
+    # NumPy and JSON Lines output.
+    npz = write_input("")
+    jsonl = write_input("")
+
+    run([name], postprocess_options(npz=npz, jsonl=jsonl))
+
+    arrays = np.load(npz)
+
+    check(arrays["TH"].tolist() == [1, 1, 2] and
+          arrays["SZ"].tolist() == [8, 16, 8] and
+          arrays["T_AVG"].tolist() == [2.0, 4.5, 2.0] and
+          arrays["T_N"].tolist() == [2, 2, 2] and
+          arrays["DATASET"].tolist() == [0, 0, 1] and
+          arrays["DATASET_TITLES"].tolist() == ["1", "2"],
+          "ERROR: postprocess() wrote the arrays "+\
+          str(dict(arrays.items()))+".")
+
+    arrays.close()
+
+    lines = open(jsonl).read().splitlines()
+
+    objects = [loads(line) for line in lines]
+
+    check(3 == len(objects) and 4.5 == objects[1]["T_AVG"] and
+          2 == objects[1]["T_N"] and 16 == objects[1]["SZ"] and
+          "2" == objects[2]["TITLE"],
+          "ERROR: postprocess() wrote the objects "+str(objects)+".")
+
+    # The names are in legend order.
+    check(["TH", "SZ", "T_AVG", "T_STD", "T_CON", "T_N", "DATASET", "TITLE"] ==
+          re_findall(r'"(\w+)": ', lines[0]),
+          "ERROR: postprocess() wrote the object "+lines[0]+".")
+
+    remove(npz)
+    remove(jsonl)
+
+    # Significance tests: TH 1 and 2 only share SZ 8, where the samples are
+    # [1, 3] and [2, 2].
+    significance = write_input("")
+
+    run([name], postprocess_options(significance=significance,
+                                    mann_whitney=True))
+
+    arrays = np.load(significance)
+
+    check(arrays["FIRST"].tolist() == [0] and
+          arrays["SECOND"].tolist() == [1] and
+          arrays["SZ"].tolist() == [8, 16] and
+          arrays["T_WELCH_T"][0, 0] == 0.0 and
+          arrays["T_WELCH_DF"][0, 0] == 1.0 and
+          arrays["T_WELCH_P"][0, 0] == 1.0 and
+          arrays["T_MWU_U"][0, 0] == 2.0 and
+          arrays["T_MWU_P"][0, 0] == 1.0 and
+          np.isnan(arrays["T_WELCH_P"][0, 1]) and
+          np.isnan(arrays["T_MWU_P"][0, 1]),
+          "ERROR: postprocess() wrote the significance arrays "+\
+          str(dict(arrays.items()))+".")
+
+    arrays.close()
+
+    remove(significance)
+
+    # Profiling: the phases, the counts, and a cProfile dump.
+    for columnar in (False, True):
+        profile = write_input("")
+        cprofile = write_input("")
+
+        run([name], postprocess_options(columnar=columnar,
+                                        profile_json=profile,
+                                        cprofile=cprofile))
+
+        report = loads(open(profile).read())
+
+        phases = [p["name"] for p in report["phases"]]
+
+        check(set(["legend", "tokenize", "filter", "group", "sample size",
+                   "statistics", "write"]) <= set(phases) and
+              6 == report["rows"] and
+              len(contents) - contents.index("1 8 1.0") == report["bytes"] and
+              2 == report["datasets"] and 3 == report["groups"] and
+              6 == report["samples"] and 0 < report["peak_rss_kb"],
+              "ERROR: postprocess() wrote the profile "+str(report)+".")
+
+        check(0 < Stats(cprofile).total_calls,
+              "ERROR: postprocess() wrote an empty cProfile dump.")
+
+        remove(profile)
+        remove(cprofile)
+
+    # Filters and classifications.
+    (data, header, log, (legend, groups, dep_stats)) = \
+        run([name], postprocess_options(inclusive_filters=["SZ>8"],
+                                        variable_classifications=["TH=IND"]))
+
+    check([iv for (key, dataset) in groups for (iv, counts) in dataset] ==
+          [(1, 16)],
+          "ERROR: postprocess() filtered "+str(groups)+".")
+
+    # NaN samples make the statistics of their group NaN in every mode, even
+    # when the group has nothing else.
+    nan_name = write_input("## CTL:TH:Threads:\n## DEP:T:Time:s\n"
+                           "1 nan\n1 3.0\n1 5.0\n2 nan\n2 nan\n3 4.0\n")
+
+    try:
+        for options in (None, postprocess_options(columnar=True),
+                        postprocess_options(streaming=True)):
+            (data, header, log, (legend, groups, dep_stats)) = \
+                run([nan_name], options)
+
+            check(all(x != x for x in dep_stats[1][0] + dep_stats[1][1]) and
+                  (4.0, 0.0, 0.0) == dep_stats[1][2] and
+                  "1 nan nan nan" in data,
+                  "ERROR: postprocess() wrote "+repr(data)+" for NaN "+\
+                  "samples.")
+    finally:
+        remove(nan_name)
+
+    ###########################################################################
+    # Invalid options and input files raise bbb_error
+
+    def check_error(names, options, expected):
+        try:
+            run(names, options)
+        except bbb_error as e:
+            check(expected == str(e),
+                  "ERROR: postprocess() raised '"+str(e)+"', expected '"+\
+                  expected+"'.")
+            return
+
+        check(False, "ERROR: postprocess() did not raise '"+expected+"'.")
+
+    check_error([name, other], None,
+                "The variable declarations of '"+other+"' do not match "+\
+                "those of '"+name+"'.")
+
+    check_error([name], postprocess_options(inclusive_filters=["X=1"]),
+                "Tag 'X' from inclusive filter (-i) 'X=1' not found in "+\
+                "input file.")
+
+    # Filters that leave no records.
+    for options in (postprocess_options(exclusive_filters=["SZ>0"]),
+                    postprocess_options(exclusive_filters=["SZ>0"],
+                                        columnar=True),
+                    postprocess_options(exclusive_filters=["SZ>0"],
+                                        streaming=True)):
+        check_error([name], options,
+                    "No records matched the filters (-i, -o).")
+
+    check_error([other], postprocess_options(inclusive_filters=["TH=2"]),
+                "No records matched the filters (-i, -o).")
+
+    empty = write_input("## CTL:TH:Threads:\n## DEP:T:Time:s\n")
+    check_error([empty], None, "The input files have no records.")
+    remove(empty)
+
+    check_error([name], postprocess_options(exclusive_filters=["X=1"]),
+                "Tag 'X' from exclusive filter (-o) 'X=1' not found in "+\
+                "input file.")
+
+    check_error([name], postprocess_options(streaming=True, columnar=True),
+                "Streaming (-s) and columnar (-c) aggregation cannot be "+\
+                "combined.")
+
+    text = write_input(contents + "2 16 fast\n")
+
+    for options in (None, postprocess_options(columnar=True),
+                    postprocess_options(streaming=True)):
+        check_error([text], options,
+                    "Dependent variable 'T' has non-numeric values.")
+
+    remove(text)
+
+    ###########################################################################
+    # Command line arguments are parsed as postprocess_bbb.py parses them
+
+    (options, args) = parse_postprocess_args(["-c", "-i", "SZ>8", name])
+
+    check(options.columnar and ["SZ>8"] == options.inclusive_filters and
+          [name] == args,
+          "ERROR: parse_postprocess_args() parsed "+str(options)+".")
+
+    for argv in (["-z", name], ["-j", "x", name], [name, "out.bbb"]):
+        try:
+            parse_postprocess_args(argv)
+            check(False, "ERROR: parse_postprocess_args() accepted "+\
+                         str(argv)+".")
+        except bbb_error:
+            pass
+finally:
+    remove(name)
+    remove(other)
+
+print "postprocess: OK"
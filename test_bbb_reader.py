@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from sys import exit
+
+from os import remove
+
+from tempfile import mkstemp
+
+from random import Random
+
+from bbb_reader import chunked_reader
+
+###############################################################################
+
+def check(condition, fail_msg):
+    if not condition:
+        print fail_msg
+        exit(1)
+
+(handle, name) = mkstemp(suffix=".bbb")
+
+def check_file(contents, header, offset):
+    f = open(name, 'wb')
+    f.write(contents)
+    f.close()
+
+    reader = chunked_reader(name)
+
+    actual = reader.header()
+    check((header, offset) == actual,
+          "ERROR: Header of "+repr(contents)+" is "+repr(actual)+".")
+
+    # Chunks must cover the data exactly, and only the last may end without a
+    # newline.
+    for chunk_size in (1, 2, 3, 7, 64, 1 << 20):
+        chunks = list(reader.chunks(offset, chunk_size=chunk_size))
+
+        check(contents[offset:] == "".join(chunks),
+              "ERROR: Chunks of "+repr(contents)+" are "+repr(chunks)+".")
+
+        for chunk in chunks[:-1]:
+            check(chunk.endswith('\n'),
+                  "ERROR: Chunk "+repr(chunk)+" does not end at a newline.")
+
+    reader.close()
+
+check_file("", [], 0)
+check_file("\n\n", ["", ""], 2)
+check_file("## CTL:A:a:\n# x\n1\n2", ["## CTL:A:a:", "# x"], 16)
+check_file("  # x\r\n\t\n1 2\n# y\n3 4\n", ["  # x\r", "\t"], 9)
+
+rng = Random(17)
+
+# The header of a file without comments is its leading blank lines.
+for i in range(200):
+    contents = "".join(rng.choice("ab \n") for k in range(rng.randint(0, 60)))
+
+    header = []
+    offset = 0
+    for line in contents.splitlines(True):
+        if line.strip():
+            break
+        header.append(line.rstrip('\n'))
+        offset += len(line)
+
+    check_file(contents, header, offset)
+
+remove(name)
+
+print "chunked_reader: OK"
@@ -10,8 +10,15 @@
 
 from sys import exit
 
+from random import Random
+
 from re import compile as regex_compile
 
+from bbb_record_parser import parse_record
+
+# The original record parser, which matches one cell at a time. It is the
+# reference that the fast paths of bbb_record_parser must agree with.
+#
 # We take a single line as an input, and need to produce a tuple of cells. The
 # input contains NO new lines and is NOT empty (so we assume it has at least
 # one cell). The delimiter between cells is whitespace and multiple whitespace
@@ -19,7 +26,7 @@ from re import compile as regex_compile
 # strings and may contain whitespace.
 #
 # Precondition: line has been strip()'d and is not an empty string
-class record_parser:
+class reference_record_parser:
     engine = None
 
     ###########################################################################
@@ -70,7 +77,7 @@ class record_parser:
 
 ###############################################################################
 
-parse_record = record_parser() 
+parse_reference = reference_record_parser()
 
 ###############################################################################
 
@@ -234,3 +241,107 @@ print parse_record('17 3.14 true 1e-07 "hello world"')
 
 print parse_record('17 3.14 true 1e-07 "hello world" ')
 
+
+###############################################################################
+# Equivalence with the reference parser
+
+# Returns the record, or None if the parser asserts.
+def try_parse(parser, line):
+    try:
+        return parser(line)
+    except AssertionError:
+        return None
+
+def check_equivalent(line):
+    expected = try_parse(parse_reference, line)
+    actual = try_parse(parse_record, line)
+
+    if expected != actual:
+        print "ERROR: Parsed "+repr(line)+" as "+repr(actual)+" instead of "+\
+              repr(expected)+"."
+        exit(1)
+
+for line in [
+    "", " ", "  ", "	", "\n", " \n",
+    "17 3.14 true 1e-07", "17 3.14 true 1e-07 ", "17 3.14 true 1e-07		",
+    " 17 3.14 true 1e-07", "	17 3.14 true 1e-07", "17		3.14	true			1e-07",
+    '"', '""', '\\', '\\"', '"\\""', '3.14"', '3.14""', '"3.14', '""3.14',
+    '3"14', '3""14', '3"1"4', '"hello"', '"hello world"', '"hello" "world"',
+    '"hello world" 17 3.14 true 1e-07', '17 3.14 true 1e-07 "hello world"',
+    '17 3.14 true 1e-07 "hello world" ', '"a" b "c', 'a "b c" d "e',
+    # \v and \f are whitespace to str.split(), but not to the grammar.
+    "17\v3.14", "17 \f 3.14", "\v17", "17\r3.14", "17 3.14\n",
+]:
+    check_equivalent(line)
+
+# Random lines over an alphabet that exercises every rule of the grammar.
+rng = Random(17)
+
+alphabet = ['a', '1', '.', '-', ' ', ' ', '\t', '\r', '\n', '\v', '\f',
+            '"', '"', '\\']
+
+for i in range(20000):
+    length = rng.randint(0, 12)
+    check_equivalent("".join(rng.choice(alphabet) for j in range(length)))
+
+# Random lines of plain, space-delimited cells with a few quoted strings.
+for i in range(5000):
+    cells = []
+    for j in range(rng.randint(1, 8)):
+        if rng.random() < 0.2:
+            cells.append('"' + " ".join(["x"] * rng.randint(0, 3)) + '"')
+        else:
+            cells.append(str(rng.randint(-100, 100)))
+    check_equivalent(rng.choice([" ", "\t", "  "]).join(cells))
+
+print "record_parser equivalence: OK"
+
+###############################################################################
+# Chunks of lines must tokenize like their lines one at a time
+
+# Returns the records of the non-blank lines of chunk, or None if one of them
+# asserts.
+def parse_lines_reference(chunk):
+    records = []
+
+    for line in chunk.split('\n'):
+        line = line.strip()
+        if 0 != len(line):
+            record = try_parse(parse_reference, line)
+            if record is None:
+                return None
+            records.append(record)
+
+    return records
+
+def check_lines_equivalent(chunk):
+    actual = parse_record.parse_lines(chunk)
+
+    if actual is None:
+        if '#' in chunk or '\v' in chunk or '\f' in chunk:
+            return
+        print "ERROR: Chunk "+repr(chunk)+" was not tokenized."
+        exit(1)
+
+    expected = parse_lines_reference(chunk)
+
+    if expected != actual:
+        print "ERROR: Tokenized chunk "+repr(chunk)+" as "+repr(actual)+\
+              " instead of "+repr(expected)+"."
+        exit(1)
+
+for chunk in [
+    "", "\n", "17 3.14\n", "17 3.14\n42 2.71", "  17 3.14  \n\n\t42 2.71\r\n",
+    '17 "hello world"\n"a b" 3\n', "# comment\n17 3.14\n", "17\v3.14\n",
+]:
+    check_lines_equivalent(chunk)
+
+for i in range(5000):
+    lines = []
+    for j in range(rng.randint(0, 6)):
+        length = rng.randint(0, 12)
+        lines.append("".join(rng.choice(alphabet[:-5] + ['"', '\\'])
+                             for k in range(length)))
+    check_lines_equivalent("\n".join(lines))
+
+print "record_parser chunks: OK"
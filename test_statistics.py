@@ -0,0 +1,648 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Copyright (c) 2012-6 Bryce Adelstein Lelbach aka wash <brycelelbach@gmail.com>
+#
+# Distributed under the Boost Software License, Version 1.0. (See accompanying
+# file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+###############################################################################
+
+from sys import exit
+
+from random import Random
+
+from os import remove, fdopen
+
+from tempfile import mkstemp
+
+import math
+
+import numpy as np
+
+from statistics import stats, stats_batch, pad_samples, running_stats,      \
+                       InverseStudentT, InverseStudentTUpper, InverseNormal, \
+                       StudentTCDF, tinv, TINV_TABLE, bootstrap_batch,      \
+                       sorted_quantiles, robust_batch, reject_outliers,     \
+                       percentiles_batch, median_interval_ranks,            \
+                       median_interval_batch, lru_cache, cached_tinv,       \
+                       logGamma, logGammaArray, incompleteBeta,             \
+                       incompleteBetaArray, StudentTCDFArray, welch_batch,  \
+                       mann_whitney_batch, packed_groups, pack_samples,    \
+                       BATCH_CELLS
+
+###############################################################################
+
+def check(condition, fail_msg):
+    if not condition:
+        print fail_msg
+        exit(1)
+
+###############################################################################
+# stats_batch() must agree exactly with stats()
+
+def check_stats_batch(samples, confidence_interval):
+    batch = stats_batch(samples, confidence_interval)
+
+    for (g, r) in enumerate(samples):
+        expected = stats(r, confidence_interval)
+        actual = tuple(column[g] for column in batch)
+
+        check(expected == actual,
+              "ERROR: stats_batch() disagrees with stats() for "+str(r)+": "+\
+              str(actual)+" != "+str(expected)+".")
+
+rng = Random(17)
+
+# Ragged groups of floats.
+check_stats_batch(
+    [[rng.gauss(100.0, 15.0) for i in range(rng.randint(1, 40))]
+     for g in range(200)],
+    0.05
+)
+
+# Ragged groups of integers.
+check_stats_batch(
+    [[rng.randint(0, 1000) for i in range(rng.randint(1, 12))]
+     for g in range(200)],
+    0.01
+)
+
+# Single samples and constant groups.
+check_stats_batch([[3.5], [7], [2.0, 2.0, 2.0], [-1.25, -1.25]], 0.05)
+
+# Padded input.
+samples = [[1.0, 2.0, 3.0], [4.0], [5.0, 6.0]]
+padded = pad_samples(samples)
+
+check(padded.shape == (3, 3), "ERROR: pad_samples() has the wrong shape.")
+check(np.isnan(padded[1, 1:]).all(), "ERROR: pad_samples() did not pad.")
+
+for (expected, actual) in zip(stats_batch(samples), stats_batch(padded)):
+    check((expected == actual).all(),
+          "ERROR: stats_batch() differs for padded and ragged input.")
+
+# No groups at all.
+check(all(0 == len(x) for x in stats_batch([])),
+      "ERROR: stats_batch() of no groups is not empty.")
+
+# Very uneven groups: many single samples and a few pairs, and one group far
+# longer than the others, which would take over 10 GB padded all at once.
+uneven = [[rng.random()] for g in range(5000)] + \
+         [[rng.gauss(0.0, 1.0) for i in range(BATCH_CELLS // 4)]] + \
+         [[rng.random(), rng.random()] for g in range(1000)]
+
+check_stats_batch(uneven, 0.05)
+
+groups = pack_samples(uneven)
+
+check(all(1 == len(rows) or len(rows) * padded.shape[1] <= BATCH_CELLS
+          for (rows, padded, counts) in groups.batches()),
+      "ERROR: packed_groups.batches() has a batch of more than "+\
+      str(BATCH_CELLS)+" cells.")
+
+check(uneven == groups.tolist() and
+      percentiles_batch(groups, [50])[5000, 0] == np.percentile(uneven[5000],
+                                                                50),
+      "ERROR: packed_groups do not keep the order of the groups.")
+
+# NaN samples are samples, not padding: they make the average, standard
+# deviation and confidence interval NaN, as in stats(), even for a group of
+# nothing else.
+def same(a, b):
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+nan_groups = [[np.nan, 3.0, 5.0], [np.nan, np.nan], [2.0, 4.0]]
+
+for samples in (nan_groups, packed_groups([np.nan, 3.0, 5.0, np.nan, np.nan,
+                                           2.0, 4.0], [3, 2, 2])):
+    batch = stats_batch(samples)
+
+    for (g, r) in enumerate(nan_groups):
+        expected = stats(r)
+
+        check(all(same(expected[x], batch[x][g]) for x in (0, 2, 5)),
+              "ERROR: stats_batch() is "+str([c[g] for c in batch])+\
+              ", expected "+str(expected)+" for "+str(r)+".")
+
+    check(np.isnan(bootstrap_batch(samples, 0.05, 100)[0][:2]).all() and
+          3 == len(robust_batch(samples)[0]) and
+          (3, 1) == percentiles_batch(samples, [50]).shape and
+          3 == len(median_interval_batch(samples)[0]),
+          "ERROR: The batched statistics do not take NaN samples.")
+
+print "stats_batch: OK"
+
+###############################################################################
+# running_stats must agree with stats(), and merging must agree with appending
+
+def close(a, b, tolerance=1e-9):
+    return abs(a - b) <= tolerance * max(1.0, abs(a), abs(b))
+
+def check_running_stats(acc, r, exact_median):
+    expected = stats(r, 0.05)
+    actual = acc.stats(0.05)
+
+    check(len(acc) == len(r), "ERROR: running_stats has the wrong count.")
+
+    for (e, a, name) in zip(expected, actual, ("average", "median", "stdev",
+                                                "min", "max", "confidence")):
+        if "median" == name and not exact_median:
+            continue
+        check(close(e, a),
+              "ERROR: running_stats "+name+" is "+str(a)+", expected "+\
+              str(e)+" for "+str(r)+".")
+
+for size in (1, 2, 3, 10, 100):
+    r = [rng.expovariate(0.1) for i in range(size)]
+
+    acc = running_stats()
+    for x in r:
+        acc.append(x)
+    check_running_stats(acc, r, True)
+
+    # Merge accumulators of unequal halves, including empty ones.
+    for split in (0, size / 3, size):
+        left = running_stats()
+        right = running_stats()
+        for x in r[:split]:
+            left.append(x)
+        for x in r[split:]:
+            right.append(x)
+        left.merge(right)
+        check_running_stats(left, r, True)
+
+# Large groups: memory stays bounded and the median is a close estimate.
+r = [rng.gauss(0.0, 1.0) for i in range(20000)]
+
+acc = running_stats()
+for x in r:
+    acc.append(x)
+check_running_stats(acc, r, False)
+
+centroids = len(acc.sketch.centroids) + len(acc.sketch.buffer)
+check(centroids < 400,
+      "ERROR: quantile_sketch keeps "+str(centroids)+" centroids.")
+
+s = sorted(r)
+median = acc.stats()[1]
+rank = sum(1 for x in s if x < median)
+check(abs(rank - len(s) / 2) < len(s) / 200,
+      "ERROR: quantile_sketch median "+str(median)+" has rank "+str(rank)+\
+      " of "+str(len(s))+".")
+
+print "running_stats: OK"
+
+###############################################################################
+# Inverse Student's t accuracy
+
+# (degree_of_freedom, q, x) where the probability of a value > x is q. Computed
+# to 40 digits with mpmath.
+t_references = [
+    (1, 0.25, 1.0),
+    (1, 0.025, 12.706204736174705),
+    (1, 0.0001, 3183.098757118151),
+    (2, 0.1, 1.8856180831641267),
+    (2, 0.005, 9.924843200918293),
+    (3, 0.025, 3.1824463052837095),
+    (4, 0.05, 2.1318467863266504),
+    (5, 0.4, 0.26718086570414507),
+    (7.5, 0.1, 1.4052118464159529),
+    (9, 0.025, 2.2621571627982053),
+    (13, 1e-08, 12.043990210291556),
+    (29, 0.005, 2.7563859036706053),
+    (30, 0.025, 2.042272456301238),
+    (57, 0.025, 2.0024654592910074),
+    (101, 0.025, 1.9837310029556061),
+    (150, 0.05, 1.6550755001871753),
+    (1000, 0.025, 1.9623390808264085),
+    (1000, 0.0001, 3.732851604575368),
+    (0.5, 0.1, 10.270324410234505),
+    (1.5, 0.025, 6.0166631044279315),
+]
+
+for (df, q, x) in t_references:
+    actual = InverseStudentTUpper(df, q)
+    check(close(x, actual, 1e-12),
+          "ERROR: InverseStudentTUpper("+str(df)+", "+str(q)+") is "+\
+          repr(actual)+", expected "+repr(x)+".")
+
+    # 1 - q is inexact, which matters in the far tail.
+    if q < 0.001:
+        continue
+
+    actual = InverseStudentT(df, 1 - q)
+    check(close(x, actual, 1e-12),
+          "ERROR: InverseStudentT("+str(df)+", "+str(1 - q)+") is "+\
+          repr(actual)+", expected "+repr(x)+".")
+
+    actual = InverseStudentT(df, q)
+    check(close(-x, actual, 1e-12),
+          "ERROR: InverseStudentT("+str(df)+", "+str(q)+") is "+\
+          repr(actual)+", expected "+repr(-x)+".")
+
+# Round trip through the CDF.
+for df in (1, 2, 3, 6, 10, 24, 75, 300):
+    for p in (0.001, 0.05, 0.3, 0.5, 0.8, 0.975, 0.9999):
+        actual = StudentTCDF(df, InverseStudentT(df, p))
+        check(close(p, actual, 1e-12),
+              "ERROR: StudentTCDF(InverseStudentT("+str(df)+", "+str(p)+\
+              ")) is "+repr(actual)+".")
+
+# The precomputed table must agree with the direct method.
+for (p, table) in TINV_TABLE.iteritems():
+    for (i, x) in enumerate(table):
+        actual = InverseStudentTUpper(i + 1, p / 2.0)
+        check(close(x, actual, 1e-12),
+              "ERROR: TINV_TABLE["+str(p)+"]["+str(i)+"] is "+repr(x)+\
+              ", but the direct method gives "+repr(actual)+".")
+
+check(tinv(0.05, 9) == TINV_TABLE[0.05][8], "ERROR: tinv() ignores the table.")
+check(close(tinv(0.05, 150), 1.9759053308966206, 1e-12),
+      "ERROR: tinv(0.05, 150) is "+repr(tinv(0.05, 150))+".")
+check(close(tinv(0.2, 12), 1.3562173340232053, 1e-12),
+      "ERROR: tinv(0.2, 12) is "+repr(tinv(0.2, 12))+".")
+
+# Inverse normal, including both tails of the rational approximation.
+for (p, x) in ((0.5, 0.0), (0.975, 1.9599639845400543),
+               (0.01, -2.326347874040841), (1e-10, -6.361340902404057)):
+    actual = InverseNormal(p)
+    check(abs(x - actual) <= 1e-14 * max(1.0, abs(x)),
+          "ERROR: InverseNormal("+str(p)+") is "+repr(actual)+".")
+
+print "InverseStudentT: OK"
+
+###############################################################################
+# Bootstrap confidence intervals
+
+# Quantiles of sorted rows agree with np.percentile().
+s = np.sort(np.array([[rng.gauss(0.0, 1.0) for i in range(37)]
+                      for g in range(5)]), axis=1)
+q = np.array([0.0, 0.025, 0.5, 0.975, 1.0])
+
+for (g, x) in enumerate(q):
+    check(close(np.percentile(s[g], 100 * x), sorted_quantiles(s, q)[g]),
+          "ERROR: sorted_quantiles() disagrees with np.percentile() for "+\
+          str(x)+".")
+
+# Reference BCa interval of the average of r, given the sorted averages of its
+# resamples.
+def bca_reference(r, means, confidence_interval):
+    average = sum(r) / float(len(r))
+    below = (sum(1 for m in means if m < average) +
+             0.5 * sum(1 for m in means if m == average)) / float(len(means))
+    below = min(max(below, 0.5 / len(means)), 1 - 0.5 / len(means))
+    z0 = InverseNormal(below)
+
+    d2 = sum((x - average) ** 2 for x in r)
+    d3 = sum((x - average) ** 3 for x in r)
+    a = d3 / (6 * d2 ** 1.5) if 0 < d2 else 0.0
+
+    bounds = []
+    for tail in (confidence_interval / 2, 1 - confidence_interval / 2):
+        z = z0 + InverseNormal(tail)
+        p = 0.5 * math.erfc(-(z0 + z / (1 - a * z)) / math.sqrt(2))
+        bounds.append(np.percentile(means, 100 * p))
+    return bounds
+
+# Skewed samples, one group at a time, so that the averages of the resamples
+# can be recorded.
+for size in (3, 10, 50):
+    r = [rng.expovariate(1.0) for i in range(size)]
+
+    recorded = []
+    def recording_map(function, jobs):
+        results = map(function, jobs)
+        recorded.extend(results)
+        return results
+
+    (lower, upper) = bootstrap_batch([r], 0.05, 2000, "bca", 7, recording_map)
+
+    means = np.sort(recorded[0][0])
+    expected = bca_reference(r, means, 0.05)
+
+    check(close(expected[0], lower[0]) and close(expected[1], upper[0]),
+          "ERROR: bootstrap_batch() BCa interval is "+\
+          str((lower[0], upper[0]))+", expected "+str(expected)+".")
+
+    (lower, upper) = bootstrap_batch([r], 0.05, 2000, "percentile", 7)
+
+    check(close(np.percentile(means, 2.5), lower[0]) and
+          close(np.percentile(means, 97.5), upper[0]),
+          "ERROR: bootstrap_batch() percentile interval is wrong.")
+
+# Ragged groups: the results do not depend on how the resamples are mapped,
+# only on the seed, and intervals contain the average.
+samples = [[rng.lognormvariate(0.0, 1.0) for i in range(rng.randint(1, 60))]
+           for g in range(300)]
+
+for method in ("percentile", "bca"):
+    first = bootstrap_batch(samples, 0.05, 500, method, 3)
+    second = bootstrap_batch(samples, 0.05, 500, method, 3,
+                             lambda f, jobs: [f(job) for job in jobs])
+    other = bootstrap_batch(samples, 0.05, 500, method, 4)
+
+    check((first[0] == second[0]).all() and (first[1] == second[1]).all(),
+          "ERROR: bootstrap_batch() depends on the map function.")
+    check((first[0] != other[0]).any(),
+          "ERROR: bootstrap_batch() ignores the seed.")
+
+    average = stats_batch(samples)[0]
+
+    check((first[0] <= average + 1e-12).all() and
+          (average - 1e-12 <= first[1]).all(),
+          "ERROR: bootstrap_batch() "+method+" interval misses the average.")
+
+    # A single sample has no spread.
+    for (g, r) in enumerate(samples):
+        if 1 == len(r):
+            check(first[0][g] == first[1][g] == r[0],
+                  "ERROR: bootstrap_batch() interval of "+str(r)+" is "+\
+                  str((first[0][g], first[1][g]))+".")
+
+print "bootstrap_batch: OK"
+
+###############################################################################
+# Robust statistics and outlier rejection
+
+# Reference robust statistics of r, with full sorts.
+def robust_reference(r, trim):
+    s = sorted(r)
+    n = len(s)
+    k = int(trim * n)
+    median = np.percentile(s, 50)
+    mad = np.percentile([abs(x - median) for x in s], 50)
+    trimmed = sum(s[k:n - k]) / float(n - 2 * k)
+    winsorized = sum([s[k]] * k + s[k:n - k] + [s[n - k - 1]] * k) / float(n)
+    iqr = np.percentile(s, 75) - np.percentile(s, 25)
+    return (mad, trimmed, winsorized, iqr)
+
+# Ragged groups, with outliers.
+samples = [[rng.gauss(10.0, 1.0) if rng.random() < 0.9 else
+            rng.expovariate(0.01) for i in range(rng.randint(1, 30))]
+           for g in range(300)]
+
+for trim in (0.0, 0.1, 0.25):
+    batch = robust_batch(samples, trim)
+
+    for (g, r) in enumerate(samples):
+        expected = robust_reference(r, trim)
+        actual = tuple(column[g] for column in batch)
+
+        check(all(close(e, a) for (e, a) in zip(expected, actual)),
+              "ERROR: robust_batch() is "+str(actual)+", expected "+\
+              str(expected)+" for "+str(r)+".")
+
+check(all(0 == len(x) for x in robust_batch([])),
+      "ERROR: robust_batch() of no groups is not empty.")
+
+# Reference outlier rejection of r.
+def reject_reference(r, method, threshold):
+    median = np.percentile(r, 50)
+    q1 = np.percentile(r, 25)
+    q3 = np.percentile(r, 75)
+    mad = np.percentile([abs(x - median) for x in r], 50)
+
+    if "mad" == method:
+        if 0 == mad:
+            return r
+        return [x for x in r if abs(x - median) <= mad or
+                                0.6745 * abs(x - median) <= threshold * mad]
+    else:
+        if q1 == q3:
+            return r
+        return [x for x in r if q1 - threshold * (q3 - q1) <= x <=
+                                q3 + threshold * (q3 - q1)]
+
+for (method, threshold) in (("mad", 3.5), ("mad", 0.1), ("iqr", 1.5),
+                            ("iqr", 0.0)):
+    # Packed output for ragged input, and padded output for padded input.
+    remaining = reject_outliers(samples, method, threshold).tolist()
+    padded = reject_outliers(pad_samples(samples), method, threshold)
+
+    for (g, r) in enumerate(samples):
+        expected = reject_reference(r, method, threshold)
+        actual = [x for x in padded[g] if not np.isnan(x)]
+
+        check(expected == actual and expected == remaining[g],
+              "ERROR: reject_outliers("+method+", "+str(threshold)+") is "+\
+              str((actual, remaining[g]))+", expected "+str(expected)+\
+              " for "+str(r)+".")
+
+        check(np.isnan(padded[g, len(actual):]).all(),
+              "ERROR: reject_outliers() did not pad at the end.")
+
+# The default thresholds.
+r = [1.0, 1.1, 0.9, 1.05, 0.95, 1.0, 50.0]
+for method in ("mad", "iqr"):
+    check([r[:-1]] == reject_outliers([r], method).tolist(),
+          "ERROR: reject_outliers("+method+") kept the outlier of "+\
+          str(r)+".")
+
+# Groups with no spread are left as they are.
+r = [1.0, 2.0, 2.0, 2.0, 9.0]
+check([r] == reject_outliers([r], "iqr").tolist(),
+      "ERROR: reject_outliers() rejected samples with no spread.")
+
+print "robust_batch: OK"
+
+###############################################################################
+# Percentiles and confidence intervals of the median
+
+samples = [[rng.expovariate(1.0) for i in range(rng.randint(1, 200))]
+           for g in range(300)]
+percentiles = [0, 1, 50, 90, 99, 99.9, 100]
+
+batch = percentiles_batch(samples, percentiles)
+
+for (g, r) in enumerate(samples):
+    for (x, p) in enumerate(percentiles):
+        check(close(np.percentile(r, p), batch[g, x]),
+              "ERROR: percentiles_batch() "+str(p)+" is "+str(batch[g, x])+\
+              ", expected "+str(np.percentile(r, p))+" for "+str(r)+".")
+
+check((0, 3) == percentiles_batch([], [50, 90, 99]).shape,
+      "ERROR: percentiles_batch() of no groups is not empty.")
+
+# 0-based ranks from tables of the binomial distribution.
+for (n, ranks) in ((1, (0, 0)), (5, (0, 4)), (6, (0, 5)), (10, (1, 8)),
+                   (20, (5, 14)), (100, (39, 60))):
+    check(ranks == median_interval_ranks(n),
+          "ERROR: median_interval_ranks("+str(n)+") is "+\
+          str(median_interval_ranks(n))+", expected "+str(ranks)+".")
+
+(lower, upper) = median_interval_batch(samples)
+
+for (g, r) in enumerate(samples):
+    (j, k) = median_interval_ranks(len(r))
+    s = sorted(r)
+
+    check(s[j] == lower[g] and s[k] == upper[g],
+          "ERROR: median_interval_batch() is "+str((lower[g], upper[g]))+\
+          ", expected "+str((s[j], s[k]))+" for "+str(r)+".")
+
+print "percentiles_batch: OK"
+
+###############################################################################
+# The tinv cache
+
+calls = []
+def square(x):
+    calls.append(x)
+    return x * x
+
+cache = lru_cache(square, 3)
+
+for x in (1, 2, 3, 1, 4, 2, 1):
+    check(x * x == cache(x), "ERROR: lru_cache returned the wrong result.")
+
+# 2 was evicted by 4, since 1 had been used again since it was cached.
+check([1, 2, 3, 4, 2] == calls, "ERROR: lru_cache called "+str(calls)+".")
+check((2, 5, 3) == (cache.hits, cache.misses, len(cache)),
+      "ERROR: lru_cache counted "+str((cache.hits, cache.misses))+".")
+
+# Round trip through a file, which keeps the order of use.
+(fd, name) = mkstemp()
+fdopen(fd, 'w').close()
+
+try:
+    cached_tinv.clear()
+    expected = [cached_tinv(p, df) for (p, df) in
+                ((0.05, 1500), (0.01, 7), (0.05, 2.5), (0, 3))]
+    cached_tinv.save(name)
+
+    cache = lru_cache(tinv, 3)
+    cache.load(name)
+
+    check([(0.01, 7), (0.05, 2.5), (0, 3)] == cache.cache.keys(),
+          "ERROR: lru_cache.load() kept "+str(cache.cache.keys())+".")
+    check(expected[1:] == [cache(0.01, 7), cache(0.05, 2.5), cache(0, 3)] and
+          (3, 0) == (cache.hits, cache.misses),
+          "ERROR: lru_cache.load() did not restore the results.")
+
+    f = open(name, "w")
+    f.write("0.05 x 1.0\n")
+    f.close()
+
+    try:
+        cache.load(name)
+        check(False, "ERROR: lru_cache.load() accepted an invalid file.")
+    except ValueError:
+        pass
+finally:
+    remove(name)
+
+print "lru_cache: OK"
+
+###############################################################################
+# The array special functions must agree exactly with the scalar ones
+
+# Both sides of every branch of logGamma().
+x = [1e-20, 2.2e-16, 0.3, 0.5, 0.6, 0.6796875, 1.0, 1.5, 2.5, 4.0, 7.0, 12.0,
+     12.5, 1e3, 1e40, -1.0, 3e305] + \
+    [10 ** rng.uniform(-3, 6) for i in range(500)]
+
+actual = logGammaArray(x)
+for (i, y) in enumerate(x):
+    check(logGamma(y) == actual[i],
+          "ERROR: logGammaArray("+repr(y)+") is "+repr(actual[i])+\
+          ", expected "+repr(logGamma(y))+".")
+
+check((2, 3) == logGammaArray(np.ones((2, 3))).shape,
+      "ERROR: logGammaArray() changed the shape.")
+
+# Both sides of the mean, and the ends of [0, 1].
+arguments = [(0.0, 2.0, 3.0), (1.0, 2.0, 3.0), (0.5, 0.5, 0.5),
+             (0.999, 1000.0, 0.5)] + \
+            [(rng.random(), 10 ** rng.uniform(-1, 3), 10 ** rng.uniform(-1, 3))
+             for i in range(500)]
+
+actual = incompleteBetaArray(*zip(*arguments))
+for (i, (y, p, q)) in enumerate(arguments):
+    check(incompleteBeta(y, p, q) == actual[i],
+          "ERROR: incompleteBetaArray"+str((y, p, q))+" is "+\
+          repr(actual[i])+", expected "+repr(incompleteBeta(y, p, q))+".")
+
+# Broadcasting a single degree of freedom.
+for df in (0.5, 1, 3, 29.5, 1000):
+    X = [0.0, -1e3, 1e3] + [rng.uniform(-20, 20) for i in range(100)]
+    actual = StudentTCDFArray(df, X)
+
+    for (i, y) in enumerate(X):
+        check(StudentTCDF(df, y) == actual[i],
+              "ERROR: StudentTCDFArray("+str(df)+", "+repr(y)+") is "+\
+              repr(actual[i])+", expected "+repr(StudentTCDF(df, y))+".")
+
+check(0 == len(StudentTCDFArray([], [])),
+      "ERROR: StudentTCDFArray() of nothing is not empty.")
+
+print "StudentTCDFArray: OK"
+
+###############################################################################
+# Significance tests
+
+# Reference Welch's t-test of x and y.
+def welch_reference(x, y):
+    (m1, m2) = (sum(x) / float(len(x)), sum(y) / float(len(y)))
+    v1 = sum((a - m1) ** 2 for a in x) / (len(x) - 1) / len(x)
+    v2 = sum((a - m2) ** 2 for a in y) / (len(y) - 1) / len(y)
+    t = (m1 - m2) / math.sqrt(v1 + v2)
+    df = (v1 + v2) ** 2 / (v1 ** 2 / (len(x) - 1) + v2 ** 2 / (len(y) - 1))
+    return (t, df, 2 * StudentTCDF(df, -abs(t)))
+
+# Reference Mann-Whitney U test of x and y, with average ranks for ties.
+def mann_whitney_reference(x, y):
+    values = sorted(x + y)
+    rank = {}
+    for v in set(values):
+        positions = [i + 1 for (i, w) in enumerate(values) if w == v]
+        rank[v] = sum(positions) / float(len(positions))
+
+    u = sum(rank[v] for v in x) - len(x) * (len(x) + 1) / 2.0
+
+    n = len(values)
+    ties = sum(values.count(v) ** 3 - values.count(v) for v in set(values))
+    sigma = math.sqrt(len(x) * len(y) / 12.0 *
+                      ((n + 1) - ties / float(n * (n - 1))))
+    z = (abs(u - len(x) * len(y) / 2.0) - 0.5) / sigma
+    return (u, min(1.0, math.erfc(z / math.sqrt(2))))
+
+# Rounded values have ties.
+xs = [[round(rng.gauss(0.0, 1.0), 1) for i in range(rng.randint(2, 30))]
+      for g in range(200)]
+ys = [[round(rng.gauss(0.3, 2.0), 1) for i in range(rng.randint(2, 30))]
+      for g in range(200)]
+
+moments = []
+for samples in (xs, ys):
+    (average, median, stdev) = stats_batch(samples)[:3]
+    moments.extend([average, stdev * stdev, [len(r) for r in samples]])
+
+(t, df, p) = welch_batch(*moments)
+(u, mann_whitney_p) = mann_whitney_batch(pad_samples(xs), pad_samples(ys))
+
+for (g, (x, y)) in enumerate(zip(xs, ys)):
+    expected = welch_reference(x, y)
+    check(all(close(e, a, 1e-8) for (e, a) in zip(expected,
+                                                   (t[g], df[g], p[g]))),
+          "ERROR: welch_batch() is "+str((t[g], df[g], p[g]))+\
+          ", expected "+str(expected)+" for "+str((x, y))+".")
+
+    expected = mann_whitney_reference(x, y)
+    check(close(expected[0], u[g]) and close(expected[1], mann_whitney_p[g]),
+          "ERROR: mann_whitney_batch() is "+str((u[g], mann_whitney_p[g]))+\
+          ", expected "+str(expected)+" for "+str((x, y))+".")
+
+# Undefined tests: too few samples, a missing sequence, no variation at all.
+(t, df, p) = welch_batch([1.0, np.nan, 2.0, 2.0], [1.0, 1.0, 0.0, 0.0],
+                         [1, 3, 3, 3], [2.0, 2.0, 2.0, 3.0],
+                         [1.0, 1.0, 0.0, 0.0], [3, 3, 3, 3])
+check(np.isnan(p[:3]).all() and np.isinf(t[3]) and 0.0 == p[3],
+      "ERROR: welch_batch() of undefined tests is "+str((t, df, p))+".")
+
+(u, p) = mann_whitney_batch([[1.0, np.nan], [np.nan, np.nan]],
+                            [[1.0, 1.0], [1.0, 2.0]])
+check(np.isnan(p).all() and np.isnan(u[1]),
+      "ERROR: mann_whitney_batch() of undefined tests is "+str((u, p))+".")
+
+print "welch_batch: OK"